@@ -0,0 +1,164 @@
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+
+from configurations import BENCHMARK_CORPUS_SIZE, BENCHMARK_WORD_COUNT, BENCHMARK_UTTERANCE_LENGTH, \
+    BENCHMARK_LEXICON_SIZE, BENCHMARK_STATES_COUNT, BENCHMARK_REPEAT, INITIAL_STATE, FINAL_STATE
+from encoding import encode_lexicon, decode_lexicon, encode_data_by_grammar, decode_data, \
+    get_encoded_lexicon_length, get_encoded_syntactic_component_length, get_encoded_data_by_grammar_length, \
+    get_encoded_data_by_grammar_length_by_results, get_symbol_length
+from new_viterbi import HMM, Lexicon, viterbi, get_lexical_prefixes
+
+CONSONANTS = 'bdgklprt'
+VOWELS = 'aiou'
+SYLLABLES_PER_WORD = 3
+
+
+# Returns word_count distinct pabiku style words, each made of syllables_per_word consonant-vowel syllables.
+def generate_words(random_, word_count, syllables_per_word=SYLLABLES_PER_WORD):
+    if word_count > (len(CONSONANTS) * len(VOWELS)) ** syllables_per_word:
+        raise ValueError("there are not enough distinct words of {} syllables".format(syllables_per_word))
+    words = {}  # used as an ordered set
+    while len(words) < word_count:
+        words[''.join(random_.choice(CONSONANTS) + random_.choice(VOWELS) for _ in range(syllables_per_word))] = None
+    return list(words)
+
+
+# Returns (words, data): corpus_size data, each a concatenation of utterance_length words drawn from word_count
+# generated words. The same seed gives the same corpus.
+def generate_corpus(corpus_size=BENCHMARK_CORPUS_SIZE, word_count=BENCHMARK_WORD_COUNT,
+                    utterance_length=BENCHMARK_UTTERANCE_LENGTH, seed=0):
+    random_ = random.Random(seed)
+    words = generate_words(random_, word_count)
+    data = [''.join(random_.choice(words) for _ in range(utterance_length)) for _ in range(corpus_size)]
+    return words, data
+
+
+# Returns (hmm, lexicon) of a hypothesis that parses the data of the words. The lexicon has lexicon_size entries:
+# the words, then the shorter syllable prefixes of the words (which give the decoder partial matches to rule out),
+# then other generated words. The entries are dealt to states_count inner states, and every inner state may follow
+# every other one, so every concatenation of the words can be parsed.
+def generate_hypothesis(words, lexicon_size=BENCHMARK_LEXICON_SIZE, states_count=BENCHMARK_STATES_COUNT, seed=0):
+    if lexicon_size < len(words):
+        raise ValueError("the lexicon is smaller than the number of words")
+    random_ = random.Random(seed)
+    entries = dict.fromkeys(words)  # used as an ordered set
+    prefixes = [word[:end] for word in words for end in range(2, len(word), 2)]
+    for prefix in prefixes:
+        if len(entries) == lexicon_size:
+            break
+        entries[prefix] = None
+    while len(entries) < lexicon_size:
+        entries[generate_words(random_, 1)[0]] = None
+    entries = list(entries)
+
+    inner_states = ['q{}'.format(i + 1) for i in range(states_count)]
+    hmm_dict = {INITIAL_STATE: list(inner_states)}
+    for i, state in enumerate(inner_states):
+        hmm_dict[state] = (inner_states + [FINAL_STATE], entries[i::states_count])
+    return HMM(hmm_dict), Lexicon(entries)
+
+
+# Returns the fastest time, in seconds, of repeat calls of function.
+def time_function(function, repeat=BENCHMARK_REPEAT):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+# Returns the peak memory, in bytes, that was allocated by a call of function (as traced by tracemalloc).
+def get_peak_memory(function):
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        function()
+        return tracemalloc.get_traced_memory()[1] - start_memory
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+# Times the decoding, the encodings lengths, and the encoding and decoding of a synthetic corpus and hypothesis.
+# Returns a dictionary (that can be written as JSON) with the parameters, the corpus sizes, and for every benchmark
+# its time in seconds and peak memory in bytes, and the throughput of the benchmarks that go over the data.
+def run_benchmarks(corpus_size=BENCHMARK_CORPUS_SIZE, word_count=BENCHMARK_WORD_COUNT,
+                   utterance_length=BENCHMARK_UTTERANCE_LENGTH, lexicon_size=BENCHMARK_LEXICON_SIZE,
+                   states_count=BENCHMARK_STATES_COUNT, seed=0, repeat=BENCHMARK_REPEAT):
+    words, data = generate_corpus(corpus_size, word_count, utterance_length, seed)
+    hmm, lexicon = generate_hypothesis(words, lexicon_size, states_count, seed)
+    entries = lexicon.entries.get_entries()
+    alphabet = sorted(set(''.join(entries)))
+    alphabet_symbol_length = get_symbol_length(alphabet + ['#'])
+    words_symbol_length = get_symbol_length(entries)   # as in hypothesis_search
+    viterbi_results = [viterbi(hmm, lexicon, datum) for datum in data]
+    encoded_lexicon = encode_lexicon(alphabet, entries)
+    encoded_data = encode_data_by_grammar(hmm, lexicon, data, viterbi)
+
+    benchmarks = [  # (name, function, whether it goes over the data)
+        ('viterbi', lambda: [viterbi(hmm, lexicon, datum) for datum in data], True),
+        ('get_lexical_prefixes',
+         lambda: [get_lexical_prefixes(lexicon, datum, range(len(datum))) for datum in data], True),
+        ('get_encoded_lexicon_length',
+         lambda: get_encoded_lexicon_length(alphabet_symbol_length, entries), False),
+        ('get_encoded_syntactic_component_length',
+         lambda: get_encoded_syntactic_component_length(hmm, hmm.get_states(), words_symbol_length), False),
+        ('get_encoded_data_by_grammar_length',
+         lambda: get_encoded_data_by_grammar_length(hmm, lexicon, data, viterbi), True),
+        ('get_encoded_data_by_grammar_length_by_results',
+         lambda: get_encoded_data_by_grammar_length_by_results(hmm, viterbi_results), True),
+        ('encode_lexicon', lambda: encode_lexicon(alphabet, entries), False),
+        ('decode_lexicon', lambda: decode_lexicon(encoded_lexicon, alphabet), False),
+        ('encode_data_by_grammar', lambda: encode_data_by_grammar(hmm, lexicon, data, viterbi), True),
+        ('decode_data', lambda: decode_data(hmm, encoded_data), True),
+    ]
+
+    characters_count = sum(len(datum) for datum in data)
+    results = {}
+    for name, function, over_data in benchmarks:
+        seconds = time_function(function, repeat)
+        results[name] = {'seconds': seconds, 'peak_memory_bytes': get_peak_memory(function)}
+        if over_data:
+            results[name]['utterances_per_second'] = len(data) / seconds if seconds else float('inf')
+            results[name]['characters_per_second'] = characters_count / seconds if seconds else float('inf')
+
+    return {'parameters': {'corpus_size': corpus_size, 'word_count': word_count,
+                           'utterance_length': utterance_length, 'lexicon_size': lexicon_size,
+                           'states_count': states_count, 'seed': seed, 'repeat': repeat},
+            'corpus': {'utterances': len(data), 'characters': characters_count,
+                       'unparsable': viterbi_results.count(None)},
+            'benchmarks': results}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark decoding and MDL scoring on a synthetic corpus.")
+    parser.add_argument('--corpus-size', type=int, default=BENCHMARK_CORPUS_SIZE)
+    parser.add_argument('--word-count', type=int, default=BENCHMARK_WORD_COUNT)
+    parser.add_argument('--utterance-length', type=int, default=BENCHMARK_UTTERANCE_LENGTH)
+    parser.add_argument('--lexicon-size', type=int, default=BENCHMARK_LEXICON_SIZE)
+    parser.add_argument('--states-count', type=int, default=BENCHMARK_STATES_COUNT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--output', help="the JSON file to write the results to (standard output by default)")
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(arguments.corpus_size, arguments.word_count, arguments.utterance_length,
+                             arguments.lexicon_size, arguments.states_count, arguments.seed, arguments.repeat)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
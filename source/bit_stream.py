@@ -0,0 +1,137 @@
+
+
+# Encoded bits packed 8 to a byte (the last byte is padded with zeros). length is the number of real bits, so
+# len() of packed bits is the same as the len() of the matching '0'/'1' string, and str() gives that string.
+class PackedBits:
+    __slots__ = ('data', 'length')
+
+    def __init__(self, data, length):
+        self.data = data
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.to_bit_string()
+
+    def __eq__(self, other):
+        return isinstance(other, PackedBits) and self.data == other.data and self.length == other.length
+
+    def to_bit_string(self):
+        if not self.length:
+            return ''
+        return bin(int.from_bytes(self.data, 'big'))[2:].zfill(len(self.data) * 8)[:self.length]
+
+    @staticmethod
+    def from_bit_string(bit_string):
+        bit_writer = BitWriter()
+        if bit_string:
+            bit_writer.write(int(bit_string, 2), len(bit_string))
+        return bit_writer.getvalue()
+
+
+# Writes fixed width symbols (most significant bit first) into a bytearray.
+class BitWriter:
+    def __init__(self):
+        self._bytes = bytearray()
+        self._pending = 0   # the bits that do not fill a byte yet
+        self._pending_length = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def write(self, value, width):
+        self._pending = (self._pending << width) | value
+        self._pending_length += width
+        self.length += width
+        while self._pending_length >= 8:
+            self._pending_length -= 8
+            self._bytes.append((self._pending >> self._pending_length) & 0xFF)
+        self._pending &= (1 << self._pending_length) - 1
+
+    def getvalue(self):
+        data = bytes(self._bytes)
+        if self._pending_length:
+            data += bytes([self._pending << (8 - self._pending_length)])
+        return PackedBits(data, self.length)
+
+
+# Reads fixed width symbols with a cursor over packed bits, a bytes like object (e.g. a memoryview), or a binary
+# file, which is read in chunks of chunk_size bytes so that only a chunk is held in memory at a time.
+# A '0'/'1' string is accepted too, for compatibility.
+# length is the number of bits to read (by default, all the bits of the source).
+class BitReader:
+    def __init__(self, source, length=None, chunk_size=2**16):
+        if isinstance(source, str):
+            source = PackedBits.from_bit_string(source)
+        if isinstance(source, PackedBits):
+            source, length = source.data, source.length
+
+        if hasattr(source, 'read'):
+            self._file = source
+            self.data = b''
+        else:
+            self._file = None
+            self.data = memoryview(source).cast('B')
+            if length is None:
+                length = len(self.data) * 8
+        self.length = length
+        self.chunk_size = chunk_size
+        self.position = 0
+        self._data_start = 0    # the position of the first bit of data
+
+    # Reads from the file until the data covers end_position (or the file ends), dropping the bytes already read.
+    def _fill(self, end_position):
+        while self._file is not None and self._get_available_length() < end_position:
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                self._file = None
+                break
+            consumed_bytes = (self.position - self._data_start) >> 3
+            self.data = bytes(self.data[consumed_bytes:]) + chunk
+            self._data_start += consumed_bytes * 8
+
+    def _get_available_length(self):
+        return self._data_start + len(self.data) * 8
+
+    def at_end(self):
+        if self.length is not None:
+            return self.position >= self.length
+        self._fill(self.position + 1)
+        return self._get_available_length() <= self.position
+
+    def read(self, width):
+        if not width:
+            return 0
+        end_position = self.position + width
+        self._fill(end_position)
+        if end_position > (self._get_available_length() if self.length is None else self.length):
+            raise EOFError("reading beyond the end of the bits")
+
+        first_byte = (self.position - self._data_start) >> 3
+        last_byte = (end_position - self._data_start + 7) >> 3
+        chunk = int.from_bytes(self.data[first_byte:last_byte], 'big')
+        self.position = end_position
+        return (chunk >> ((last_byte * 8 + self._data_start) - end_position)) & ((1 << width) - 1)
+
+    # Reads 0*1 and returns the number of zeros.
+    def read_unary(self):
+        zeros_count = 0
+        while not self.read(1):
+            zeros_count += 1
+        return zeros_count
+
+
+# Packed bits are archived in a binary file as their length in bits (8 bytes, big endian) followed by their bytes,
+# so that the padding of the last byte is not taken for data.
+def dump_packed_bits(packed_bits, file):
+    file.write(packed_bits.length.to_bytes(8, 'big'))
+    file.write(packed_bits.data)
+
+
+# Returns a BitReader that streams the packed bits archived in the file by dump_packed_bits.
+def load_bit_reader(file, chunk_size=2**16):
+    length = int.from_bytes(file.read(8), 'big')
+    return BitReader(file, length, chunk_size)
@@ -6,3 +6,25 @@ NULL_SEGMENT = '-'
 
 INITIAL_STATE = 'q0'
 FINAL_STATE = 'qf'
+
+VITERBI_BATCH_SIZE = 256  # the number of data decoded together by viterbi_batch
+VITERBI_BATCH_MAX_CELLS = 2**22  # the number of trellis cells (data x positions x states) of a batch of viterbi_batch
+DATA_BY_GRAMMAR_WORKERS = None  # the number of processes that compute the data by grammar length (None for all cores)
+DATA_BY_GRAMMAR_CHUNK_SIZE = 64  # the number of data sent to a process at a time
+VITERBI_CACHE_MAX_BYTES = 256 * 2**20  # the memory limit of a ViterbiCache
+INCREMENTAL_DECODING_GRAM_LENGTH = 3  # the length of the substrings by which IncrementalDecoder indexes the data
+VITERBI_BEAM_SIZE = None  # the number of cells of a data position that viterbi extends (None for all)
+VITERBI_BEAM_WIDTH = None  # viterbi extends only cells within this log probability of the best one (None for all)
+SEARCH_CHAINS = 4  # the number of annealing chains, each at its own temperature
+SEARCH_WORKERS = None  # the number of processes that run the chains (None for all cores)
+SEARCH_ROUNDS = 100  # the number of times the chains swap states and share the best hypothesis
+SEARCH_STEPS_PER_ROUND = 20  # the number of neighbours every chain proposes between rounds
+SEARCH_MIN_TEMPERATURE = 1.0  # the temperature of the coldest chain (in bits)
+SEARCH_MAX_TEMPERATURE = 100.0  # the temperature of the hottest chain
+SEARCH_NEIGHBORS_PER_STEP = 1  # the number of neighbours a chain proposes and scores together at every step
+BENCHMARK_CORPUS_SIZE = 1000  # the number of data in a synthetic benchmark corpus
+BENCHMARK_WORD_COUNT = 4  # the number of words the synthetic data is made of
+BENCHMARK_UTTERANCE_LENGTH = 6  # the number of words in every synthetic datum
+BENCHMARK_LEXICON_SIZE = 8  # the number of lexicon entries (the words, and entries that only some words start with)
+BENCHMARK_STATES_COUNT = 1  # the number of inner states of the benchmark HMM
+BENCHMARK_REPEAT = 3  # the number of times every benchmark is timed (the fastest time is kept)
@@ -0,0 +1,102 @@
+import json
+import os
+
+from lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+
+SYMBOL_IDS_FILE_NAME = 'symbol_ids.npy'
+OFFSETS_FILE_NAME = 'offsets.npy'
+ALPHABET_FILE_NAME = 'alphabet.json'
+
+
+# A corpus of unsegmented data stored on disk as one concatenated array of symbol ids, and an array of the offsets
+# where every datum starts (with the total length at the end). The arrays are opened with numpy.memmap, so
+# processes that load the same corpus share it through the page cache, and the data are zero-copy views into it.
+# Slicing a corpus gives a corpus over the same arrays, which is pickled as its path and range only.
+class Corpus:
+    def __init__(self, path, first=0, last=None):
+        self.path = path
+        self.symbol_ids = np.load(os.path.join(path, SYMBOL_IDS_FILE_NAME), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE_NAME), mmap_mode='r')
+        with open(os.path.join(path, ALPHABET_FILE_NAME)) as alphabet_file:
+            self.alphabet = json.load(alphabet_file)
+        self.first = first
+        self.last = len(self.offsets) - 1 if last is None else last
+
+    # Writes the data (a list of strings) as a corpus at path (a directory), and returns it.
+    @staticmethod
+    def save(path, data):
+        alphabet = sorted(set().union(*data))
+        symbol_ids = {symbol: symbol_id for (symbol_id, symbol) in enumerate(alphabet)}
+        offsets = np.zeros(len(data) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(datum) for datum in data])
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, SYMBOL_IDS_FILE_NAME),
+                np.fromiter((symbol_ids[symbol] for datum in data for symbol in datum), dtype=np.uint16,
+                            count=offsets[-1]))
+        np.save(os.path.join(path, OFFSETS_FILE_NAME), offsets)
+        with open(os.path.join(path, ALPHABET_FILE_NAME), 'w') as alphabet_file:
+            json.dump(alphabet, alphabet_file)
+        return Corpus(path)
+
+    def __len__(self):
+        return self.last - self.first
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, last, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("a corpus can only be sliced with a step of 1")
+            return Corpus(self.path, self.first + first, self.first + max(first, last))
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("corpus index out of range")
+        start, end = self.offsets[self.first + index], self.offsets[self.first + index + 1]
+        return CorpusDatum(self.symbol_ids[start:end], self.alphabet)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getstate__(self):
+        return {'path': self.path, 'first': self.first, 'last': self.last}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['first'], state['last'])
+
+
+# A datum of a corpus: a view of its symbol ids, that is converted to a string only when it is needed
+# (e.g. for the lexicon lookup during decoding).
+# Data are equal by value (their symbols), so a datum can key a cache (see ViterbiCache), and a string is in a datum
+# if it is a substring of it, as with the data as strings.
+class CorpusDatum:
+    __slots__ = ('symbol_ids', 'alphabet')
+
+    def __init__(self, symbol_ids, alphabet):
+        self.symbol_ids = symbol_ids
+        self.alphabet = alphabet
+
+    def __len__(self):
+        return len(self.symbol_ids)
+
+    def __getitem__(self, position):
+        return self.alphabet[self.symbol_ids[position]]
+
+    def __str__(self):
+        return ''.join([self.alphabet[symbol_id] for symbol_id in self.symbol_ids.tolist()])
+
+    def __contains__(self, string):
+        return string in str(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, CorpusDatum):
+            return NotImplemented
+        return self.alphabet == other.alphabet and np.array_equal(self.symbol_ids, other.symbol_ids)
+
+    def __hash__(self):
+        return hash(self.symbol_ids.tobytes())
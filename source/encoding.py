@@ -1,49 +1,12 @@
 from collections import OrderedDict
-from math import log2, ceil
-from io import StringIO
+from math import log, log2, ceil
 from copy import copy
+from concurrent.futures import ProcessPoolExecutor
 
 
-from unittest.mock import MagicMock
-
-
-class SyntacticComponent():
-    pass
-
-
-alphabet_list = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'k', 'l', 'm', 'n', 'o', 'p', 'r', 's', 't', 'u', 'y']
-words_list = ['a', 'adore', 'all', 'beautiful', 'big', 'bit', 'chases', 'dog', 'handsome', 'like', 'mouse', 'nice', 'professor', 'some', 'student', 'taught', 'the', 'thin', 'thoughtful', 'ugly']
-states_list = ["q0", "q1", "q2", "q3", "q4", "qf"]
-
-mock_transition_dict = {'q0': ['q2'], 'q1': ['qf'], 'q2': ['q1', 'q4'], 'q3': ['q2'], 'q4': ['q1'], 'qf': []}
-transition_dict_no_nulls = {'q0': ['q2'], 'q1': ['qf'], 'q2': ['q1', 'q4'], 'q3': ['q2'], 'q4': ['q1']}
-
-mock_emission_dict = {'q0': [],
-                      'q1': ['dog', 'mouse', 'professor', 'student'],
-                      'q2': ['a', 'all', 'some', 'the'],
-                      'q3': ['adore', 'bit', 'chases', 'like', 'taught'],
-                      'q4': ['beautiful', 'big', 'handsome', 'nice', 'thin', 'thoughtful', 'ugly'],
-                      'qf': []}
-
-emission_dict_no_nulls = {'q1': ['dog', 'mouse', 'professor', 'student'],
-                          'q2': ['a', 'all', 'some', 'the'],
-                          'q3': ['adore', 'bit', 'chases', 'like', 'taught'],
-                          'q4': ['beautiful', 'big', 'handsome', 'nice', 'thin', 'thoughtful', 'ugly']}
-
-
-
-def mock_transition(arg):
-    return mock_transition_dict.get(arg, [])
-
-
-def mock_emission(arg):
-    return mock_emission_dict.get(arg, [])
-
-syntactic_component = SyntacticComponent()
-
-syntactic_component.get_outgoing_states = MagicMock(side_effect=mock_transition)
-
-syntactic_component.get_emissions = MagicMock(side_effect=mock_emission)
+from bit_stream import BitWriter, BitReader
+from configurations import DATA_BY_GRAMMAR_WORKERS, DATA_BY_GRAMMAR_CHUNK_SIZE, INITIAL_STATE, FINAL_STATE
+from instrumentation import get_instrumentation
 
 
 def get_binary_by_item(list_, item):
@@ -58,7 +21,16 @@ def get_binary_by_item(list_, item):
 def get_item_by_binary(list_, binary):
     return list_[int(binary, 2)]
 
-big_list = [str(x) for x in range(20)]
+
+# The packed counterparts of get_binary_by_item and get_item_by_binary.
+def write_item(bit_writer, list_, item):
+    if not list_:
+        raise ValueError("list is Empty")
+    bit_writer.write(list_.index(item), get_symbol_length(list_))
+
+
+def read_item(bit_reader, list_):
+    return list_[bit_reader.read(get_symbol_length(list_))]
 
 
 def get_binary_enumeration(list_):
@@ -73,62 +45,56 @@ def get_binary_enumeration(list_):
 
 
 def get_symbol_length(list_):
-    return ceil(log2(len(list_)))
-
-
-def get_binary_string(number, log_length):
-    return str(bin(number))[2:].zfill(log_length)
+    return get_symbol_length_by_count(len(list_))
 
-assert get_binary_by_item(big_list, '13') == "01101"
-assert get_item_by_binary(big_list, "01101") == '13'
 
-alphabet_enumeration, alphabet_symbol_length = get_binary_enumeration(alphabet_list)
-inverse_alphabet_enumeration = {v: k for k, v in alphabet_enumeration.items()}
-assert alphabet_enumeration["a"] == "00001"
-assert alphabet_enumeration["y"] == "10100"
-assert inverse_alphabet_enumeration["00000"] == "#"
+# An empty list has no symbols to tell apart, as a list of one (e.g. a lexicon whose last entry was removed).
+def get_symbol_length_by_count(count):
+    return ceil(log2(count)) if count > 0 else 0
 
 
-states_enumeration, states_symbol_length = get_binary_enumeration(states_list)
-inverse_states_enumeration = {v: k for k, v in states_enumeration.items()}
-assert states_enumeration["q0"] == "001"
-assert states_enumeration["qf"] == "110"
-assert inverse_states_enumeration["000"] == "#"
-
-words_enumeration, words_symbol_length = get_binary_enumeration(words_list)
-inverse_words_enumeration = {v: k for k, v in words_enumeration.items()}
+def get_binary_string(number, log_length):
+    return str(bin(number))[2:].zfill(log_length)
 
 
 
 ##### Lexicon #####
 
+# The encodings are packed bits (see bit_stream.PackedBits), and str() of them gives the '0'/'1' form.
 def encode_lexicon(alphabet_list, words_list):    # with 0*1 prefix, ## ending
-    str_io = StringIO()
+    bit_writer = BitWriter()
     alphabet_enumeration, alphabet_symbol_length = get_binary_enumeration(alphabet_list)
-    print('0'*alphabet_symbol_length + '1', end="", file=str_io)
+    alphabet_ids = {char: i for (i, char) in enumerate(alphabet_enumeration)}
+    bit_writer.write(1, alphabet_symbol_length + 1)
     for word in words_list:
         for char in word:
-            print(alphabet_enumeration[char], end="", file=str_io)
-        print(alphabet_enumeration["#"], end="", file=str_io)
-    print(alphabet_enumeration["#"], end="", file=str_io)
-    return str_io.getvalue()
-
-
-def decode_lexicon(encoded_lexicon_string):
-    first_one_index = encoded_lexicon_string.index('1')
-    number_of_repr_bits = first_one_index
-    encoded_lexicon_string = encoded_lexicon_string[first_one_index+1:]
-
-    lexicon_string = ''
-    i = 0
+            bit_writer.write(alphabet_ids[char], alphabet_symbol_length)
+        bit_writer.write(alphabet_ids["#"], alphabet_symbol_length)
+    bit_writer.write(alphabet_ids["#"], alphabet_symbol_length)
+    return bit_writer.getvalue()
+
+
+# alphabet_list is the alphabet that the lexicon was encoded by.
+def decode_lexicon(encoded_lexicon, alphabet_list):
+    bit_reader = BitReader(encoded_lexicon)
+    number_of_repr_bits = bit_reader.read_unary()
+    alphabet = list(get_binary_enumeration(alphabet_list)[0])
+    delimiter_id = alphabet.index("#")
+
+    words_list = []
+    word_chars = []
+    previous_char_id = None
     while True:
-        bits = encoded_lexicon_string[i:i+number_of_repr_bits]
-        i += number_of_repr_bits
-        lexicon_string += inverse_alphabet_enumeration[bits]
-        if lexicon_string.endswith("##"):
+        char_id = bit_reader.read(number_of_repr_bits)
+        if char_id != delimiter_id:
+            word_chars.append(alphabet[char_id])
+        elif previous_char_id == delimiter_id:    # "##" ends the lexicon
             break
+        else:
+            words_list.append(''.join(word_chars))
+            word_chars = []
+        previous_char_id = char_id
 
-    words_list = lexicon_string[:-2].split('#')
     return words_list
 
 
@@ -139,27 +105,40 @@ def get_encoded_lexicon_length(alphabet_symbol_length, words_list):
     encoding_length = delimiter_usage + words_usage + num_bits
     return encoding_length
 
-encoded_lexicon_string = encode_lexicon(alphabet_list, words_list)
-encode_lexicon_length = get_encoded_lexicon_length(alphabet_symbol_length, words_list)
+##### Syntactic Component #####
 
 
-assert encode_lexicon_length == 616
-assert len(encoded_lexicon_string) == encode_lexicon_length
-assert decode_lexicon(encoded_lexicon_string) == words_list
 
-##### Syntactic Component #####
 
+# HMMs are read through their compiled tables (see new_viterbi.CompiledHMM), other syntactic components through
+# their methods.
+def get_compiled_syntactic_component(syntactic_component):
+    from new_viterbi import HMM
 
+    return syntactic_component.get_compiled() if isinstance(syntactic_component, HMM) else None
 
 
 def get_encoded_syntactic_component_length(syntactic_component, states_list, words_symbol_length):
+    with get_instrumentation().phase('cost_computation'):
+        return _get_encoded_syntactic_component_length(syntactic_component, states_list, words_symbol_length)
+
+
+def _get_encoded_syntactic_component_length(syntactic_component, states_list, words_symbol_length):
     states_symbol_length = get_symbol_length(states_list)
     state_symbols_in_transitions = 0
     num_of_emissions = 0
-    for state in states_list:
-        if len(syntactic_component.get_outgoing_states(state)) > 0:
-            state_symbols_in_transitions += len(syntactic_component.get_outgoing_states(state)) + 1  # +1 indicate the origin state
-            num_of_emissions += len(syntactic_component.get_emissions(state))
+    compiled_syntactic_component = get_compiled_syntactic_component(syntactic_component)
+    if compiled_syntactic_component is not None:
+        state_ids = [compiled_syntactic_component.state_ids[state] for state in states_list]
+        transition_counts = compiled_syntactic_component.transition_counts[state_ids]
+        emission_counts = compiled_syntactic_component.emission_counts[state_ids]
+        state_symbols_in_transitions = int((transition_counts[transition_counts > 0] + 1).sum())  # +1 indicate the origin state
+        num_of_emissions = int(emission_counts[transition_counts > 0].sum())
+    else:
+        for state in states_list:
+            if len(syntactic_component.get_outgoing_states(state)) > 0:
+                state_symbols_in_transitions += len(syntactic_component.get_outgoing_states(state)) + 1  # +1 indicate the origin state
+                num_of_emissions += len(syntactic_component.get_emissions(state))
 
     content_usage = (state_symbols_in_transitions * states_symbol_length) + (num_of_emissions * words_symbol_length)
     delimiter_usage = (len(states_list) * words_symbol_length) + ((len(states_list) + 1) * states_symbol_length)
@@ -171,26 +150,102 @@ def get_encoded_syntactic_component_length(syntactic_component, states_list, wor
 
 
 
-encoded_syntactic_component_length = get_encoded_syntactic_component_length(syntactic_component, states_list, words_symbol_length)
-
-assert encoded_syntactic_component_length == 188
+##### Running lengths #####
+
+# Keeps the counts that the lexicon and syntactic component lengths are made of, so that the lengths of a
+# neighbour hypothesis are updated in O(1) per added or removed entry, transition or emission, instead of
+# walking the whole grammar. The symbol lengths are derived from the counts only when a length is asked for,
+# so lists that cross a power of two are handled as well.
+class EncodingLengthTracker:
+    def __init__(self, alphabet_symbol_length, words_list, syntactic_component, states_list):
+        self.alphabet_symbol_length = alphabet_symbol_length
+        self.words_count = 0
+        self.words_characters_count = 0
+        for word in words_list:
+            self.add_entry(word)
+
+        self.states_count = len(states_list)
+        self.transitions_counts = {}
+        self.emissions_counts = {}
+        self.state_symbols_in_transitions = 0
+        self.num_of_emissions = 0
+        for state in states_list:
+            self.set_state_counts(state, len(syntactic_component.get_outgoing_states(state)),
+                                  len(syntactic_component.get_emissions(state)))
+
+    def add_entry(self, word):
+        self.words_count += 1
+        self.words_characters_count += len(word)
+
+    def remove_entry(self, word):
+        self.words_count -= 1
+        self.words_characters_count -= len(word)
+
+    def add_state(self, state):
+        self.states_count += 1
+        self.set_state_counts(state, 0, 0)
+
+    def remove_state(self, state):
+        self.set_state_counts(state, 0, 0)
+        self.states_count -= 1
+
+    def add_transition(self, state):
+        self.set_state_counts(state, self.transitions_counts[state] + 1, self.emissions_counts[state])
+
+    def remove_transition(self, state):
+        self.set_state_counts(state, self.transitions_counts[state] - 1, self.emissions_counts[state])
+
+    def add_emission(self, state):
+        self.set_state_counts(state, self.transitions_counts[state], self.emissions_counts[state] + 1)
+
+    def remove_emission(self, state):
+        self.set_state_counts(state, self.transitions_counts[state], self.emissions_counts[state] - 1)
+
+    # Only states with outgoing transitions are encoded (see get_encoded_syntactic_component_length).
+    def set_state_counts(self, state, transitions_count, emissions_count):
+        if self.transitions_counts.get(state, 0) > 0:
+            self.state_symbols_in_transitions -= self.transitions_counts[state] + 1
+            self.num_of_emissions -= self.emissions_counts[state]
+
+        self.transitions_counts[state] = transitions_count
+        self.emissions_counts[state] = emissions_count
+
+        if transitions_count > 0:
+            self.state_symbols_in_transitions += transitions_count + 1  # +1 indicate the origin state
+            self.num_of_emissions += emissions_count
+
+    def get_lexicon_length(self):
+        delimiter_usage = (self.words_count + 1) * self.alphabet_symbol_length
+        words_usage = self.words_characters_count * self.alphabet_symbol_length
+        num_bits = self.alphabet_symbol_length + 1
+        return delimiter_usage + words_usage + num_bits
+
+    # words_symbol_length is by default the symbol length of the lexicon entries.
+    def get_syntactic_component_length(self, words_symbol_length=None):
+        if words_symbol_length is None:
+            words_symbol_length = get_symbol_length_by_count(self.words_count)
+        states_symbol_length = get_symbol_length_by_count(self.states_count)
+        content_usage = (self.state_symbols_in_transitions * states_symbol_length) + \
+                        (self.num_of_emissions * words_symbol_length)
+        delimiter_usage = (self.states_count * words_symbol_length) + ((self.states_count + 1) * states_symbol_length)
+        num_bits = states_symbol_length + 1
+        return num_bits + delimiter_usage + content_usage
+
+    def get_total_length(self, data_by_grammar_length, words_symbol_length=None):
+        return self.get_lexicon_length() + self.get_syntactic_component_length(words_symbol_length) + \
+               data_by_grammar_length
 
 
 ##### Data by Grammar #####
 
-data = ["athindog","theuglymouse"]
-mock_viterbi_dict = {"athindog": (['q0', 'q2', 'q4', 'q1', 'qf'],['a', 'thin', 'dog']),
-                     "theuglymouse": (['q0', 'q2', 'q4', 'q1', 'qf'], ['the', 'ugly', 'mouse'])}
-
-def mock_viterbi(syntactic_component, lexicon, datum):
-    return mock_viterbi_dict[datum]
-
-viterbi = MagicMock(side_effect=mock_viterbi)
-
 def encode_data_by_grammar(syntactic_component, lexicon, data, viterbi):   #no prefix, no delimiter at all
-    str_io = StringIO()
+    bit_writer = BitWriter()
+    compiled_syntactic_component = get_compiled_syntactic_component(syntactic_component)
     for datum in data:
         states_path, emissions_path = viterbi(syntactic_component, lexicon, datum)
+        if compiled_syntactic_component is not None:
+            write_compiled_path(bit_writer, compiled_syntactic_component, states_path, emissions_path)
+            continue
         states_index = 0
         segmentation_index = 0
         while True:
@@ -198,56 +253,76 @@ def encode_data_by_grammar(syntactic_component, lexicon, data, viterbi):   #no p
             transition_table = syntactic_component.get_outgoing_states(current_state)
             states_index += 1
             next_state = states_path[states_index]
-            transition_binary = get_binary_by_item(transition_table, next_state)
-            print(transition_binary, end="", file=str_io)
+            write_item(bit_writer, transition_table, next_state)
             if states_index >= len(states_path) - 1:
                 break
             emission_table = syntactic_component.get_emissions(next_state)
             emission_value = emissions_path[segmentation_index]
-            emission_binary = get_binary_by_item(emission_table, emission_value)
-            print(emission_binary, end="", file=str_io)
+            write_item(bit_writer, emission_table, emission_value)
             segmentation_index += 1
 
-    return str_io.getvalue()
-
-def decode_data(encoded_data_string):
-    def get_item_by_binary_with_truncate(list_, full_binary_string):
-        symbol_length = get_symbol_length(list_)
-        if not symbol_length:
-            return list_[0], full_binary_string
-        needed_binary = full_binary_string[0:symbol_length]
-        return list_[int(needed_binary, 2)], full_binary_string[symbol_length:]
-
-    data = []
-    while True:
-        str_io = StringIO()
-        current_state = "q0"
+    return bit_writer.getvalue()
+
+# Writes the codes of a path by the compiled codes tables, with an O(1) lookup per symbol instead of list.index.
+def write_compiled_path(bit_writer, compiled_syntactic_component, states_path, emissions_path):
+    state_ids = [compiled_syntactic_component.state_ids[state] for state in states_path]
+    transition_symbol_lengths = compiled_syntactic_component.transition_symbol_lengths
+    emission_symbol_lengths = compiled_syntactic_component.emission_symbol_lengths
+    for index in range(len(state_ids) - 1):
+        state_id, next_state_id = state_ids[index], state_ids[index + 1]
+        bit_writer.write(compiled_syntactic_component.transition_codes[state_id][next_state_id],
+                         int(transition_symbol_lengths[state_id]))
+        if index + 1 < len(state_ids) - 1:
+            emission_id = compiled_syntactic_component.emission_ids[emissions_path[index]]
+            bit_writer.write(compiled_syntactic_component.emission_codes[next_state_id][emission_id],
+                             int(emission_symbol_lengths[next_state_id]))
+
+def decode_data(syntactic_component, encoded_data):
+    return list(decode_data_stream(syntactic_component, encoded_data))
+
+
+# Yields the decoded data one by one. encoded_data is a BitReader (e.g. bit_stream.load_bit_reader of an archive
+# file, which is read in chunks, so the memory does not grow with the size of the archive), or anything that
+# BitReader reads, e.g. packed bits, or a memoryview with the length in bits of the encoding.
+def decode_data_stream(syntactic_component, encoded_data, length=None):
+    bit_reader = encoded_data if isinstance(encoded_data, BitReader) else BitReader(encoded_data, length)
+    while not bit_reader.at_end():
+        emission_values = []
+        current_state = INITIAL_STATE
         while True:
             transition_table = syntactic_component.get_outgoing_states(current_state)
-            current_state, encoded_data_string = get_item_by_binary_with_truncate(transition_table, encoded_data_string)
-            if current_state == "qf":
-                data.append(str_io.getvalue())
+            current_state = read_item(bit_reader, transition_table)
+            if current_state == FINAL_STATE:
+                yield ''.join(emission_values)
                 break
             emission_table = syntactic_component.get_emissions(current_state)
-            emission_value, encoded_data_string = get_item_by_binary_with_truncate(emission_table, encoded_data_string)
-            print(emission_value, end='', file=str_io)
+            emission_values.append(read_item(bit_reader, emission_table))
 
 
-        if not encoded_data_string:
-            break
 
-    return data
+def get_encoded_data_by_grammar_length(syntactic_component, lexicon, data, viterbi):
+    viterbi_results = (viterbi(syntactic_component, lexicon, datum) for datum in data)
+    return get_encoded_data_by_grammar_length_by_results(syntactic_component, viterbi_results)
 
 
+# The data by grammar length of already decoded data (e.g. the output of new_viterbi.viterbi_batch).
+# The cost computation is timed without the decoding, when viterbi_results is a generator that decodes the data.
+def get_encoded_data_by_grammar_length_by_results(syntactic_component, viterbi_results):
+    with get_instrumentation().phase('cost_computation'):
+        return _get_encoded_data_by_grammar_length_by_results(syntactic_component, viterbi_results)
 
-def get_encoded_data_by_grammar_length(syntactic_component, lexicon, data, viterbi):
+
+def _get_encoded_data_by_grammar_length_by_results(syntactic_component, viterbi_results):
     data_by_grammar_length = 0
-    for datum in data:
-        viterbi_result = viterbi(syntactic_component, lexicon, datum)
+    compiled_syntactic_component = get_compiled_syntactic_component(syntactic_component)
+    for viterbi_result in viterbi_results:
         if not viterbi_result:
             return float("-INF")
         else:
             viterbi_path = viterbi_result[0]
+        if compiled_syntactic_component is not None:
+            data_by_grammar_length += get_compiled_path_length(compiled_syntactic_component, viterbi_path)
+            continue
         viterbi_index = 0
         current_state = viterbi_path[viterbi_index]
         while True:
@@ -263,12 +338,60 @@ def get_encoded_data_by_grammar_length(syntactic_component, lexicon, data, viter
     return data_by_grammar_length
 
 
-encoded_string = encode_data_by_grammar(syntactic_component, words_list, data, viterbi)
+# The exact data by grammar length in bits: -log2 P(datum | grammar) summed over the data, by the log probabilities of
+# the data summed over all their parses (e.g. the output of new_viterbi.forward_batch). Unlike the Viterbi length, it
+# is not rounded to whole symbols, and does not assume that the data is sent by its best parse.
+def get_exact_data_by_grammar_length_by_log_probabilities(log_probabilities):
+    data_by_grammar_length = 0
+    for log_probability in log_probabilities:
+        if log_probability == float("-INF"):
+            return float("-INF")
+        data_by_grammar_length -= log_probability / log(2)
+
+    return data_by_grammar_length
+
+
+# The same as get_encoded_data_by_grammar_length, with the data split to chunks that are scored by a pool of
+# processes. The syntactic component, lexicon and viterbi (which should all be picklable) are sent to every
+# process once, by the pool initializer.
+def get_encoded_data_by_grammar_length_parallel(syntactic_component, lexicon, data, viterbi,
+                                                workers=DATA_BY_GRAMMAR_WORKERS,
+                                                chunk_size=DATA_BY_GRAMMAR_CHUNK_SIZE):
+    chunks = [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
+    data_by_grammar_length = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_data_by_grammar_worker,
+                             initargs=(syntactic_component, lexicon, viterbi)) as executor:
+        futures = [executor.submit(_get_chunk_data_by_grammar_length, chunk) for chunk in chunks]
+        for future in futures:
+            chunk_length = future.result()
+            if chunk_length == float("-INF"):
+                for remaining_future in futures:
+                    remaining_future.cancel()
+                return float("-INF")
+            data_by_grammar_length += chunk_length
+
+    return data_by_grammar_length
+
+
+_worker_arguments = None
+
+
+def _init_data_by_grammar_worker(syntactic_component, lexicon, viterbi):
+    global _worker_arguments
+    _worker_arguments = (syntactic_component, lexicon, viterbi)
+
+
+def _get_chunk_data_by_grammar_length(chunk):
+    syntactic_component, lexicon, viterbi = _worker_arguments
+    return get_encoded_data_by_grammar_length(syntactic_component, lexicon, chunk, viterbi)
 
 
-assert len(encoded_string) == 16
-assert get_encoded_data_by_grammar_length(syntactic_component, words_list, data, viterbi) == len(encoded_string)
-assert decode_data(encoded_string) == data
+# The length of a states path by the compiled symbol lengths: a transition symbol for every state but the last,
+# and an emission symbol for every inner state.
+def get_compiled_path_length(compiled_syntactic_component, states_path):
+    path_state_ids = [compiled_syntactic_component.state_ids[state] for state in states_path]
+    return int(compiled_syntactic_component.transition_symbol_lengths[path_state_ids[:-1]].sum() +
+               compiled_syntactic_component.emission_symbol_lengths[path_state_ids[1:-1]].sum())
 
 
 # def encode_syntactic_component(syntactic_component, states_list, words_list):  # with 0*1 prefix,
@@ -0,0 +1,321 @@
+import random
+from copy import deepcopy
+from math import exp
+from concurrent.futures import ProcessPoolExecutor
+
+from configurations import SEARCH_CHAINS, SEARCH_WORKERS, SEARCH_ROUNDS, SEARCH_STEPS_PER_ROUND, \
+    SEARCH_MIN_TEMPERATURE, SEARCH_MAX_TEMPERATURE, SEARCH_NEIGHBORS_PER_STEP
+from encoding import get_binary_enumeration, get_encoded_lexicon_length, get_encoded_syntactic_component_length, \
+    get_encoded_data_by_grammar_length, get_encoded_data_by_grammar_length_by_results, get_symbol_length, \
+    EncodingLengthTracker
+from incremental_decoding import IncrementalDecoder
+from instrumentation import Instrumentation, get_instrumentation, instrumented
+from lexical_modifier import LexicalModifier, SillyLexicalModifier
+from lexicon_entries import LexiconEntries
+from new_viterbi import HMM, Lexicon, INITIAL_STATE, viterbi, viterbi_candidates_batch
+from viterbi_cache import ViterbiCache
+
+
+# A hypothesis of the search: an HMM (as an hmm_dict, see new_viterbi) whose inner states emit the lexicon entries
+# (a list, or the LexiconEntries of a chain).
+class Hypothesis:
+    def __init__(self, hmm_dict, entries):
+        self.hmm_dict = hmm_dict
+        self.entries = entries
+
+    def get_hmm(self):
+        return HMM(deepcopy(self.hmm_dict))    # HMM consumes the dictionary
+
+    def get_lexicon(self):
+        return Lexicon(list(self.entries))
+
+
+# The MDL length of the hypothesis: the lengths of its lexicon and HMM, and of the data encoded by them
+# (inf if the data can not be parsed, so that such hypotheses are never preferred).
+def get_hypothesis_length(hypothesis, alphabet, data):
+    hmm = hypothesis.get_hmm()
+    data_by_grammar_length = get_encoded_data_by_grammar_length(hmm, hypothesis.get_lexicon(), data, viterbi)
+    return _get_hypothesis_length(hypothesis, hmm, alphabet, data_by_grammar_length)
+
+
+# The lengths of hypotheses that differ only in their lexicons and emissions (e.g. the output of propose_neighbors),
+# with the data decoded by all of them in a single pass (see new_viterbi.viterbi_candidates_batch).
+def get_hypotheses_lengths(hypotheses, alphabet, data):
+    hmms = [hypothesis.get_hmm() for hypothesis in hypotheses]
+    candidates_results = viterbi_candidates_batch(hmms, [hypothesis.get_lexicon() for hypothesis in hypotheses], data)
+    return [_get_hypothesis_length(hypothesis, hmm, alphabet,
+                                   get_encoded_data_by_grammar_length_by_results(hmm, viterbi_results))
+            for hypothesis, hmm, viterbi_results in zip(hypotheses, hmms, candidates_results)]
+
+
+def _get_hypothesis_length(hypothesis, hmm, alphabet, data_by_grammar_length):
+    if data_by_grammar_length == float("-INF"):
+        return float("inf")
+
+    _, alphabet_symbol_length = get_binary_enumeration(alphabet)
+    words_symbol_length = get_symbol_length(hypothesis.entries)
+    return get_encoded_lexicon_length(alphabet_symbol_length, hypothesis.entries) + \
+           get_encoded_syntactic_component_length(hmm, hmm.get_states(), words_symbol_length) + \
+           data_by_grammar_length
+
+
+_lexical_modifier = LexicalModifier()
+_silly_lexical_modifier = SillyLexicalModifier()
+NEIGHBOR_MOVES = [_lexical_modifier.remove_segment_from_entry,
+                  _lexical_modifier.add_segment_to_entry,
+                  _silly_lexical_modifier.add_two_segment_to_end_of_entry]
+
+
+# Returns a neighbour of the hypothesis by a random move of the lexical modifiers.
+def get_neighbor(hypothesis, alphabet):
+    entries = LexiconEntries(hypothesis.entries)
+    return Hypothesis(modify_hypothesis(hypothesis.hmm_dict, entries, alphabet), entries.get_entries())
+
+
+# Returns k neighbours of the hypothesis, each by a random move of the lexical modifiers. The moves are made on a
+# single copy of the entries, and every one is rolled back after its neighbour is taken.
+def propose_neighbors(hypothesis, alphabet, k):
+    entries = LexiconEntries(hypothesis.entries)
+    neighbors = []
+    for _ in range(k):
+        snapshot = entries.snapshot()
+        neighbors.append(Hypothesis(modify_hypothesis(hypothesis.hmm_dict, entries, alphabet), entries.get_entries()))
+        entries.rollback(snapshot)
+    return neighbors
+
+
+# Applies a random move of the lexical modifiers to the entries in place, and returns the hmm_dict that matches
+# them: a replaced entry is replaced in the emissions of the HMM too, and a new entry is emitted by a random
+# inner state. The lists of the states that do not change are shared with the given hmm_dict.
+def modify_hypothesis(hmm_dict, entries, alphabet):
+    return _modify_hypothesis(hmm_dict, entries, alphabet)[0]
+
+
+# Returns (the neighbour's hmm_dict, the ([new], [old]) entries of the move), see modify_hypothesis.
+def _modify_hypothesis(hmm_dict, entries, alphabet):
+    added_entries, removed_entries = random.choice(NEIGHBOR_MOVES)(entries, alphabet)
+    replaced_entries = dict(zip(removed_entries, added_entries))
+
+    neighbor_hmm_dict = {}
+    for state, state_lists in hmm_dict.items():
+        if state != INITIAL_STATE and any(entry in replaced_entries for entry in state_lists[1]):
+            transitions_list, emissions_list = state_lists
+            state_lists = (transitions_list, [replaced_entries.get(entry, entry) for entry in emissions_list])
+        neighbor_hmm_dict[state] = state_lists
+
+    inner_states = [state for state in neighbor_hmm_dict if state != INITIAL_STATE]
+    for entry in added_entries[len(removed_entries):]:
+        state = random.choice(inner_states)
+        transitions_list, emissions_list = neighbor_hmm_dict[state]
+        neighbor_hmm_dict[state] = (transitions_list, emissions_list + [entry])
+
+    return neighbor_hmm_dict, added_entries, removed_entries
+
+
+# A hypothesis of a chain, whose neighbours are scored in time that follows the move instead of the whole corpus:
+# the HMM and the lexicon are changed in place by a move (and back, if it is rejected), the lengths of the lexicon
+# and the HMM are updated by its counts (see EncodingLengthTracker), and only the data that it affects are decoded
+# again (see IncrementalDecoder), whose parses are brought back if it is rejected. viterbi is the decoder of the
+# data, e.g. a ViterbiCache, so that data that are decoded again by the same HMM and lexicon are cache hits.
+class IncrementalChain:
+    def __init__(self, hypothesis, alphabet, data, viterbi=viterbi):
+        self.alphabet = alphabet
+        self.hmm_dict = hypothesis.hmm_dict
+        self.entries = LexiconEntries(hypothesis.entries)
+        self.hmm = hypothesis.get_hmm()
+        self.lexicon = Lexicon(self.entries)
+        self.tracker = EncodingLengthTracker(get_binary_enumeration(alphabet)[1], self.entries, self.hmm,
+                                             self.hmm.get_states())
+        self.decoder = IncrementalDecoder(self.hmm, self.lexicon, data, viterbi)
+        self._move = None   # (lexicon and decoder snapshots, neighbour hmm_dict, added, removed entries) of a move
+
+    # The hypothesis that the chain is at (the neighbour, while a move is neither accepted nor rejected).
+    def get_hypothesis(self):
+        return Hypothesis(self.hmm_dict if self._move is None else self._move[1], self.entries.get_entries())
+
+    # The same as get_hypothesis_length of the hypothesis.
+    def get_length(self):
+        data_by_grammar_length = self.decoder.get_data_by_grammar_length()
+        if data_by_grammar_length == float("-INF"):
+            return float("inf")
+        with get_instrumentation().phase('cost_computation'):
+            return self.tracker.get_total_length(data_by_grammar_length)
+
+    # Moves to a random neighbour, and returns its length. The move is then either accepted or rejected.
+    def propose(self):
+        snapshots = (self.lexicon.snapshot(), self.decoder.snapshot())
+        neighbor_hmm_dict, added_entries, removed_entries = _modify_hypothesis(self.hmm_dict, self.entries,
+                                                                               self.alphabet)
+        self.lexicon.update_modified_entries(added_entries, removed_entries)
+        self._move = (snapshots, neighbor_hmm_dict, added_entries, removed_entries)
+        self._update(self.hmm_dict, neighbor_hmm_dict, added_entries, removed_entries)
+        self.decoder.update(added_entries, removed_entries)
+        return self.get_length()
+
+    def accept(self):
+        self.lexicon.commit()
+        self.decoder.commit()
+        self.hmm_dict = self._move[1]
+        self._move = None
+
+    def reject(self):
+        (lexicon_snapshot, decoder_snapshot), neighbor_hmm_dict, added_entries, removed_entries = self._move
+        self.lexicon.rollback(lexicon_snapshot)
+        self._update(neighbor_hmm_dict, self.hmm_dict, removed_entries, added_entries)
+        self.decoder.rollback(decoder_snapshot)
+        self._move = None
+
+    # Brings the HMM and the tracker from one hmm_dict to another, whose states that do not change share their
+    # lists (see modify_hypothesis), given the entries that are added and removed on the way.
+    def _update(self, hmm_dict, other_hmm_dict, added_entries, removed_entries):
+        for entry in removed_entries:
+            self.tracker.remove_entry(entry)
+        for entry in added_entries:
+            self.tracker.add_entry(entry)
+        for state, state_lists in other_hmm_dict.items():
+            if state == INITIAL_STATE or hmm_dict[state] is state_lists:
+                continue
+            emissions_list = state_lists[1]
+            for _ in range(len(emissions_list) - len(hmm_dict[state][1])):
+                self.tracker.add_emission(state)
+            for _ in range(len(hmm_dict[state][1]) - len(emissions_list)):
+                self.tracker.remove_emission(state)
+            self.hmm.set_emissions(state, emissions_list)
+
+
+# Runs simulated annealing chains at a ladder of temperatures (parallel tempering) in a pool of processes.
+# Every round, each chain proposes steps_per_round neighbours in its process. Then chains of adjacent temperatures
+# swap their hypotheses by the Metropolis criterion, so good hypotheses found by the hot chains sink to the cold
+# ones, and the coldest chain continues from the best hypothesis so far if it has drifted away from it.
+# With neighbors_per_step > 1, every step proposes a batch of neighbours that are scored together (see
+# get_hypotheses_lengths), and one of them is drawn by its Boltzmann weight at the chain's temperature.
+# With instrument, the chains are instrumented in their processes, and the counters and phase times of the whole
+# run are aggregated in the instrumentation attribute.
+class ParallelTemperingSearch:
+    def __init__(self, hypothesis, alphabet, data, chains=SEARCH_CHAINS, min_temperature=SEARCH_MIN_TEMPERATURE,
+                 max_temperature=SEARCH_MAX_TEMPERATURE, workers=SEARCH_WORKERS, seed=None,
+                 neighbors_per_step=SEARCH_NEIGHBORS_PER_STEP, instrument=False):
+        self.alphabet = alphabet
+        self.data = data
+        self.workers = workers
+        self.neighbors_per_step = neighbors_per_step
+        self.instrumentation = Instrumentation() if instrument else None
+        self.random = random.Random(seed)
+        if chains == 1:
+            self.temperatures = [min_temperature]
+        else:   # a geometric ladder
+            self.temperatures = [min_temperature * (max_temperature / min_temperature) ** (chain / (chains - 1))
+                                 for chain in range(chains)]
+
+        length = get_hypothesis_length(hypothesis, alphabet, data)
+        self.hypotheses = [hypothesis] * chains
+        self.lengths = [length] * chains
+        self.best_hypothesis = hypothesis
+        self.best_length = length
+        self.proposed_swaps = 0
+        self.accepted_swaps = 0
+
+    # Returns the best hypothesis found and its length.
+    def run(self, rounds=SEARCH_ROUNDS, steps_per_round=SEARCH_STEPS_PER_ROUND):
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_search_worker,
+                                 initargs=(self.alphabet, self.data, self.neighbors_per_step)) as executor:
+            for _ in range(rounds):
+                chains = [(hypothesis, length, temperature, steps_per_round, self.random.getrandbits(32),
+                           self.instrumentation is not None)
+                          for hypothesis, length, temperature in zip(self.hypotheses, self.lengths, self.temperatures)]
+                for chain, ((hypothesis, length, best_hypothesis, best_length), chain_instrumentation) in \
+                        enumerate(executor.map(_run_chain, chains)):
+                    if chain_instrumentation is not None:
+                        self.instrumentation.merge(chain_instrumentation)
+                    self.hypotheses[chain] = hypothesis
+                    self.lengths[chain] = length
+                    if best_length < self.best_length:
+                        self.best_hypothesis, self.best_length = best_hypothesis, best_length
+
+                self._swap_chains()
+                if self.best_length < self.lengths[0]:
+                    self.hypotheses[0], self.lengths[0] = self.best_hypothesis, self.best_length
+
+        return self.best_hypothesis, self.best_length
+
+    def _swap_chains(self):
+        for colder_chain in range(len(self.temperatures) - 1):
+            hotter_chain = colder_chain + 1
+            self.proposed_swaps += 1
+            delta = (1 / self.temperatures[colder_chain] - 1 / self.temperatures[hotter_chain]) * \
+                    (self.lengths[colder_chain] - self.lengths[hotter_chain])
+            if delta >= 0 or self.random.random() < exp(delta):
+                self.accepted_swaps += 1
+                self.hypotheses[colder_chain], self.hypotheses[hotter_chain] = \
+                    self.hypotheses[hotter_chain], self.hypotheses[colder_chain]
+                self.lengths[colder_chain], self.lengths[hotter_chain] = \
+                    self.lengths[hotter_chain], self.lengths[colder_chain]
+
+
+# Metropolis acceptance of a neighbour, with lengths in bits as the energy.
+def _is_accepted(length, neighbor_length, temperature):
+    if neighbor_length <= length:
+        return True
+    return neighbor_length != float("inf") and random.random() < exp((length - neighbor_length) / temperature)
+
+
+_worker_arguments = None
+_worker_viterbi = None  # a ViterbiCache shared by the chains of the process
+
+
+def _init_search_worker(alphabet, data, neighbors_per_step):
+    global _worker_arguments, _worker_viterbi
+    _worker_arguments = (alphabet, data, neighbors_per_step)
+    _worker_viterbi = ViterbiCache(viterbi)
+
+
+# Runs a chain for some steps in a process. The neighbours are made by changing the chain's hypothesis in place, and
+# a rejected neighbour is rolled back (see IncrementalChain). The lexical modifiers draw from the random module, so
+# it is seeded for every chain. Returns the chain's results, and the to_dict of its instrumentation (or None).
+def _run_chain(chain):
+    hypothesis, length, temperature, steps, seed, instrument = chain
+    random.seed(seed)
+    if not instrument:
+        return _run_chain_steps(hypothesis, length, temperature, steps), None
+    with instrumented() as instrumentation:
+        chain_results = _run_chain_steps(hypothesis, length, temperature, steps)
+    return chain_results, instrumentation.to_dict()
+
+
+def _run_chain_steps(hypothesis, length, temperature, steps):
+    alphabet, data, neighbors_per_step = _worker_arguments
+    if neighbors_per_step > 1:
+        return _run_batched_chain(hypothesis, length, temperature, steps, neighbors_per_step)
+
+    chain = IncrementalChain(hypothesis, alphabet, data, _worker_viterbi)
+    best_hypothesis, best_length = hypothesis, length
+    for _ in range(steps):
+        neighbor_length = chain.propose()
+        if _is_accepted(length, neighbor_length, temperature):
+            chain.accept()
+            length = neighbor_length
+            if length < best_length:
+                best_hypothesis, best_length = chain.get_hypothesis(), length
+        else:
+            chain.reject()
+
+    return chain.get_hypothesis(), length, best_hypothesis, best_length
+
+
+def _run_batched_chain(hypothesis, length, temperature, steps, neighbors_per_step):
+    alphabet, data, _ = _worker_arguments
+    best_hypothesis, best_length = hypothesis, length
+    for _ in range(steps):
+        neighbors = propose_neighbors(hypothesis, alphabet, neighbors_per_step)
+        neighbors_lengths = get_hypotheses_lengths(neighbors, alphabet, data)
+        minimal_length = min(neighbors_lengths)
+        if minimal_length == float("inf"):
+            continue
+        weights = [exp((minimal_length - neighbor_length) / temperature) for neighbor_length in neighbors_lengths]
+        neighbor_index = random.choices(range(len(neighbors)), weights)[0]
+        if _is_accepted(length, neighbors_lengths[neighbor_index], temperature):
+            hypothesis, length = neighbors[neighbor_index], neighbors_lengths[neighbor_index]
+            if length < best_length:
+                best_hypothesis, best_length = hypothesis, length
+
+    return hypothesis, length, best_hypothesis, best_length
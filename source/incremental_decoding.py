@@ -0,0 +1,149 @@
+from configurations import INCREMENTAL_DECODING_GRAM_LENGTH
+from encoding import get_encoded_data_by_grammar_length_by_results
+from new_viterbi import viterbi as new_viterbi, INITIAL_STATE
+
+
+# Keeps the best parse of every datum, and inverted indices from a state and from a lexical entry to the data whose
+# best parse uses them, so that after a modification of the lexicon and the HMM only the affected data are decoded
+# again. A datum whose best parse changes either had a parse through something that changed, or has a new best
+# parse through something that changed, which emits one of its substrings. So the affected data are:
+# the data whose parse passes through a state whose probabilities changed, or uses a removed entry, and the data
+# that contain an emission of such a state, or an added entry (found by a substring index).
+# When a state's emissions are replaced by at least as many others, the probabilities of the rest do not grow, so
+# only the data through the state (if they shrink), and the replaced and the new emissions count.
+# As in LexiconEntries, the parses that an update replaces are kept in an undo log until commit is called, so an
+# update (e.g. of a rejected neighbour) is undone by rolling back to a snapshot instead of decoding the data again.
+class IncrementalDecoder:
+    def __init__(self, hmm, lexicon, data, viterbi=new_viterbi):
+        self.hmm = hmm
+        self.lexicon = lexicon
+        self.data = data
+        self.viterbi = viterbi
+        self.substring_index = SubstringIndex(data)
+        self.decode_all()
+
+    def decode_all(self):
+        self.viterbi_results = [None] * len(self.data)
+        self.data_lengths = [0] * len(self.data)
+        self.entry_index = {}   # from a lexical entry to the set of indices of the data whose parse uses it
+        self.state_index = {}   # from a state to the set of indices of the data whose parse passes through it
+        self.unparsable_data = set()
+        self._data_by_grammar_length = 0    # the sum of the lengths of the parsable data
+        self._states_content = self._get_states_content()
+        self._undo_log = []     # (datum index, its parse and length before an update), or (None, states content)
+        self._decode(range(len(self.data)))
+        self._undo_log = []
+
+    # Updates the parses after the lexicon and the HMM were modified, given the ([new], [old]) entries that the
+    # lexical modifier returned. Returns the indices of the data that were decoded again.
+    def update(self, added_entries, removed_entries):
+        added_entries, removed_entries = set(added_entries), set(removed_entries)
+        states_content = self._get_states_content()
+        affected_data = set()
+        for state, (transitions, emissions) in states_content.items():
+            old_transitions, old_emissions = self._states_content.get(state, (frozenset(), frozenset()))
+            if (transitions, emissions) == (old_transitions, old_emissions):
+                continue
+            if state == INITIAL_STATE:  # every parse starts there
+                affected_data = set(range(len(self.data)))
+            elif transitions == old_transitions and len(emissions) >= len(old_emissions):
+                if len(emissions) > len(old_emissions):
+                    affected_data |= self.state_index.get(state, set())
+                added_entries |= emissions - old_emissions
+                removed_entries |= old_emissions - emissions
+            else:
+                affected_data |= self.state_index.get(state, set())
+                for emission in emissions:
+                    affected_data |= self.substring_index.get_data_containing(emission)
+        self._undo_log.append((None, self._states_content))
+        self._states_content = states_content
+
+        for entry in removed_entries:
+            affected_data |= self.entry_index.get(entry, set())
+        for entry in added_entries:
+            affected_data |= self.substring_index.get_data_containing(entry)
+
+        affected_data = sorted(affected_data)
+        self._decode(affected_data)
+        return affected_data
+
+    # The transitions and emissions of every state, as sets (their order does not change the probabilities).
+    def _get_states_content(self):
+        return {state: (frozenset(self.hmm.get_outgoing_states(state)), frozenset(self.hmm.get_emissions(state)))
+                for state in self.hmm.get_states()}
+
+    # A snapshot is the length of the undo log, so it is taken in O(1).
+    def snapshot(self):
+        return len(self._undo_log)
+
+    # Brings back the parses (and the states content) of the snapshot (by default, of the last commit). The HMM and
+    # the lexicon should be brought back to the snapshot too.
+    def rollback(self, snapshot=0):
+        while len(self._undo_log) > snapshot:
+            i, undone = self._undo_log.pop()
+            if i is None:
+                self._states_content = undone
+            else:
+                self._set_result(i, *undone)
+
+    def commit(self):
+        self._undo_log = []
+
+    def _decode(self, data_indices):
+        for i in data_indices:
+            viterbi_result = self.viterbi(self.hmm, self.lexicon, self.data[i])
+            data_length = 0 if viterbi_result is None else \
+                get_encoded_data_by_grammar_length_by_results(self.hmm, [viterbi_result])
+            self._undo_log.append((i, (self.viterbi_results[i], self.data_lengths[i])))
+            self._set_result(i, viterbi_result, data_length)
+
+    def _set_result(self, i, viterbi_result, data_length):
+        if self.viterbi_results[i] is not None:
+            for entry in self.viterbi_results[i].emissions_path:
+                self.entry_index.get(entry, set()).discard(i)
+            for state in self.viterbi_results[i].states_path:
+                self.state_index.get(state, set()).discard(i)
+        self._data_by_grammar_length -= self.data_lengths[i]
+        self.unparsable_data.discard(i)
+
+        self.viterbi_results[i] = viterbi_result
+        self.data_lengths[i] = data_length
+        if viterbi_result is None:
+            self.unparsable_data.add(i)
+        else:
+            for entry in viterbi_result.emissions_path:
+                self.entry_index.setdefault(entry, set()).add(i)
+            for state in viterbi_result.states_path:
+                self.state_index.setdefault(state, set()).add(i)
+        self._data_by_grammar_length += data_length
+
+    # The same as get_encoded_data_by_grammar_length over all the data.
+    def get_data_by_grammar_length(self):
+        if self.unparsable_data:
+            return float("-INF")
+        return self._data_by_grammar_length
+
+
+# An inverted index from every substring of the data of up to gram_length segments to the indices of the data that
+# contain it. A longer string can only be in the data that contain all of its substrings of gram_length segments,
+# so only those are searched.
+class SubstringIndex:
+    def __init__(self, data, gram_length=INCREMENTAL_DECODING_GRAM_LENGTH):
+        self.data = data
+        self.gram_length = gram_length
+        self._index = {}
+        for i, datum in enumerate(data):
+            datum_string = str(datum)
+            for start in range(len(datum_string)):
+                for end in range(start + 1, min(start + gram_length, len(datum_string)) + 1):
+                    self._index.setdefault(datum_string[start:end], set()).add(i)
+
+    # Returns a new set of the indices of the data that contain the string.
+    def get_data_containing(self, string):
+        if not string:
+            return set(range(len(self.data)))
+        if len(string) <= self.gram_length:
+            return set(self._index.get(string, ()))
+        grams = sorted((self._index.get(string[start:start + self.gram_length], set())
+                        for start in range(len(string) - self.gram_length + 1)), key=len)
+        return {i for i in grams[0].intersection(*grams[1:]) if string in self.data[i]}
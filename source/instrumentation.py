@@ -0,0 +1,169 @@
+import json
+from collections import defaultdict
+from time import perf_counter
+
+
+# Opt-in counters and phase timers for the hot paths of decoding and encoding. It is disabled by default, and then
+# get_instrumentation returns a null instrumentation whose methods do nothing, so the hooks cost a method call.
+# Hooks whose counts are expensive to compute check enabled first.
+# The phases are exclusive: the time of a phase that starts inside another one (e.g. the decoding inside the cost
+# computation) is not counted in the outer phase.
+# With keep_calls, every top-level call (e.g. the viterbi of a single datum) also gets its own record, so
+# pathological data can be found.
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, keep_calls=False):
+        self.keep_calls = keep_calls
+        self.counters = defaultdict(int)
+        self.phase_times = defaultdict(float)
+        self.calls = []
+        self._phases = []   # the stack of the open phases, as [name, the time it (re)started]
+        self._call = None   # the record of the open top-level call
+        self._calls_depth = 0
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+        if self._call is not None:
+            self._call['counters'][name] = self._call['counters'].get(name, 0) + amount
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def call(self, function, **details):
+        return _Call(self, function, details)
+
+    def start_phase(self, name):
+        now = perf_counter()
+        if self._phases:
+            self._add_time(self._phases[-1][0], now - self._phases[-1][1])
+        self._phases.append([name, now])
+
+    def end_phase(self):
+        now = perf_counter()
+        name, start = self._phases.pop()
+        self._add_time(name, now - start)
+        if self._phases:
+            self._phases[-1][1] = now
+
+    def _add_time(self, name, elapsed):
+        self.phase_times[name] += elapsed
+        if self._call is not None:
+            self._call['phase_times'][name] = self._call['phase_times'].get(name, 0.0) + elapsed
+
+    def start_call(self, function, details):
+        self._calls_depth += 1
+        if self._calls_depth == 1:
+            self.counters[function + '_calls'] += 1
+            if self.keep_calls:
+                self._call = dict(details, function=function, counters={}, phase_times={})
+
+    def end_call(self):
+        self._calls_depth -= 1
+        if self._calls_depth == 0 and self._call is not None:
+            self.calls.append(self._call)
+            self._call = None
+
+    # Adds the counts and times of another instrumentation (or of its to_dict, e.g. from another process).
+    def merge(self, other):
+        if isinstance(other, Instrumentation):
+            other = other.to_dict()
+        for name, amount in other['counters'].items():
+            self.counters[name] += amount
+        for name, elapsed in other['phase_times'].items():
+            self.phase_times[name] += elapsed
+        self.calls.extend(other['calls'])
+
+    def reset(self):
+        self.__init__(self.keep_calls)
+
+    def to_dict(self):
+        return {'counters': dict(self.counters), 'phase_times': dict(self.phase_times), 'calls': list(self.calls)}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+class _Phase:
+    __slots__ = ('instrumentation', 'name')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.instrumentation.start_phase(self.name)
+
+    def __exit__(self, *exception_info):
+        self.instrumentation.end_phase()
+
+
+class _Call:
+    __slots__ = ('instrumentation', 'function', 'details')
+
+    def __init__(self, instrumentation, function, details):
+        self.instrumentation = instrumentation
+        self.function = function
+        self.details = details
+
+    def __enter__(self):
+        self.instrumentation.start_call(self.function, self.details)
+
+    def __exit__(self, *exception_info):
+        self.instrumentation.end_call()
+
+
+class _NullInstrumentation:
+    enabled = False
+
+    def count(self, name, amount=1):
+        pass
+
+    def phase(self, name):
+        return _null_context
+
+    def call(self, function, **details):
+        return _null_context
+
+
+class _NullContext:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exception_info):
+        pass
+
+
+_null_context = _NullContext()
+_null_instrumentation = _NullInstrumentation()
+_instrumentation = _null_instrumentation
+
+
+def get_instrumentation():
+    return _instrumentation
+
+
+# Enables the instrumentation (a new one by default) until disable is called, and returns it.
+def enable_instrumentation(instrumentation=None):
+    global _instrumentation
+    _instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+    return _instrumentation
+
+
+def disable_instrumentation():
+    global _instrumentation
+    _instrumentation = _null_instrumentation
+
+
+# Instruments the code in a with statement: with instrumented() as instrumentation: ...
+class instrumented:
+    def __init__(self, instrumentation=None, keep_calls=False):
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(keep_calls)
+
+    def __enter__(self):
+        self.previous_instrumentation = _instrumentation
+        return enable_instrumentation(self.instrumentation)
+
+    def __exit__(self, *exception_info):
+        global _instrumentation
+        _instrumentation = self.previous_instrumentation
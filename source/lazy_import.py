@@ -0,0 +1,19 @@
+import importlib.util
+import sys
+
+
+# Returns the module, which is executed only when one of its attributes is first used (see importlib.util.LazyLoader).
+# Heavy dependencies (NumPy) are imported this way, so that importing the library (e.g. in every process of a pool)
+# does not pay for them before they are needed.
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named '{}'".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
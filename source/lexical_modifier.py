@@ -2,9 +2,11 @@ from abstractions import AbstractLexicalModifier
 from random import choice, randint
 
 
+# entries is a list, or a LexiconEntries (whose membership test is O(1), and whose changes can be rolled back).
+# Every modification returns the ([new], [old]) entries.
 class LexicalModifier(AbstractLexicalModifier):
     def modify_lexicon(self, entries, alphabet):
-        pass
+        return choice([self.remove_segment_from_entry, self.add_segment_to_entry])(entries, alphabet)
 
 
     def remove_segment_from_entry(self, entries, alphabet):
@@ -33,7 +35,7 @@ class LexicalModifier(AbstractLexicalModifier):
 
 class SillyLexicalModifier(AbstractLexicalModifier):
     def modify_lexicon(self, entries, alphabet):
-        pass
+        return self.add_two_segment_to_end_of_entry(entries, alphabet)
 
     def add_two_segment_to_end_of_entry(self, entries, alphabet):
         while True:
@@ -1,15 +1,29 @@
-from abstractions import AbstractLexicalComponent, abstractmethod
+from abstractions import AbstractLexicalComponent
+from lexicon_entries import LexiconEntries
 
 
 #lexical_modifier = eval(Configuration["lexical_modifier"])()
 
+# The entries are held in a LexiconEntries, so a neighbour is made in place and is undone by rollback if it is
+# rejected, instead of copying the entries for every proposal.
 class Lexicon(AbstractLexicalComponent):
-    def __init__(self, lexical_modifier):
+    def __init__(self, lexical_modifier, entries=(), alphabet=()):
         self.lexical_modifier = lexical_modifier
+        self.entries = entries if isinstance(entries, LexiconEntries) else LexiconEntries(entries)
+        self.alphabet = alphabet
 
-
+    # Modifies the entries by the lexical modifier, and returns the ([new], [old]) entries.
     def get_neighbor(self):
-        pass
+        return self.lexical_modifier.modify_lexicon(self.entries, self.alphabet)
+
+    def get_entries(self):
+        return self.entries.get_entries()
+
+    def snapshot(self):
+        return self.entries.snapshot()
+
+    def rollback(self, snapshot=0):
+        return self.entries.rollback(snapshot)
 
-    @abstractmethod
-    def get_entries(self): pass
\ No newline at end of file
+    def commit(self):
+        self.entries.commit()
@@ -0,0 +1,86 @@
+# The entries of a lexicon as a set with an order: a list of the entries and a dictionary from an entry to its
+# position in the list, so that membership, appending and removing are all O(1). Removing an entry moves the last
+# entry into its position (so the order is not the order of insertion).
+# Every change is recorded in an undo log, so a neighbour hypothesis is made by changing the entries in place, and
+# is undone in O(1) per change by rolling back to a snapshot (instead of copying the entries for every proposal).
+# The log is kept until commit is called.
+# It has the list methods that the lexical modifiers use (len, indexing, in, append and remove).
+class LexiconEntries:
+    def __init__(self, entries=()):
+        self._entries = list(entries)
+        self._positions = {entry: position for position, entry in enumerate(self._entries)}
+        if len(self._positions) != len(self._entries):
+            raise ValueError("the entries are not unique")
+        self._undo_log = []     # (entry, position it was removed from, or None if it was appended)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __contains__(self, entry):
+        return entry in self._positions
+
+    def __repr__(self):
+        return 'LexiconEntries({!r})'.format(self._entries)
+
+    def get_entries(self):
+        return list(self._entries)
+
+    def index(self, entry):
+        return self._positions[entry]
+
+    def append(self, entry):
+        if entry in self._positions:
+            raise ValueError("{!r} is already an entry".format(entry))
+        self._positions[entry] = len(self._entries)
+        self._entries.append(entry)
+        self._undo_log.append((entry, None))
+
+    def remove(self, entry):
+        position = self._positions.pop(entry, None)
+        if position is None:
+            raise ValueError("{!r} is not an entry".format(entry))
+        last_entry = self._entries.pop()
+        if position < len(self._entries):
+            self._entries[position] = last_entry
+            self._positions[last_entry] = position
+        self._undo_log.append((entry, position))
+
+    # A snapshot is the length of the undo log, so it is taken in O(1).
+    def snapshot(self):
+        return len(self._undo_log)
+
+    # Undoes the changes since the snapshot (by default, since the last commit), and returns them as
+    # (the entries that are back, the entries that are gone).
+    def rollback(self, snapshot=0):
+        restored_entries, dropped_entries = [], []
+        while len(self._undo_log) > snapshot:
+            entry, position = self._undo_log.pop()
+            if position is None:
+                self._entries.pop()
+                del self._positions[entry]
+                dropped_entries.append(entry)
+            else:
+                if position < len(self._entries):   # move back the entry that took its position
+                    moved_entry = self._entries[position]
+                    self._positions[moved_entry] = len(self._entries)
+                    self._entries.append(moved_entry)
+                    self._entries[position] = entry
+                else:
+                    self._entries.append(entry)
+                self._positions[entry] = position
+                restored_entries.append(entry)
+
+        return restored_entries, dropped_entries
+
+    def commit(self):
+        self._undo_log.clear()
+
+    # An independent copy of the entries, with an empty undo log.
+    def copy(self):
+        return LexiconEntries(self._entries)
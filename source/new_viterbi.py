@@ -1,5 +1,17 @@
-from math import log
-from collections import namedtuple
+from math import log, log2, ceil
+from collections import namedtuple, deque
+from hashlib import sha1
+from heapq import nlargest
+from operator import itemgetter
+from threading import local
+
+from configurations import VITERBI_BATCH_SIZE, VITERBI_BATCH_MAX_CELLS, VITERBI_BEAM_SIZE, VITERBI_BEAM_WIDTH
+from instrumentation import get_instrumentation
+from lazy_import import lazy_import
+from lexicon_entries import LexiconEntries
+from symbol_table import SymbolTable
+
+np = lazy_import('numpy')   # the NumPy decoders (viterbi_with_numpy) are imported by the functions that use them
 
 USE_NULL_SEGMENT = True
 
@@ -13,21 +25,6 @@ FINAL_STATE = 'qf'
 #and FINAL_STATE is not there
 
 
-hmm_dict = {'q0':  ['q2'],
-            'q1': (['qf'], ['dog', 'mouse', 'professor', 'student']),
-            'q2': (['q1', 'q4'], ['a', 'all', 'some', 'the']),
-            'q3': (['q2'], ['adore', 'bit', 'chases', 'like', 'taught']),
-            'q4': (['q1'], ['beautiful', 'big', 'handsome', 'nice', 'thin', 'thoughtful', 'ugly'])}
-
-
-simple_hmm_dict = {'q0': ['q1', 'q2'],
-                   'q1': (['q1', 'q2', 'qf'], ['the']),
-                   'q2': (['q1', 'q2', 'qf'], ['dog'])}
-
-simple_lexicon_list = ['the', 'dog']
-
-observation = 'thedogdog'
-
 class HMM:
     def __init__(self, hmm_dict):
         hmm_dict_key_list = list(hmm_dict.keys())
@@ -41,6 +38,9 @@ class HMM:
 
         self.emissions = {k: v[1] for (k, v) in hmm_dict.items()}
 
+        self._compiled = None
+        self._fingerprint = None
+
     def get_states(self):
         return [INITIAL_STATE] + self.inner_states + [FINAL_STATE]
 
@@ -64,222 +64,905 @@ class HMM:
     def get_emissions(self, state):
         return self.emissions.get(state, [])
 
+    # Returns a (state, log probability) pair per state that can emit the emission, from the compiled form (which is
+    # kept in sync by set_emissions). States that are not on any path to FINAL_STATE are left out.
+    def get_emitting_states(self, emission):
+        compiled_hmm = self.get_compiled()
+        emission_id = compiled_hmm.emission_ids.get(emission)
+        if emission_id is None:
+            return []
+        return [(compiled_hmm.states[state_id], log_probability)
+                for state_id, log_probability in compiled_hmm.get_emitting_state_lists()[emission_id]]
+
+    # The compiled form is not pickled, it is rebuilt on first use (e.g. in the processes of a pool).
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        return state
+
+    # A stable hash of the states, transitions and emissions (the same in every process).
+    def get_fingerprint(self):
+        if self._fingerprint is None:
+            content = [(state, self.get_outgoing_states(state), self.get_emissions(state)) for state in self.get_states()]
+            self._fingerprint = sha1(repr(content).encode()).hexdigest()
+        return self._fingerprint
+
+    # The compiled form is built once per hypothesis, and kept in sync by set_transitions and set_emissions.
+    def get_compiled(self):
+        if self._compiled is None:
+            self._compiled = CompiledHMM(self)
+        return self._compiled
+
+    def set_transitions(self, state, transitions_list):
+        self._add_state(state)
+        self.transitions[state] = transitions_list
+        self._recompile_state(state)
+
+    def set_emissions(self, state, emissions_list):
+        self._add_state(state)
+        self.emissions[state] = emissions_list
+        self._recompile_state(state)
+
+    def _add_state(self, state):
+        if state != INITIAL_STATE and state not in self.inner_states:
+            self.inner_states.append(state)
+            self.transitions.setdefault(state, [])
+            self.emissions.setdefault(state, [])
+
+    def _recompile_state(self, state):
+        self._fingerprint = None
+        if self._compiled is None:
+            return
+        if self._compiled.can_recompile_state(state):
+            self._compiled.recompile_state(state)
+        else:   # the set of states has changed, so the ids are no longer valid
+            self._compiled = None
+
+
+# A compiled form of an HMM, where states and emissions are mapped to integer ids, and the probabilities are held
+# as NumPy arrays of log probabilities (-inf marks a forbidden arc).
+# State ids follow HMM.get_states(), so INITIAL_STATE is 0 and FINAL_STATE is the last id.
+# emission_log_probabilities is indexed by [emission id, state id], so all the states of an emission are contiguous.
+class CompiledHMM:
+    def __init__(self, hmm):
+        self.hmm = hmm
+        self.state_table = SymbolTable(hmm.get_states())
+        self.states = self.state_table.symbols
+        self.state_ids = self.state_table.ids
+        self.inner_state_ids = list(range(1, len(self.states) - 1))
+
+        self.emission_table = SymbolTable()
+        self.emissions = self.emission_table.symbols
+        self.emission_ids = self.emission_table.ids
+        for state in hmm.inner_states:
+            self._add_emissions(hmm.get_emissions(state))
+
+        states_count = len(self.states)
+        self.transition_log_probabilities = np.full((states_count, states_count), -np.inf)
+        self.emission_log_probabilities = np.full((len(self.emissions), states_count), -np.inf)
+        self.transition_symbol_lengths = np.zeros(states_count, dtype=int)
+        self.emission_symbol_lengths = np.zeros(states_count, dtype=int)
+        self.transition_counts = np.zeros(states_count, dtype=int)
+        self.emission_counts = np.zeros(states_count, dtype=int)
+        # per state id, a dict from the id of a next state (or an emission) to its code, i.e. its index in the
+        # transitions (or emissions) list of the state
+        self.transition_codes = [{} for _ in range(states_count)]
+        self.emission_codes = [{} for _ in range(states_count)]
+        self._log_probability_lists = None
+        self._predecessors = None
+        self._arc_lists = None
+        self._emitting_state_lists = None
+        self._null_closure = None
+
+        for state in self.states:
+            self._compile_state(state)
+
+    def _add_emissions(self, emissions_list):
+        emissions_count = len(self.emissions)
+        for emission in emissions_list:
+            self.emission_table.intern(emission)
+        return len(self.emissions) - emissions_count
+
+    def can_recompile_state(self, state):
+        return state in self.state_ids and \
+            all(next_state in self.state_ids for next_state in self.hmm.get_outgoing_states(state))
+
+    # Updates only the arcs of the given state, after its transitions or emissions have changed.
+    def recompile_state(self, state):
+        new_emissions_count = self._add_emissions(self.hmm.get_emissions(state))
+        if new_emissions_count:
+            new_rows = np.full((new_emissions_count, len(self.states)), -np.inf)
+            self.emission_log_probabilities = np.vstack([self.emission_log_probabilities, new_rows])
+        self._compile_state(state)
+
+    def _compile_state(self, state):
+        state_id = self.state_ids[state]
+        transitions_list = self.hmm.get_outgoing_states(state)
+        emissions_list = self.hmm.get_emissions(state)
+
+        self.transition_log_probabilities[state_id, :] = -np.inf
+        for next_state in transitions_list:
+            self.transition_log_probabilities[state_id, self.state_ids[next_state]] = -log(len(transitions_list))
+
+        self.emission_log_probabilities[:, state_id] = -np.inf
+        for emission in emissions_list:
+            self.emission_log_probabilities[self.emission_ids[emission], state_id] = -log(len(emissions_list))
+
+        self.transition_codes[state_id] = {self.state_ids[next_state]: code
+                                           for (code, next_state) in reversed(list(enumerate(transitions_list)))}
+        self.emission_codes[state_id] = {self.emission_ids[emission]: code
+                                         for (code, emission) in reversed(list(enumerate(emissions_list)))}
+
+        self.transition_counts[state_id] = len(transitions_list)
+        self.emission_counts[state_id] = len(emissions_list)
+        self.transition_symbol_lengths[state_id] = ceil(log2(len(transitions_list))) if transitions_list else 0
+        self.emission_symbol_lengths[state_id] = ceil(log2(len(emissions_list))) if emissions_list else 0
+        self._log_probability_lists = None
+        self._predecessors = None
+        self._arc_lists = None
+        self._emitting_state_lists = None
+        self._null_closure = None
+
+    # The tables as nested lists, for the pure Python decoder (indexing NumPy arrays one cell at a time is slow).
+    def get_log_probability_lists(self):
+        if self._log_probability_lists is None:
+            self._log_probability_lists = (self.transition_log_probabilities.tolist(),
+                                           self.emission_log_probabilities.tolist())
+        return self._log_probability_lists
+
+    # Returns a boolean array of the states that are on some path from INITIAL_STATE to FINAL_STATE, i.e. that are
+    # reachable from INITIAL_STATE and can reach FINAL_STATE. An inner state emits an entry on every visit, so one
+    # with no emissions is not on any path, and neither are the states that are connected only through it.
+    def get_live_states(self):
+        initial_state_id = self.state_ids[INITIAL_STATE]
+        final_state_id = self.state_ids[FINAL_STATE]
+        passable = [state_id in (initial_state_id, final_state_id) or self.emission_counts[state_id] > 0
+                    for state_id in range(len(self.states))]
+        previous_states = [[] for _ in self.states]
+        for state_id, next_state_ids in enumerate(self.transition_codes):
+            for next_state_id in next_state_ids:
+                previous_states[next_state_id].append(state_id)
+
+        reachable = self._get_connected_states(initial_state_id, self.transition_codes, passable)
+        co_reachable = self._get_connected_states(final_state_id, previous_states, passable)
+        return np.array([reachable[state_id] and co_reachable[state_id] for state_id in range(len(self.states))])
 
-
-
+    @staticmethod
+    def _get_connected_states(start_state_id, neighbors, passable):
+        connected = [False] * len(neighbors)
+        connected[start_state_id] = True
+        pending_state_ids = [start_state_id]
+        while pending_state_ids:
+            for neighbor_id in neighbors[pending_state_ids.pop()]:
+                if passable[neighbor_id] and not connected[neighbor_id]:
+                    connected[neighbor_id] = True
+                    pending_state_ids.append(neighbor_id)
+        return connected
+
+    # Returns the arcs between live states (see get_live_states) as CSR arrays over their target states:
+    # (predecessor_offsets, predecessor_states, predecessor_log_probabilities), where the arcs into the state id s are
+    # at predecessor_offsets[s]:predecessor_offsets[s + 1] of the other two, by ascending source state id.
+    # Decoders visit only these arcs, instead of every pair of states.
+    def get_predecessors(self):
+        if self._predecessors is None:
+            live_states = self.get_live_states()
+            incoming_log_probabilities = self.transition_log_probabilities.T
+            arcs = (incoming_log_probabilities != -np.inf) & live_states[:, None] & live_states[None, :]
+            predecessor_offsets = np.zeros(len(self.states) + 1, dtype=np.int64)
+            np.cumsum(arcs.sum(axis=1), out=predecessor_offsets[1:])
+            self._predecessors = (predecessor_offsets, np.nonzero(arcs)[1], incoming_log_probabilities[arcs])
+        return self._predecessors
+
+    # The arcs of get_predecessors as lists for the pure Python decoders: (predecessor_lists, successor_lists), where
+    # predecessor_lists[s] holds a (source state id, log probability) pair per arc into the state id s, and
+    # successor_lists[s] a (target state id, log probability) pair per arc out of it into an inner state (i.e. the
+    # arcs that are followed by an emission), by ascending state ids.
+    def get_arc_lists(self):
+        if self._arc_lists is None:
+            predecessor_offsets, predecessor_states, predecessor_log_probabilities = self.get_predecessors()
+            predecessor_states = predecessor_states.tolist()
+            predecessor_log_probabilities = predecessor_log_probabilities.tolist()
+            predecessor_lists = []
+            successor_lists = [[] for _ in self.states]
+            for state_id in range(len(self.states)):
+                start, end = int(predecessor_offsets[state_id]), int(predecessor_offsets[state_id + 1])
+                predecessor_lists.append(list(zip(predecessor_states[start:end],
+                                                  predecessor_log_probabilities[start:end])))
+                if 0 < state_id < len(self.states) - 1:   # an inner state
+                    for previous_state_id, log_probability in predecessor_lists[state_id]:
+                        successor_lists[previous_state_id].append((state_id, log_probability))
+            self._arc_lists = (predecessor_lists, successor_lists)
+        return self._arc_lists
+
+    # Returns a list that holds, for every emission id, a (state id, log probability) pair per live state (see
+    # get_live_states) that emits it, by ascending state ids. Decoders expand a matched entry only into these states.
+    def get_emitting_state_lists(self):
+        if self._emitting_state_lists is None:
+            emitting = (self.emission_log_probabilities != -np.inf) & self.get_live_states()[None, :]
+            emission_ids, state_ids = np.nonzero(emitting)
+            self._emitting_state_lists = [[] for _ in self.emissions]
+            for emission_id, state_id, log_probability in zip(emission_ids.tolist(), state_ids.tolist(),
+                                                              self.emission_log_probabilities[emitting].tolist()):
+                self._emitting_state_lists[emission_id].append((state_id, log_probability))
+        return self._emitting_state_lists
+
+    # Returns the closure of the null segment moves (a transition into a state that emits the null segment, with
+    # that emission) between the live states, as lists for the pure Python decoders: for every state id, a
+    # (target state id, log probability, last state id) triple per other state that it reaches by one or more
+    # moves, where the log probability is that of the best such path, and the last state id is the one the path
+    # enters the target from (for the backtrace). It is computed once, by the (max, +) closure of the NumPy decoders
+    # (see viterbi_with_numpy.viterbi.MaxPlusClosure), so both decoders score the paths alike.
+    # Cycles of null moves have negative log probabilities (a cycle of certain moves is not live), so the best paths
+    # are simple.
+    def get_null_closure_lists(self, null_segment_id):
+        from viterbi_with_numpy.viterbi import MaxPlusClosure
+
+        if self._null_closure is None or self._null_closure[0] != null_segment_id:
+            live_states = self.get_live_states()
+            null_moves = self.transition_log_probabilities + self.emission_log_probabilities[null_segment_id][None, :]
+            null_moves[~(live_states[:, None] & live_states[None, :])] = -np.inf
+            closure, last_states = MaxPlusClosure(null_moves)
+
+            closure_lists = []
+            for state_id, (log_probabilities, state_last_states) in enumerate(zip(closure.tolist(),
+                                                                                  last_states.tolist())):
+                closure_lists.append([(target_state_id, log_probability, state_last_states[target_state_id])
+                                      for target_state_id, log_probability in enumerate(log_probabilities)
+                                      if log_probability != float("-inf") and target_state_id != state_id])
+            self._null_closure = (null_segment_id, closure_lists)
+        return self._null_closure[1]
+
+
+
+
+# A trie over the lexicon entries (for inner usage), keyed by the segment ids of the entries.
+# Each node is a dict from a segment id to its child node, and the entry that ends at a node is kept under the
+# None key. The null segment is the empty entry, so it ends at the root.
+class _LexiconTrie:
+    def __init__(self):
+        self.root = {}
+
+    def __contains__(self, entry_ids):
+        node = self.root
+        for segment_id in entry_ids:
+            node = node.get(segment_id)
+            if node is None:
+                return False
+        return None in node
+
+    def add(self, entry_ids, entry):
+        node = self.root
+        for segment_id in entry_ids:
+            node = node.setdefault(segment_id, {})
+        node[None] = entry
+
+    def remove(self, entry_ids):
+        path = [self.root]
+        for segment_id in entry_ids:
+            node = path[-1].get(segment_id)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop(None, None)
+
+        # prune the nodes that no longer lead to any entry
+        for depth in range(len(entry_ids), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][entry_ids[depth - 1]]
+
+    # Returns all the (non null) entries that start at start_position of the observation ids, shortest first.
+    def get_matches(self, observation_ids, start_position):
+        matches = []
+        node = self.root
+        for position in range(start_position, len(observation_ids)):
+            node = node.get(observation_ids[position])
+            if node is None:
+                break
+            if None in node:
+                matches.append(node[None])
+        return matches
+
+
+# The entries are kept as strings in a LexiconEntries (a given one is shared, so changes of a lexical modifier to it
+# can be rolled back through the lexicon), and are interned into the segments symbol table (a segment to a dense id)
+# for the trie, so that observations are looked up by their segment ids. Repeated entries of a list are kept once.
 class Lexicon:
     def __init__(self, entries_list):
-        self.entries = entries_list
+        if isinstance(entries_list, LexiconEntries):
+            self.entries = entries_list
+        else:
+            self.entries = LexiconEntries(dict.fromkeys(entries_list))
+        self.segments = SymbolTable()
+        self._trie = _LexiconTrie()
+        for entry in self.entries:
+            self._trie.add(self.segments.intern_sequence(entry), entry)
+        self._fingerprint = None
+        self._alphabet_translation = (None, 0, None)    # (corpus alphabet, segments count, its segment ids)
 
     def get_maximal_entry_length(self):
         return max([len(entry) for entry in self.entries])
 
-
-
-hmm = HMM(hmm_dict)
-simple_hmm = HMM(simple_hmm_dict)
-simple_lexicon = Lexicon(simple_lexicon_list)
-
-
-
-
-
-
-# A Viterbi prefix, that holds information regarding a prefix of data (for inner usage).
-# Each Viterbi cell in the viterbi_seg algorithm hold a dictionary of such prefixes.
-class _ViterbiPrefix:
-    def __init__(self, prefix_string, probability, position):
-        self.prefix_string = prefix_string
-        self.probability = probability
-        self.position = position
-        self.back_pointer = []
-
-    def __len__(self):
-        return len(self.prefix_string)
-
-    def __str__(self):
-        return self.prefix_string
-
-    def set_back_pointers(self, state, prefix_string, column):
-        self.back_pointer = [state, prefix_string, column]
-
-    def get_state_back_pointer(self):
-        return self.back_pointer[0]
-
-    def get_prefix_back_pointer(self):
-        return self.back_pointer[1]
-
-    def get_column_back_pointer(self):
-        return self.back_pointer[2]
+    # Only the entries are pickled, the trie is rebuilt when unpickled.
+    def __getstate__(self):
+        return {'entries': self.entries.get_entries()}
+
+    def __setstate__(self, state):
+        self.__init__(state['entries'])
+
+    # entries should be changed only through add_entry and remove_entry, so the trie is kept in sync
+    def add_entry(self, entry):
+        self.update_modified_entries([entry], [])
+
+    def remove_entry(self, entry):
+        self.update_modified_entries([], [entry])
+
+    # Brings the entries and the trie up to date after a lexical modifier has changed the entries (the lexicon's
+    # own, or a list that they were made of), given the ([new], [old]) entries that the modifier returned.
+    def update_modified_entries(self, added_entries, removed_entries):
+        for entry in removed_entries:
+            if entry in self.entries:
+                self.entries.remove(entry)
+        for entry in added_entries:
+            if entry not in self.entries:
+                self.entries.append(entry)
+        self._update_trie(added_entries, removed_entries)
+
+    def _update_trie(self, added_entries, removed_entries):
+        for entry in removed_entries:
+            self._trie.remove(self.segments.get_ids(entry))
+        for entry in added_entries:
+            self._trie.add(self.segments.intern_sequence(entry), entry)
+        self._fingerprint = None
+
+    # See LexiconEntries: the changes since a snapshot can be rolled back (e.g. of a rejected neighbour), and are
+    # forgotten on commit.
+    def snapshot(self):
+        return self.entries.snapshot()
+
+    # An entry can be both restored and dropped (e.g. added and then removed since the snapshot), so the trie follows
+    # whether it is an entry after the rollback.
+    def rollback(self, snapshot=0):
+        restored_entries, dropped_entries = self.entries.rollback(snapshot)
+        changed_entries = set(restored_entries) | set(dropped_entries)
+        self._update_trie([entry for entry in changed_entries if entry in self.entries],
+                          [entry for entry in changed_entries if entry not in self.entries])
+
+    def commit(self):
+        self.entries.commit()
+
+    # A stable hash of the entries (the same in every process).
+    def get_fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = sha1(repr(self.entries.get_entries()).encode()).hexdigest()
+        return self._fingerprint
+
+    def has_entry(self, entry):
+        return entry in self.entries
+
+    # The segment ids of an observation: a string, or a view into a corpus (see corpus.CorpusDatum), whose symbol
+    # ids are translated without building a string. Segments that are not in the lexicon get -1.
+    def get_observation_ids(self, observation):
+        symbol_ids = getattr(observation, 'symbol_ids', None)
+        if symbol_ids is None:
+            return self.segments.get_ids(observation)
+
+        # the translation is kept until another corpus is used, or new segments are interned
+        alphabet, segments_count, translation = self._alphabet_translation
+        if alphabet is not observation.alphabet or segments_count != len(self.segments):
+            translation = np.array(self.segments.get_ids(observation.alphabet), dtype=np.int64)
+            self._alphabet_translation = (observation.alphabet, len(self.segments), translation)
+        return translation[symbol_ids].tolist()
+
+    # Returns the (non null) entries that start at start_position of the observation, shortest first.
+    def get_matches(self, observation, start_position):
+        return self._trie.get_matches(self.get_observation_ids(observation), start_position)
+
+    # The same as get_matches, for the ids returned by get_observation_ids.
+    def get_matches_by_ids(self, observation_ids, start_position):
+        return self._trie.get_matches(observation_ids, start_position)
+
+    # Returns a list that holds, for every position of the observation, the entries that start at that position.
+    def get_matches_by_position(self, observation):
+        observation_ids = self.get_observation_ids(observation)
+        return [self._trie.get_matches(observation_ids, position) for position in range(len(observation_ids))]
+
+
+
+
+# The storage of the segmentation lattice cells, as parallel NumPy arrays indexed by [position, state]: the best
+# log probability of a path that ends at that position of the data in that state, and the state, position and
+# emission id it came from. The buffers are allocated once and reused by every decode that gets the workspace
+# (growing to the largest lattice decoded so far), instead of creating an object per cell.
+class ViterbiWorkspace:
+    def __init__(self):
+        self.capacity = 0
+        self._buffers = None
+
+    # Returns (scores, back_states, back_positions, back_emissions) of the given shape, with no cells filled yet.
+    def prepare(self, shape):
+        size = int(np.prod(shape))
+        if size > self.capacity:
+            self.capacity = max(size, 2 * self.capacity)
+            self._buffers = (np.empty(self.capacity), np.empty(self.capacity, dtype=np.int32),
+                             np.empty(self.capacity, dtype=np.int32), np.empty(self.capacity, dtype=np.int32))
+
+        scores, back_states, back_positions, back_emissions = (buffer[:size].reshape(shape) for buffer in self._buffers)
+        scores.fill(float("-inf"))
+        back_states.fill(-1)
+        back_positions.fill(-1)
+        back_emissions.fill(-1)
+        return scores, back_states, back_positions, back_emissions
+
+
+# The workspace of the decodes that are not given one, per thread (so threads do not decode into the same buffers).
+_thread_data = local()
+
+
+def _get_default_workspace():
+    workspace = getattr(_thread_data, 'workspace', None)
+    if workspace is None:
+        workspace = _thread_data.workspace = ViterbiWorkspace()
+    return workspace
 
 
 ViterbiResult = namedtuple('ViterbiResult', ['states_path', 'emissions_path'])
 
 # A variant of Viterbi that works with unsegmented data (i.e. no separation between lexical words),
 # and chooses the best possible sequence of states which reflects the best segmentation.
-# Each cell contains a dictionary of relevant prefixes up to that point.
+# The lattice is indexed by the position in the data where a lexical entry ends: the cell [position, state] holds
+# the best path that reached that position in that state (see ViterbiWorkspace). From every position we only extend
+# with the lexical entries that start exactly there.
+# A beam bounds the time of decoding long data with large lexicons: only the beam_size best cells of a position,
+# and those within beam_width (in log probability) of its best cell, are extended. The result may then not be the
+# best one (see get_beam_accuracy_report). With no beam (the default) the search is exhaustive.
 # Assumptions:
 # a) obs is not the empty string.
 # b) each char of obs exists in H.lexicon.
-def viterbi(hmm, lexicon, observation):
-    observation_length = len(observation)
-    viterbi_table = {state: [{} for _ in range(observation_length)] for state in hmm.get_states()}  # Each cell holds a
-                                                                                                    # dict of lexical entries
-    # Initialize the final cell
-    final_cell = _ViterbiPrefix('', float("-inf"), observation_length)
-
-    initial_prefixes = get_lexical_prefixes(lexicon, observation, [0])
-    seen_positions = set()
-
-    # Initialize the first column
-    for current_state in hmm.inner_states:
-        for prefix_string in initial_prefixes:
-            # if initial prob or emission prob are 0, then the probability of printing this prefix is 0.
-            if not hmm.get_transition_probability(INITIAL_STATE, current_state) or \
-               not hmm.get_emission_probability(current_state, prefix_string):
-                viterbi_table[current_state][0][prefix_string] = _ViterbiPrefix(prefix_string, 0, len(prefix_string))
-            else:
-                log_probability = log(hmm.get_transition_probability(INITIAL_STATE, current_state)) + \
-                                  log(hmm.get_emission_probability(current_state, prefix_string))
-                viterbi_table[current_state][0][prefix_string] = _ViterbiPrefix(prefix_string, log_probability,
-                                                                                len(prefix_string))
-
-            viterbi_table[current_state][0][prefix_string].set_back_pointers(INITIAL_STATE, '', -1)
-
-            seen_positions.add(viterbi_table[current_state][0][prefix_string].position)
-
-
-    # fill out the rest of the table
-    # (we can always compose the data out of basic lexical elements)
-    for observation_position in range(1, observation_length):
-        # find cell prefixes
-        column_prefixes = get_lexical_prefixes(lexicon, observation, seen_positions)
-        seen_positions.clear()
-
-        for current_state in hmm.inner_states:
-            # fill the cell with the relevant prefixes
-            for prefix_string in column_prefixes:
-                viterbi_table[current_state][observation_position][prefix_string] = _ViterbiPrefix(prefix_string,
-                                                                                                   float("-inf"), -1)
-
-            for current_viterbi_prefix in viterbi_table[current_state][observation_position].values():
-                for previous_state in hmm.inner_states:
-                    for previous_viterbi_prefix in viterbi_table[previous_state][observation_position-1].values():
-                        previous_position = previous_viterbi_prefix.position
-
-                        # if the previous prefix and current prefix fit the data in the corresponding place,
-                        # then update the probability.
-                        combined_prefixes = str(previous_viterbi_prefix) + str(current_viterbi_prefix)
-                        start_index = previous_position - len(previous_viterbi_prefix)
-                        end_index = previous_position + len(current_viterbi_prefix)
-                        if combined_prefixes == observation[start_index:end_index]:
-                            if hmm.get_transition_probability(previous_state, current_state) \
-                                    and hmm.get_emission_probability(current_state, str(current_viterbi_prefix)) \
-                                    and previous_viterbi_prefix.probability:
-
-                                probability = previous_viterbi_prefix.probability + \
-                                              log(hmm.get_transition_probability(previous_state, current_state)) + \
-                                              log(hmm.get_emission_probability(current_state, str(current_viterbi_prefix)))
-
-                                if current_viterbi_prefix.probability < probability:
-                                    current_viterbi_prefix.probability = probability
-                                    current_viterbi_prefix.position = (previous_viterbi_prefix.position + len(current_viterbi_prefix))
-                                    current_viterbi_prefix.set_back_pointers(previous_state, str(previous_viterbi_prefix),
-                                                                             observation_position-1)
-
-                # Add the length seen so far, so that next iteration could easily find proper prefixes
-                seen_positions.add(current_viterbi_prefix.position)
-
-                # In case we've seen all input data, update the final cell
-                if current_viterbi_prefix.position == observation_length:
-                    if hmm.get_transition_probability(current_state, FINAL_STATE):
-                        final_transition = current_viterbi_prefix.probability + \
-                                           log(hmm.get_transition_probability(current_state, FINAL_STATE))
-
-                        if final_cell.probability < final_transition:
-                            final_cell.probability = final_transition
-                            final_cell.set_back_pointers(current_state, str(current_viterbi_prefix), observation_position)
-
-    if final_cell.probability == float("-inf"):
+def viterbi(hmm, lexicon, observation, workspace=None, beam_size=VITERBI_BEAM_SIZE, beam_width=VITERBI_BEAM_WIDTH):
+    instrumentation = get_instrumentation()
+    with instrumentation.call('viterbi', observation_length=len(observation)):
+        compiled_hmm = hmm.get_compiled()
+        with instrumentation.phase('prefix_lookup'):
+            matches_by_position = lexicon.get_matches_by_position(observation)
+        if instrumentation.enabled:
+            instrumentation.count('prefix_matches', sum(len(matches) for matches in matches_by_position))
+
+        null_segment_id = compiled_hmm.emission_ids.get(NULL_SEGMENT) if lexicon.has_entry(NULL_SEGMENT) else None
+        lattice = (workspace or _get_default_workspace()).prepare((len(observation) + 1, len(compiled_hmm.states)))
+        with instrumentation.phase('table_fill'):
+            _fill_lattice(compiled_hmm, lattice, matches_by_position, null_segment_id, beam_size, beam_width)
+        if instrumentation.enabled:
+            instrumentation.count('cells_created', int(np.count_nonzero(lattice[0] != float("-inf"))))
+
+        with instrumentation.phase('backtrace'):
+            return _backtrace(compiled_hmm, lattice, len(observation))
+
+
+def _fill_lattice(compiled_hmm, lattice, matches_by_position, null_segment_id, beam_size, beam_width):
+    _, successor_lists = compiled_hmm.get_arc_lists()
+    emitting_state_lists = compiled_hmm.get_emitting_state_lists()
+    states_count = len(compiled_hmm.states)
+    observation_length = len(matches_by_position)
+    instrumentation = get_instrumentation()
+
+    scores, back_states, back_positions, back_emissions = lattice
+    scores[0, compiled_hmm.state_ids[INITIAL_STATE]] = 0
+
+    for position in range(observation_length + 1):
+        if null_segment_id is not None:
+            _relax_null_segment(compiled_hmm, lattice, position, null_segment_id)
+
+        if position == observation_length or not matches_by_position[position]:
+            continue
+        position_scores = scores[position].tolist()
+        previous_states = [state for state in range(states_count) if position_scores[state] != float("-inf")]
+        if not previous_states:
+            continue
+        if beam_size is not None or beam_width is not None:
+            previous_states = _prune_beam(position_scores, previous_states, beam_size, beam_width)
+        if instrumentation.enabled:
+            instrumentation.count('transitions_evaluated',
+                                  sum(len(successor_lists[previous_state]) for previous_state in previous_states))
+
+        # the best way into every inner state from this position, shared by all the entries that start here.
+        # Only the arcs out of the cells of the position are visited (see CompiledHMM.get_arc_lists).
+        into_states = {}
+        for previous_state in previous_states:
+            previous_score = position_scores[previous_state]
+            for current_state, log_probability in successor_lists[previous_state]:
+                score = previous_score + log_probability
+                if current_state not in into_states or into_states[current_state][0] < score:
+                    into_states[current_state] = (score, previous_state)
+
+        for entry in matches_by_position[position]:
+            emission_id = compiled_hmm.emission_ids.get(entry)
+            if emission_id is None:
+                continue
+
+            # the entry is expanded only into the states that emit it
+            end_position = position + len(entry)
+            end_scores = scores[end_position]
+            for current_state, log_probability in emitting_state_lists[emission_id]:
+                into_state = into_states.get(current_state)
+                if into_state is None:
+                    continue
+                into_score, previous_state = into_state
+                score = into_score + log_probability
+                if end_scores[current_state] < score:
+                    end_scores[current_state] = score
+                    back_states[end_position, current_state] = previous_state
+                    back_positions[end_position, current_state] = position
+                    back_emissions[end_position, current_state] = emission_id
+
+
+def _backtrace(compiled_hmm, lattice, observation_length):
+    predecessor_lists, _ = compiled_hmm.get_arc_lists()
+    initial_state_id = compiled_hmm.state_ids[INITIAL_STATE]
+    final_state_id = compiled_hmm.state_ids[FINAL_STATE]
+    scores, back_states, back_positions, back_emissions = lattice
+
+    # find the best transition to the final state from the cells that cover all the data
+    final_score = float("-inf")
+    final_back_state = None
+    final_scores = scores[observation_length].tolist()
+    for state, log_probability in predecessor_lists[final_state_id]:
+        if final_score < final_scores[state] + log_probability:
+            final_score = final_scores[state] + log_probability
+            final_back_state = state
+
+    if final_back_state is None:
         return None
 
     # Follow back pointers to find the best path
-    current_state = final_cell.get_state_back_pointer()
-    current_viterbi_prefix = final_cell.get_prefix_back_pointer()
-    current_column = final_cell.get_column_back_pointer()
+    backward_states_path = [FINAL_STATE]
+    backward_emissions_path = []
+    current_state = final_back_state
+    current_position = observation_length
+    while current_state != initial_state_id:
+        backward_states_path.append(compiled_hmm.states[current_state])
+        backward_emissions_path.append(compiled_hmm.emissions[int(back_emissions[current_position, current_state])])
+        current_state, current_position = int(back_states[current_position, current_state]), \
+                                          int(back_positions[current_position, current_state])
+
+    backward_states_path.append(INITIAL_STATE)
 
-    # Paths to follow
-    backward_states_path = [FINAL_STATE, current_state]
-    backward_emissions_path = [current_viterbi_prefix]
-
-    while True:
-        current_cell = viterbi_table[current_state][current_column][current_viterbi_prefix]
+    return ViterbiResult(list(reversed(backward_states_path)), list(reversed(backward_emissions_path)))
 
-        current_state = current_cell.get_state_back_pointer()
-        current_viterbi_prefix = current_cell.get_prefix_back_pointer()
-        current_column = current_cell.get_column_back_pointer()
 
-        if current_state == INITIAL_STATE:
-            backward_states_path += [INITIAL_STATE]
-            break
+# The same as viterbi, but fills the lattice with NumPy array operations over the states (see SegmentationDecoder),
+# which pays off for HMMs with many states and long data.
+def vectorized_viterbi(hmm, lexicon, observation, workspace=None):
+    from viterbi_with_numpy.viterbi import SegmentationDecoder
+
+    instrumentation = get_instrumentation()
+    with instrumentation.call('vectorized_viterbi', observation_length=len(observation)):
+        compiled_hmm = hmm.get_compiled()
+        null_segment_id = compiled_hmm.emission_ids.get(NULL_SEGMENT) if lexicon.has_entry(NULL_SEGMENT) else None
+        decoder = SegmentationDecoder(compiled_hmm, null_segment_id)
+
+        with instrumentation.phase('prefix_lookup'):
+            matches_by_position = lexicon.get_matches_by_position(observation)
+        if instrumentation.enabled:
+            instrumentation.count('prefix_matches', sum(len(matches) for matches in matches_by_position))
+        with instrumentation.phase('table_fill'):   # and the backtrace
+            decoded_path = decoder.Decode(matches_by_position, workspace or _get_default_workspace())
+    if decoded_path is None:
+        return None
 
-        backward_states_path += [current_state]
-        backward_emissions_path += [current_viterbi_prefix]
+    states_path, emissions_path = decoded_path
+    return ViterbiResult([compiled_hmm.states[state_id] for state_id in states_path],
+                         [compiled_hmm.emissions[emission_id] for emission_id in emissions_path])
+
+
+# Decodes a whole corpus, with the compiled tables shared by all the data. The data is sorted by length and
+# decoded in batches of batch_size, each one as a single padded NumPy trellis (see _get_batches).
+# Returns a list with the ViterbiResult (or None) of every datum, in the order of the data.
+def viterbi_batch(hmm, lexicon, data, batch_size=VITERBI_BATCH_SIZE):
+    return viterbi_and_forward_batch(hmm, lexicon, data, with_forward=False, batch_size=batch_size)[0]
+
+
+# The sum-product counterpart of viterbi: the log probability of the data by the HMM, summed over all its
+# segmentations and states paths (float("-inf") if it can not be parsed). -log2 of it is the exact code length
+# of the data by the grammar.
+def forward(hmm, lexicon, observation):
+    return forward_batch(hmm, lexicon, [observation])[0]
+
+
+# Returns a list with the forward log probability of every datum, in the order of the data.
+def forward_batch(hmm, lexicon, data, batch_size=VITERBI_BATCH_SIZE):
+    return viterbi_and_forward_batch(hmm, lexicon, data, with_viterbi=False, batch_size=batch_size)[1]
+
+
+# Returns (the viterbi_batch results, the forward_batch log probabilities) of the data, both computed in the same
+# pass over the lattice of every batch. The one that is not asked for is None.
+def viterbi_and_forward_batch(hmm, lexicon, data, with_viterbi=True, with_forward=True,
+                              batch_size=VITERBI_BATCH_SIZE, max_cells=VITERBI_BATCH_MAX_CELLS):
+    from viterbi_with_numpy.viterbi import SegmentationDecoder
+
+    compiled_hmm = hmm.get_compiled()
+    null_segment_id = compiled_hmm.emission_ids.get(NULL_SEGMENT) if lexicon.has_entry(NULL_SEGMENT) else None
+    decoder = SegmentationDecoder(compiled_hmm, null_segment_id)
+
+    instrumentation = get_instrumentation()
+    viterbi_results = [None] * len(data) if with_viterbi else None
+    log_probabilities = [None] * len(data) if with_forward else None
+    for batch_indices in _get_batches(data, batch_size, len(compiled_hmm.states), max_cells):
+        with instrumentation.call('viterbi_and_forward_batch', data_count=len(batch_indices)):
+            with instrumentation.phase('prefix_lookup'):
+                matches_by_position_list = [lexicon.get_matches_by_position(data[datum_index])
+                                            for datum_index in batch_indices]
+            if instrumentation.enabled:
+                instrumentation.count('prefix_matches', sum(len(matches) for matches_by_position in
+                                                            matches_by_position_list for matches in matches_by_position))
+            with instrumentation.phase('table_fill'):   # and the backtrace
+                decoded_paths, batch_log_probabilities = \
+                    decoder.ScoreBatch(matches_by_position_list, with_viterbi, with_forward)
+        if with_forward:
+            for datum_index, log_probability in zip(batch_indices, batch_log_probabilities.tolist()):
+                log_probabilities[datum_index] = log_probability
+        if not with_viterbi:
+            continue
+        for datum_index, decoded_path in zip(batch_indices, decoded_paths):
+            if decoded_path is not None:
+                states_path, emissions_path = decoded_path
+                viterbi_results[datum_index] = \
+                    ViterbiResult([compiled_hmm.states[state_id] for state_id in states_path],
+                                  [compiled_hmm.emissions[emission_id] for emission_id in emissions_path])
+
+    return viterbi_results, log_probabilities
+
+
+# Decodes the data by every candidate (hmm, lexicon) pair, where the HMMs have the same states and transitions
+# (e.g. the neighbours of a hypothesis by lexical modifications). The data is looked up once in the union of the
+# candidates' lexicons, and every batch of the data is decoded by all the candidates in a single pass (see
+# CandidatesDecoder), with batch_size data and candidate pairs (and max_cells trellis cells) at a time.
+# Returns a list with the viterbi_batch results of every candidate.
+def viterbi_candidates_batch(hmms, lexicons, data, batch_size=VITERBI_BATCH_SIZE, max_cells=VITERBI_BATCH_MAX_CELLS):
+    from viterbi_with_numpy.viterbi import CandidatesDecoder
+
+    compiled_hmms = [hmm.get_compiled() for hmm in hmms]
+    states = compiled_hmms[0].states
+    transition_log_probabilities = compiled_hmms[0].transition_log_probabilities
+    for compiled_hmm in compiled_hmms[1:]:
+        if compiled_hmm.states != states or \
+                not np.array_equal(compiled_hmm.transition_log_probabilities, transition_log_probabilities):
+            raise ValueError("the candidates differ in their states or transitions")
+
+    # every entry of the union of the lexicons has a single emission id, whose row is -inf in the candidates that
+    # do not have it
+    union_lexicon = Lexicon(list(dict.fromkeys(entry for lexicon in lexicons for entry in lexicon.entries)))
+    emissions = SymbolTable(union_lexicon.entries)
+    emission_log_probabilities = np.full((len(hmms), len(emissions), len(states)), -np.inf)
+    for candidate, (compiled_hmm, lexicon) in enumerate(zip(compiled_hmms, lexicons)):
+        for entry in lexicon.entries:
+            emission_id = compiled_hmm.emission_ids.get(entry)
+            if emission_id is not None:
+                emission_log_probabilities[candidate, emissions.get_id(entry)] = \
+                    compiled_hmm.emission_log_probabilities[emission_id]
+    decoder = CandidatesDecoder(transition_log_probabilities, emission_log_probabilities, emissions.ids,
+                                emissions.get_id(NULL_SEGMENT),
+                                np.array([compiled_hmm.get_live_states() for compiled_hmm in compiled_hmms]))
+
+    candidates_results = [[None] * len(data) for _ in hmms]
+    for batch_indices in _get_batches(data, max(1, batch_size // len(hmms)), len(hmms) * len(states), max_cells):
+        matches_by_position_list = [union_lexicon.get_matches_by_position(data[datum_index])
+                                    for datum_index in batch_indices]
+        decoded_paths, _ = decoder.ScoreBatch(matches_by_position_list * len(hmms),
+                                              rowCandidates=np.repeat(np.arange(len(hmms)), len(batch_indices)))
+        for row, decoded_path in enumerate(decoded_paths):
+            if decoded_path is not None:
+                candidate, batch_index = divmod(row, len(batch_indices))
+                states_path, emissions_path = decoded_path
+                candidates_results[candidate][batch_indices[batch_index]] = \
+                    ViterbiResult([states[state_id] for state_id in states_path],
+                                  [emissions[emission_id] for emission_id in emissions_path])
+
+    return candidates_results
+
+
+# Splits the indices of the data, by ascending lengths of the data, into batches of at most batch_size data, whose
+# padded trellises of (batch, longest data + 1, states_count) cells have at most max_cells cells, so the memory of a
+# batch is bounded for long data too (a datum that is longer than that is a batch of its own).
+def _get_batches(data, batch_size, states_count, max_cells):
+    batches = []
+    batch_indices = []
+    for datum_index in sorted(range(len(data)), key=lambda datum_index: len(data[datum_index])):
+        batch_cells = (len(batch_indices) + 1) * (len(data[datum_index]) + 1) * states_count
+        if batch_indices and (len(batch_indices) == batch_size or batch_cells > max_cells):
+            batches.append(batch_indices)
+            batch_indices = []
+        batch_indices.append(datum_index)
+    if batch_indices:
+        batches.append(batch_indices)
+    return batches
+
+
+# Null segments do not consume data, so they move between states of the same lattice position. Every cell of the
+# position is extended at once by the best paths of null segments out of its state (see
+# CompiledHMM.get_null_closure_lists), so paths with any number of consecutive null segments are found in a single
+# step. The cell a path enters through is then extended by the same path, so the backtrace follows it hop by hop.
+def _relax_null_segment(compiled_hmm, lattice, position, null_segment_id):
+    null_closure_lists = compiled_hmm.get_null_closure_lists(null_segment_id)
+    scores, back_states, back_positions, back_emissions = lattice
+
+    position_scores = scores[position].tolist()
+    source_cells = [(state, score) for state, score in enumerate(position_scores) if score != float("-inf")]
+    instrumentation = get_instrumentation()
+    if instrumentation.enabled:
+        instrumentation.count('transitions_evaluated',
+                              sum(len(null_closure_lists[source_state]) for source_state, _ in source_cells))
+    for source_state, source_score in source_cells:
+        for current_state, log_probability, last_state in null_closure_lists[source_state]:
+            score = source_score + log_probability
+            if position_scores[current_state] < score:
+                position_scores[current_state] = score
+                back_states[position, current_state] = last_state
+                back_positions[position, current_state] = position
+                back_emissions[position, current_state] = null_segment_id
+
+    scores[position] = position_scores
+
+
+# Keeps the beam_size best of the states, and only those within beam_width of the best one.
+def _prune_beam(position_scores, states, beam_size, beam_width):
+    if beam_width is not None:
+        minimal_score = max(position_scores[state] for state in states) - beam_width
+        states = [state for state in states if position_scores[state] >= minimal_score]
+    if beam_size is not None and len(states) > beam_size:
+        states = nlargest(beam_size, states, key=position_scores.__getitem__)
+    return states
+
+
+# Decodes every datum with the beam and exhaustively, and reports how many of the data the beam decodes differently,
+# and how many of those it can not parse at all.
+def get_beam_accuracy_report(hmm, lexicon, data, beam_size=VITERBI_BEAM_SIZE, beam_width=VITERBI_BEAM_WIDTH):
+    data_count = differing_count = unparsable_count = 0
+    for datum in data:
+        exact_result = viterbi(hmm, lexicon, datum, beam_size=None, beam_width=None)
+        beam_result = viterbi(hmm, lexicon, datum, beam_size=beam_size, beam_width=beam_width)
+        data_count += 1
+        if beam_result != exact_result:
+            differing_count += 1
+            if beam_result is None:
+                unparsable_count += 1
+
+    return {'data': data_count, 'differing': differing_count, 'unparsable': unparsable_count,
+            'differing_ratio': differing_count / data_count if data_count else 0.0}
+
+
+# A path of the n-best lattice: its log probability, the state and emission id it ends with, and the path it extends.
+_Hypothesis = namedtuple('_Hypothesis', ['score', 'state', 'emission', 'previous'])
+
+
+# Returns the n best ViterbiResults of the data, best first (fewer if the data has fewer parses, and an empty list if
+# it can not be parsed). The lattice is the one of viterbi, but every cell keeps the n best paths that reach it.
+def viterbi_n_best(hmm, lexicon, observation, n):
+    compiled_hmm = hmm.get_compiled()
+    transition_log_probabilities, _ = compiled_hmm.get_log_probability_lists()
+    _, successor_lists = compiled_hmm.get_arc_lists()
+    emitting_state_lists = compiled_hmm.get_emitting_state_lists()
+    initial_state_id = compiled_hmm.state_ids[INITIAL_STATE]
+    final_state_id = compiled_hmm.state_ids[FINAL_STATE]
 
-    return ViterbiResult(list(reversed(backward_states_path)), list(reversed(backward_emissions_path)))
+    observation_length = len(observation)
+    matches_by_position = lexicon.get_matches_by_position(observation)
+    null_segment_id = compiled_hmm.emission_ids.get(NULL_SEGMENT) if lexicon.has_entry(NULL_SEGMENT) else None
+
+    # lattice[position] is a dictionary from a state to the list of the best paths that reach it, best first
+    lattice = [{} for _ in range(observation_length + 1)]
+    lattice[0][initial_state_id] = [_Hypothesis(0.0, initial_state_id, None, None)]
+
+    for position in range(observation_length + 1):
+        cells = lattice[position]
+        if null_segment_id is not None:
+            _relax_null_segment_n_best(compiled_hmm, cells, null_segment_id, n)
+
+        if position == observation_length or not matches_by_position[position] or not cells:
+            continue
+        # the ways into every inner state from this position, by the arcs out of the cells of the position
+        into_states = {}
+        for previous_state, cell in cells.items():
+            for current_state, log_probability in successor_lists[previous_state]:
+                into_states.setdefault(current_state, []).extend((hypothesis.score + log_probability, hypothesis)
+                                                                 for hypothesis in cell)
+
+        # the n best ways into a state from this position, shared by all the entries that start here (computed for
+        # the states that emit any of them)
+        into_hypotheses = {}
+        for entry in matches_by_position[position]:
+            emission_id = compiled_hmm.emission_ids.get(entry)
+            if emission_id is None:
+                continue
+
+            for current_state, log_probability in emitting_state_lists[emission_id]:
+                if current_state not in into_states:
+                    continue
+                if current_state not in into_hypotheses:
+                    into_hypotheses[current_state] = nlargest(n, into_states[current_state], key=itemgetter(0))
+
+                cell = lattice[position + len(entry)].setdefault(current_state, [])
+                for into_score, previous_hypothesis in into_hypotheses[current_state]:
+                    score = into_score + log_probability
+                    if score == float("-inf") or \
+                            not _insert_hypothesis(cell, _Hypothesis(score, current_state, emission_id,
+                                                                     previous_hypothesis), n):
+                        break   # the rest of the ways are not better
+
+    final_hypotheses = nlargest(n, ((hypothesis.score + transition_log_probabilities[hypothesis.state][final_state_id],
+                                     hypothesis)
+                                    for cell in lattice[observation_length].values() for hypothesis in cell),
+                                key=itemgetter(0))
+
+    viterbi_results = []
+    for final_score, hypothesis in final_hypotheses:
+        if final_score == float("-inf"):
+            break
+        # Follow the linked hypotheses back to the initial state
+        backward_states_path = [FINAL_STATE]
+        backward_emissions_path = []
+        while hypothesis.previous is not None:
+            backward_states_path.append(compiled_hmm.states[hypothesis.state])
+            backward_emissions_path.append(compiled_hmm.emissions[hypothesis.emission])
+            hypothesis = hypothesis.previous
+        backward_states_path.append(INITIAL_STATE)
+        viterbi_results.append(ViterbiResult(list(reversed(backward_states_path)),
+                                             list(reversed(backward_emissions_path))))
+
+    return viterbi_results
+
+
+# Inserts the hypothesis into the cell (a list of at most n hypotheses, best first) if it is one of the n best.
+# Returns whether it was inserted.
+def _insert_hypothesis(cell, hypothesis, n):
+    if len(cell) == n and cell[-1].score >= hypothesis.score:
+        return False
+    index = len(cell)
+    while index and cell[index - 1].score < hypothesis.score:
+        index -= 1
+    cell.insert(index, hypothesis)
+    del cell[n:]
+    return True
+
+
+# The n-best version of _relax_null_segment: every path that enters a cell of the position is extended with a null
+# segment once (paths that are pushed out of their cell before that can not be extended into the n best).
+def _relax_null_segment_n_best(compiled_hmm, cells, null_segment_id, n):
+    _, emission_log_probabilities = compiled_hmm.get_log_probability_lists()
+    _, successor_lists = compiled_hmm.get_arc_lists()
+    null_log_probabilities = emission_log_probabilities[null_segment_id]
+
+    pending_hypotheses = deque(hypothesis for cell in cells.values() for hypothesis in cell)
+    while pending_hypotheses:
+        previous_hypothesis = pending_hypotheses.popleft()
+        if not any(hypothesis is previous_hypothesis for hypothesis in cells[previous_hypothesis.state]):
+            continue
+        for current_state, log_probability in successor_lists[previous_hypothesis.state]:
+            score = previous_hypothesis.score + log_probability + null_log_probabilities[current_state]
+            if score == float("-inf"):
+                continue
+            hypothesis = _Hypothesis(score, current_state, null_segment_id, previous_hypothesis)
+            if _insert_hypothesis(cells.setdefault(current_state, []), hypothesis, n):
+                pending_hypotheses.append(hypothesis)
 
 
 # This procedure takes a lexicon, obs and a list of starting points,
 # and returns a list of all possible prefixes
 # from each one of the starting points (every element in the list is unique).
 def get_lexical_prefixes(lexicon, complete_observation, starting_positions):
-    prefix_list = []
-    longest_entry = lexicon.get_maximal_entry_length()
+    instrumentation = get_instrumentation()
+    with instrumentation.phase('prefix_lookup'):
+        observation_ids = lexicon.get_observation_ids(complete_observation)
+        prefixes = {}   # used as an ordered set
 
-    for start_position in starting_positions:
-        from_start_position_length = len(complete_observation) - start_position
-        maximal_block_size = min(from_start_position_length, longest_entry)
-        truncated_observation = complete_observation[start_position:start_position+maximal_block_size]
+        for start_position in starting_positions:
+            for prefix in lexicon.get_matches_by_ids(observation_ids, start_position):
+                instrumentation.count('prefix_matches')
+                prefixes[prefix] = None
 
-        for i in range(1, len(truncated_observation)+1):
-            current_prefix = truncated_observation[0:i]
-            if current_prefix in lexicon.entries and current_prefix not in prefix_list:
-                prefix_list.append(current_prefix)
+    prefix_list = list(prefixes)
 
-    if NULL_SEGMENT in lexicon.entries:   # support in null segment
+    if lexicon.has_entry(NULL_SEGMENT):   # support in null segment
         prefix_list.append(NULL_SEGMENT)
 
     return prefix_list
-
-
-viterbi_result = viterbi(simple_hmm, simple_lexicon, observation)
-
-
-assert viterbi_result.states_path == ['q0', 'q1', 'q2', 'q2', 'qf']
-assert viterbi_result.emissions_path == ['the', 'dog', 'dog']
-
-##############
-
-hmm = HMM({INITIAL_STATE: ['q1'],
-          'q1': (['q1', 'q2'], ['cat', 'dog']),
-          'q2': (['q2', FINAL_STATE], ['s', NULL_SEGMENT])})
-
-
-lexicon = Lexicon(['cat', 'dog', 's', NULL_SEGMENT])
-
-assert viterbi(hmm, lexicon, 'cat').emissions_path == ['cat', NULL_SEGMENT]
-assert viterbi(hmm, lexicon, 'cats').emissions_path == ['cat', 's']
-
-
-
-hmm = HMM({INITIAL_STATE: ['q1'],
-          'q1': (['q1', 'q2'], ['cat', 'dog']),
-          'q2': (['q2', 'q3'], ['s', NULL_SEGMENT]),
-          'q3': (['q3', FINAL_STATE], ['full', NULL_SEGMENT])})
-
-
-lexicon = Lexicon(['cat', 'dog', 's', 'full', NULL_SEGMENT])
-
-
-assert viterbi(hmm, lexicon, 'catfull').emissions_path == ['cat', NULL_SEGMENT, 'full']
-assert viterbi(hmm, lexicon, 'cat').emissions_path == ['cat', NULL_SEGMENT, NULL_SEGMENT]
@@ -0,0 +1,38 @@
+from array import array
+
+
+# Interns symbols (segments, lexical entries, states) as dense integer ids, in the order they are first seen.
+# symbols is the list from an id to its symbol, and ids is the dict from a symbol to its id.
+class SymbolTable:
+    def __init__(self, symbols=()):
+        self.symbols = []
+        self.ids = {}
+        for symbol in symbols:
+            self.intern(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.ids
+
+    def __getitem__(self, symbol_id):
+        return self.symbols[symbol_id]
+
+    def intern(self, symbol):
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def get_id(self, symbol, default=None):
+        return self.ids.get(symbol, default)
+
+    # Interns every symbol of the sequence (e.g. the segments of a lexical entry) into a compact array of ids.
+    def intern_sequence(self, sequence):
+        return array('H', [self.intern(symbol) for symbol in sequence])
+
+    # The ids of the symbols of the sequence, with -1 for symbols that were never interned.
+    def get_ids(self, sequence):
+        return [self.ids.get(symbol, -1) for symbol in sequence]
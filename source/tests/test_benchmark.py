@@ -0,0 +1,38 @@
+__author__ = 'iddoberger'
+
+
+import json
+import unittest
+
+from benchmark import generate_corpus, generate_hypothesis, run_benchmarks
+from new_viterbi import viterbi
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_reproducible_corpus(self):
+        words, data = generate_corpus(corpus_size=20, word_count=5, utterance_length=3, seed=7)
+        self.assertEqual((words, data), generate_corpus(corpus_size=20, word_count=5, utterance_length=3, seed=7))
+        self.assertEqual(len(set(words)), 5)
+        self.assertTrue(all(len(datum) == 3 * 6 for datum in data))
+        self.assertNotEqual(data, generate_corpus(corpus_size=20, word_count=5, utterance_length=3, seed=8)[1])
+
+    def test_hypothesis_parses_the_corpus(self):
+        words, data = generate_corpus(corpus_size=20, word_count=5, utterance_length=3)
+        hmm, lexicon = generate_hypothesis(words, lexicon_size=12, states_count=3)
+        self.assertEqual(len(lexicon.entries), 12)
+        self.assertEqual(len(hmm.inner_states), 3)
+        for datum in data:
+            self.assertEqual(''.join(viterbi(hmm, lexicon, datum).emissions_path), datum)
+        self.assertRaises(ValueError, generate_hypothesis, words, 4)
+
+    def test_results(self):
+        results = json.loads(json.dumps(run_benchmarks(corpus_size=10, lexicon_size=6, states_count=2, repeat=1)))
+        self.assertEqual(results['corpus'], {'utterances': 10, 'characters': 10 * 6 * 6, 'unparsable': 0})
+        self.assertIn('get_encoded_syntactic_component_length', results['benchmarks'])
+        viterbi_results = results['benchmarks']['viterbi']
+        self.assertGreater(viterbi_results['characters_per_second'], 0)
+        self.assertGreater(viterbi_results['peak_memory_bytes'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+from io import BytesIO
+
+from bit_stream import BitWriter, BitReader, PackedBits, dump_packed_bits, load_bit_reader
+
+
+class BitStreamTestCase(unittest.TestCase):
+    def test_write_and_read(self):
+        bit_writer = BitWriter()
+        symbols = [(1, 1), (5, 3), (0, 0), (300, 9), (2, 5), (1, 1)]
+        for value, width in symbols:
+            bit_writer.write(value, width)
+        packed_bits = bit_writer.getvalue()
+        self.assertEqual(len(packed_bits), 19)
+        self.assertEqual(len(packed_bits.data), 3)
+
+        bit_reader = BitReader(packed_bits)
+        self.assertEqual([bit_reader.read(width) for (_, width) in symbols], [value for (value, _) in symbols])
+        self.assertTrue(bit_reader.at_end())
+        self.assertRaises(EOFError, bit_reader.read, 1)
+
+    def test_bit_string_view(self):
+        packed_bits = PackedBits.from_bit_string('0001101011')
+        self.assertEqual(str(packed_bits), '0001101011')
+        self.assertEqual(packed_bits.data, bytes([0b00011010, 0b11000000]))
+        self.assertEqual(BitReader('0001101011').read_unary(), 3)
+
+    def test_file_in_chunks(self):
+        bit_writer = BitWriter()
+        for value in range(1000):
+            bit_writer.write(value, 11)
+        archive = BytesIO()
+        dump_packed_bits(bit_writer.getvalue(), archive)
+        archive.seek(0)
+
+        bit_reader = load_bit_reader(archive, chunk_size=3)
+        self.assertEqual([bit_reader.read(11) for _ in range(1000)], list(range(1000)))
+        self.assertTrue(bit_reader.at_end())
+        self.assertLessEqual(len(bit_reader.data), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
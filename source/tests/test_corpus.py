@@ -0,0 +1,83 @@
+__author__ = 'iddoberger'
+
+
+import pickle
+import unittest
+from tempfile import TemporaryDirectory
+
+from corpus import Corpus
+from encoding import get_encoded_data_by_grammar_length, get_encoded_data_by_grammar_length_parallel
+from incremental_decoding import IncrementalDecoder
+from new_viterbi import HMM, Lexicon, INITIAL_STATE, FINAL_STATE, get_lexical_prefixes, viterbi
+from viterbi_cache import ViterbiCache
+
+
+pabiku_words = ['pabiku', 'daropi', 'tibudo', 'golatu']
+pabiku_data = ['golatutibudopabikudaropidaropipabikupabikudaropipabiku',
+               'pabikudaropidaropitibudopabikudaropigolatu',
+               'tibudodaropigolatupabikutibudotibudo',
+               'daropidaropigolatutibudogolatu']
+
+
+class CorpusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = TemporaryDirectory()
+        self.corpus = Corpus.save(self.temporary_directory.name, pabiku_data)
+        self.hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], pabiku_words)})
+        self.lexicon = Lexicon(pabiku_words)
+
+    def tearDown(self):
+        del self.corpus
+        self.temporary_directory.cleanup()
+
+    def test_load(self):
+        corpus = Corpus(self.temporary_directory.name)
+        self.assertEqual([str(datum) for datum in corpus], pabiku_data)
+        self.assertEqual([str(datum) for datum in corpus[1:3]], pabiku_data[1:3])
+        self.assertEqual(corpus[2][0], 't')
+
+    def test_datum_values(self):
+        corpus = Corpus(self.temporary_directory.name)
+        self.assertEqual(corpus[1], self.corpus[1])
+        self.assertEqual(hash(corpus[1]), hash(self.corpus[1]))
+        self.assertNotEqual(corpus[1], self.corpus[2])
+        self.assertNotEqual(corpus[1], pabiku_data[1])
+        self.assertEqual(len({datum for datum in corpus}), len(pabiku_data))
+        self.assertIn('pabikudaropi', self.corpus[1])
+        self.assertIn('', self.corpus[1])
+        self.assertNotIn('pabikupabiku', self.corpus[1])
+        self.assertNotIn('x', self.corpus[1])
+
+    def test_decoding_views(self):
+        for datum in self.corpus:
+            self.assertEqual(viterbi(self.hmm, self.lexicon, datum), viterbi(self.hmm, self.lexicon, str(datum)))
+        self.assertEqual(get_lexical_prefixes(self.lexicon, self.corpus[0], [0, 6]), ['golatu', 'tibudo'])
+        self.assertEqual(get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.corpus, viterbi),
+                         get_encoded_data_by_grammar_length(self.hmm, self.lexicon, pabiku_data, viterbi))
+
+    def test_cached_views(self):
+        viterbi_cache = ViterbiCache(viterbi)
+        corpus = Corpus(self.temporary_directory.name)
+        length = get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.corpus, viterbi_cache)
+        self.assertEqual(get_encoded_data_by_grammar_length(self.hmm, self.lexicon, corpus, viterbi_cache), length)
+        self.assertEqual((viterbi_cache.hits, viterbi_cache.misses), (len(pabiku_data), len(pabiku_data)))
+
+    def test_incremental_decoding_of_views(self):
+        incremental_decoder = IncrementalDecoder(self.hmm, self.lexicon, self.corpus)
+        entries = pabiku_words + ['daropidaropi']
+        self.lexicon.update_modified_entries(['daropidaropi'], [])
+        self.hmm.set_emissions('q1', entries)
+        self.assertEqual(incremental_decoder.update(['daropidaropi'], []), [0, 1, 2, 3])
+        self.assertEqual(incremental_decoder.get_data_by_grammar_length(),
+                         get_encoded_data_by_grammar_length(self.hmm, self.lexicon, pabiku_data, viterbi))
+        self.assertEqual(incremental_decoder.substring_index.get_data_containing('daropidaropi'), {0, 1, 3})
+
+    def test_pickled_as_path(self):
+        self.assertLess(len(pickle.dumps(self.corpus[1:])), 200)
+        self.assertEqual(get_encoded_data_by_grammar_length_parallel(self.hmm, self.lexicon, self.corpus, viterbi,
+                                                                     workers=2, chunk_size=1),
+                         get_encoded_data_by_grammar_length(self.hmm, self.lexicon, pabiku_data, viterbi))
+
+
+if __name__ == '__main__':
+    unittest.main()
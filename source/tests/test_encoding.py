@@ -0,0 +1,198 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+from io import BytesIO
+from math import ceil
+from random import Random
+from unittest.mock import MagicMock
+
+from bit_stream import dump_packed_bits, load_bit_reader
+from encoding import encode_data_by_grammar, decode_data, decode_data_stream, get_encoded_data_by_grammar_length, \
+    get_encoded_data_by_grammar_length_by_results, get_encoded_data_by_grammar_length_parallel, encode_lexicon, \
+    decode_lexicon, get_encoded_lexicon_length, get_encoded_syntactic_component_length, get_symbol_length, \
+    get_binary_by_item, get_item_by_binary, get_binary_enumeration, \
+    get_exact_data_by_grammar_length_by_log_probabilities, EncodingLengthTracker
+from new_viterbi import HMM, Lexicon, INITIAL_STATE, FINAL_STATE, viterbi, forward_batch
+
+
+pabiku_words = ['pabiku', 'daropi', 'tibudo', 'golatu']
+pabiku_data = ['golatutibudopabikudaropidaropipabikupabikudaropipabiku',
+               'pabikudaropidaropitibudopabikudaropigolatu',
+               'tibudodaropigolatupabikutibudotibudo',
+               'golatudaropigolatugolatudaropipabiku',
+               'daropidaropigolatutibudogolatu']
+
+
+class DataByGrammarLengthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], pabiku_words)})
+        self.lexicon = Lexicon(pabiku_words)
+
+    def test_parallel_same_as_serial(self):
+        data = pabiku_data * 5
+        self.assertEqual(get_encoded_data_by_grammar_length_parallel(self.hmm, self.lexicon, data, viterbi,
+                                                                     workers=2, chunk_size=3),
+                         get_encoded_data_by_grammar_length(self.hmm, self.lexicon, data, viterbi))
+
+    def test_parallel_unparsable_datum(self):
+        data = pabiku_data + ['pabikukaliro']
+        self.assertEqual(get_encoded_data_by_grammar_length_parallel(self.hmm, self.lexicon, data, viterbi,
+                                                                     workers=2, chunk_size=2),
+                         float("-INF"))
+
+
+    # every pabiku datum has a single parse, and the lists sizes are powers of 2, so no bits are lost to rounding
+    def test_exact_length_of_unambiguous_data(self):
+        self.assertAlmostEqual(
+            get_exact_data_by_grammar_length_by_log_probabilities(forward_batch(self.hmm, self.lexicon, pabiku_data)),
+            get_encoded_data_by_grammar_length(self.hmm, self.lexicon, pabiku_data, viterbi))
+        self.assertEqual(get_exact_data_by_grammar_length_by_log_probabilities(
+            forward_batch(self.hmm, self.lexicon, pabiku_data + ['pabikukaliro'])), float("-INF"))
+
+
+class DataEncodingTestCase(unittest.TestCase):
+    def test_stream_decoding_of_archive(self):
+        hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], pabiku_words)})
+        encoded_data = encode_data_by_grammar(hmm, Lexicon(pabiku_words), pabiku_data, viterbi)
+        archive = BytesIO()
+        dump_packed_bits(encoded_data, archive)
+        archive.seek(0)
+
+        decoded_data = decode_data_stream(hmm, load_bit_reader(archive, chunk_size=4))
+        self.assertEqual(next(decoded_data), pabiku_data[0])
+        self.assertEqual(list(decoded_data), pabiku_data[1:])
+
+    def test_compiled_codes_same_as_lists(self):
+        hmm = HMM({INITIAL_STATE: ['q1', 'q2'],
+                   'q1': ([FINAL_STATE, 'q1', 'q2'], pabiku_words),
+                   'q2': (['q1', FINAL_STATE], pabiku_words[:3])})
+        lexicon = Lexicon(pabiku_words)
+
+        def uncompiled_viterbi(syntactic_component, lexicon, datum):
+            return viterbi(hmm, lexicon, datum)
+
+        self.assertEqual(str(encode_data_by_grammar(hmm, lexicon, pabiku_data, viterbi)),
+                         str(encode_data_by_grammar(_UncompiledSyntacticComponent(hmm), lexicon, pabiku_data,
+                                                    uncompiled_viterbi)))
+
+
+class _UncompiledSyntacticComponent:
+    def __init__(self, hmm):
+        self.hmm = hmm
+
+    def get_outgoing_states(self, state):
+        return self.hmm.get_outgoing_states(state)
+
+    def get_emissions(self, state):
+        return self.hmm.get_emissions(state)
+
+
+class EncodingLengthTrackerTestCase(unittest.TestCase):
+    def test_same_as_full_lengths(self):
+        random = Random(0)
+        entries = list(pabiku_words)
+        hmm = HMM({INITIAL_STATE: ['q1'],
+                   'q1': ([FINAL_STATE, 'q1'], list(entries)),
+                   'q2': ([], [])})
+        tracker = EncodingLengthTracker(4, entries, hmm, hmm.get_states())
+
+        for i in range(200):
+            state = random.choice(['q1', 'q2'])
+            if random.random() < 0.5:
+                entry = 'w{}'.format(i)
+                entries.append(entry)
+                tracker.add_entry(entry)
+                hmm.set_emissions(state, hmm.get_emissions(state) + [entry])
+                tracker.add_emission(state)
+            if random.random() < 0.3:
+                hmm.set_transitions(state, hmm.get_outgoing_states(state) + [FINAL_STATE])
+                tracker.add_transition(state)
+            elif hmm.get_outgoing_states(state):
+                hmm.set_transitions(state, hmm.get_outgoing_states(state)[1:])
+                tracker.remove_transition(state)
+
+            self.assertEqual(tracker.get_lexicon_length(), get_encoded_lexicon_length(4, entries))
+            self.assertEqual(tracker.get_syntactic_component_length(),
+                             get_encoded_syntactic_component_length(hmm, hmm.get_states(), get_symbol_length(entries)))
+
+    def test_last_entry_removed(self):
+        hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], ['pabiku'])})
+        tracker = EncodingLengthTracker(4, ['pabiku'], hmm, hmm.get_states())
+        tracker.remove_entry('pabiku')
+        hmm.set_emissions('q1', [])
+        tracker.remove_emission('q1')
+        self.assertEqual(tracker.get_lexicon_length(), get_encoded_lexicon_length(4, []))
+        self.assertEqual(tracker.get_syntactic_component_length(),
+                         get_encoded_syntactic_component_length(hmm, hmm.get_states(), get_symbol_length([])))
+
+
+alphabet_list = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'k', 'l', 'm', 'n', 'o', 'p', 'r', 's', 't', 'u', 'y']
+words_list = ['a', 'adore', 'all', 'beautiful', 'big', 'bit', 'chases', 'dog', 'handsome', 'like', 'mouse', 'nice',
+              'professor', 'some', 'student', 'taught', 'the', 'thin', 'thoughtful', 'ugly']
+states_list = ["q0", "q1", "q2", "q3", "q4", "qf"]
+
+mock_transition_dict = {'q0': ['q2'], 'q1': ['qf'], 'q2': ['q1', 'q4'], 'q3': ['q2'], 'q4': ['q1'], 'qf': []}
+mock_emission_dict = {'q0': [],
+                      'q1': ['dog', 'mouse', 'professor', 'student'],
+                      'q2': ['a', 'all', 'some', 'the'],
+                      'q3': ['adore', 'bit', 'chases', 'like', 'taught'],
+                      'q4': ['beautiful', 'big', 'handsome', 'nice', 'thin', 'thoughtful', 'ugly'],
+                      'qf': []}
+mock_viterbi_dict = {"athindog": (['q0', 'q2', 'q4', 'q1', 'qf'], ['a', 'thin', 'dog']),
+                     "theuglymouse": (['q0', 'q2', 'q4', 'q1', 'qf'], ['the', 'ugly', 'mouse'])}
+
+
+class MockGrammarEncodingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.syntactic_component = MagicMock()
+        self.syntactic_component.get_outgoing_states = \
+            MagicMock(side_effect=lambda state: mock_transition_dict.get(state, []))
+        self.syntactic_component.get_emissions = MagicMock(side_effect=lambda state: mock_emission_dict.get(state, []))
+        self.viterbi = MagicMock(side_effect=lambda syntactic_component, lexicon, datum: mock_viterbi_dict[datum])
+        self.words_symbol_length = get_binary_enumeration(words_list)[1]
+
+    def test_enumerations(self):
+        big_list = [str(x) for x in range(20)]
+        self.assertEqual(get_binary_by_item(big_list, '13'), "01101")
+        self.assertEqual(get_item_by_binary(big_list, "01101"), '13')
+
+        alphabet_enumeration, _ = get_binary_enumeration(alphabet_list)
+        self.assertEqual((alphabet_enumeration["#"], alphabet_enumeration["a"], alphabet_enumeration["y"]),
+                         ("00000", "00001", "10100"))
+        states_enumeration, _ = get_binary_enumeration(states_list)
+        self.assertEqual((states_enumeration["#"], states_enumeration["q0"], states_enumeration["qf"]),
+                         ("000", "001", "110"))
+
+    def test_lexicon(self):
+        encoded_lexicon = encode_lexicon(alphabet_list, words_list)
+        encoded_lexicon_length = get_encoded_lexicon_length(get_binary_enumeration(alphabet_list)[1], words_list)
+        self.assertEqual(encoded_lexicon_length, 616)
+        self.assertEqual(len(encoded_lexicon), encoded_lexicon_length)
+        self.assertEqual(len(encoded_lexicon.data), ceil(encoded_lexicon_length / 8))
+        self.assertEqual(decode_lexicon(encoded_lexicon, alphabet_list), words_list)
+        self.assertEqual(decode_lexicon(str(encoded_lexicon), alphabet_list), words_list)
+
+    def test_syntactic_component(self):
+        self.assertEqual(get_encoded_syntactic_component_length(self.syntactic_component, states_list,
+                                                                self.words_symbol_length), 188)
+        tracker = EncodingLengthTracker(get_binary_enumeration(alphabet_list)[1], words_list,
+                                        self.syntactic_component, states_list)
+        self.assertEqual(tracker.get_lexicon_length(), 616)
+        self.assertEqual(tracker.get_syntactic_component_length(self.words_symbol_length), 188)
+
+    def test_data_by_grammar(self):
+        data = ["athindog", "theuglymouse"]
+        encoded_data = encode_data_by_grammar(self.syntactic_component, words_list, data, self.viterbi)
+        self.assertEqual(len(encoded_data), 16)
+        self.assertEqual(len(encoded_data.data), 2)
+        self.assertEqual(get_encoded_data_by_grammar_length(self.syntactic_component, words_list, data, self.viterbi),
+                         16)
+        self.assertEqual(get_encoded_data_by_grammar_length_by_results(
+            self.syntactic_component, [mock_viterbi_dict[datum] for datum in data]), 16)
+        self.assertEqual(decode_data(self.syntactic_component, encoded_data), data)
+        self.assertEqual(decode_data(self.syntactic_component, str(encoded_data)), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+__author__ = 'iddoberger'
+
+
+import random
+import unittest
+
+from hypothesis_search import Hypothesis, IncrementalChain, ParallelTemperingSearch, get_hypothesis_length, \
+    get_hypotheses_lengths, get_neighbor, propose_neighbors
+from new_viterbi import INITIAL_STATE, FINAL_STATE, viterbi
+from viterbi_cache import ViterbiCache
+
+
+pabiku_data = ['pabikudaropidaropitibudopabikudaropigolatu',
+               'tibudodaropigolatupabikutibudotibudo',
+               'daropidaropigolatutibudogolatu']
+pabiku_alphabet = sorted(set(''.join(pabiku_data)))
+
+
+class HypothesisSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hypothesis = Hypothesis({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], list(pabiku_alphabet))},
+                                     list(pabiku_alphabet))
+
+    def test_neighbor_emits_its_entries(self):
+        random.seed(3)
+        hypothesis = self.hypothesis
+        for _ in range(20):
+            hypothesis = get_neighbor(hypothesis, pabiku_alphabet)
+            self.assertCountEqual(hypothesis.hmm_dict['q1'][1], hypothesis.entries)
+        self.assertEqual(self.hypothesis.entries, pabiku_alphabet)
+
+    def test_batch_of_neighbors(self):
+        random.seed(5)
+        hypothesis = Hypothesis({INITIAL_STATE: ['q1', 'q2'],
+                                 'q1': ([FINAL_STATE, 'q1', 'q2'], pabiku_alphabet[:6] + ['pa', 'bi']),
+                                 'q2': (['q1', FINAL_STATE], pabiku_alphabet[6:] + ['ku'])},
+                                pabiku_alphabet + ['pa', 'bi', 'ku'])
+        neighbors = propose_neighbors(hypothesis, pabiku_alphabet, 8)
+        self.assertEqual(len(neighbors), 8)
+        self.assertEqual(hypothesis.entries, pabiku_alphabet + ['pa', 'bi', 'ku'])
+        self.assertEqual(get_hypotheses_lengths(neighbors, pabiku_alphabet, pabiku_data),
+                         [get_hypothesis_length(neighbor, pabiku_alphabet, pabiku_data) for neighbor in neighbors])
+
+    def test_incremental_chain(self):
+        random.seed(7)
+        hypothesis = Hypothesis({INITIAL_STATE: ['q1', 'q2'],
+                                 'q1': ([FINAL_STATE, 'q1', 'q2'], pabiku_alphabet[:6] + ['pa', 'bi']),
+                                 'q2': (['q1', FINAL_STATE], pabiku_alphabet[6:] + ['ku'])},
+                                pabiku_alphabet + ['pa', 'bi', 'ku'])
+        viterbi_cache = ViterbiCache(viterbi)
+        chain = IncrementalChain(hypothesis, pabiku_alphabet, pabiku_data, viterbi_cache)
+        self.assertEqual(chain.get_length(), get_hypothesis_length(hypothesis, pabiku_alphabet, pabiku_data))
+        for step in range(30):
+            length = chain.get_length()
+            neighbor_length = chain.propose()
+            self.assertEqual(neighbor_length,
+                             get_hypothesis_length(chain.get_hypothesis(), pabiku_alphabet, pabiku_data))
+            if step % 3:
+                chain.reject()
+                self.assertEqual(chain.get_length(), length)
+            else:
+                chain.accept()
+            self.assertEqual(chain.hmm.get_fingerprint(), chain.get_hypothesis().get_hmm().get_fingerprint())
+            self.assertEqual(chain.get_length(),
+                             get_hypothesis_length(chain.get_hypothesis(), pabiku_alphabet, pabiku_data))
+        self.assertGreater(viterbi_cache.hits, 0)
+
+    def test_search(self):
+        search = ParallelTemperingSearch(self.hypothesis, pabiku_alphabet, pabiku_data, chains=3, workers=2, seed=1)
+        initial_length = search.best_length
+        best_hypothesis, best_length = search.run(rounds=3, steps_per_round=5)
+        self.assertLessEqual(best_length, initial_length)
+        self.assertEqual(best_length, get_hypothesis_length(best_hypothesis, pabiku_alphabet, pabiku_data))
+        self.assertEqual(search.proposed_swaps, 6)
+        self.assertEqual(search.lengths[0], best_length)
+
+    def test_search_with_batches_of_neighbors(self):
+        search = ParallelTemperingSearch(self.hypothesis, pabiku_alphabet, pabiku_data, chains=2, workers=2, seed=2,
+                                         neighbors_per_step=4)
+        initial_length = search.best_length
+        best_hypothesis, best_length = search.run(rounds=2, steps_per_round=3)
+        self.assertLessEqual(best_length, initial_length)
+        self.assertEqual(best_length, get_hypothesis_length(best_hypothesis, pabiku_alphabet, pabiku_data))
@@ -0,0 +1,82 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+
+from encoding import get_encoded_data_by_grammar_length
+from incremental_decoding import IncrementalDecoder, SubstringIndex
+from lexical_modifier import LexicalModifier
+from new_viterbi import HMM, Lexicon, INITIAL_STATE, FINAL_STATE, viterbi
+
+
+class IncrementalDecoderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.entries = ['pabiku', 'daropi', 'tibudo', 'golatu']
+        self.hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], self.entries)})
+        self.lexicon = Lexicon(self.entries)
+        self.data = ['pabikudaropi', 'tibudogolatu', 'golatupabiku', 'tibudotibudo']
+        self.incremental_decoder = IncrementalDecoder(self.hmm, self.lexicon, self.data)
+
+    def assert_same_as_full_decoding(self):
+        self.assertEqual(self.incremental_decoder.viterbi_results,
+                         [viterbi(self.hmm, self.lexicon, datum) for datum in self.data])
+        self.assertEqual(self.incremental_decoder.get_data_by_grammar_length(),
+                         get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.data, viterbi))
+
+    def test_replaced_entry(self):
+        self.entries[self.entries.index('golatu')] = 'golat'
+        self.lexicon.update_modified_entries(['golat'], ['golatu'])
+        self.hmm.set_emissions('q1', self.entries)
+        self.assertEqual(self.incremental_decoder.update(['golat'], ['golatu']), [1, 2])
+        self.assertEqual(self.incremental_decoder.get_data_by_grammar_length(), float("-INF"))
+
+        self.entries[self.entries.index('golat')] = 'golatu'
+        self.lexicon.update_modified_entries(['golatu'], ['golat'])
+        self.hmm.set_emissions('q1', self.entries)
+        self.assertEqual(self.incremental_decoder.update(['golatu'], ['golat']), [1, 2])
+        self.assert_same_as_full_decoding()
+
+    def test_added_entry(self):
+        self.entries.append('pabikux')
+        self.lexicon.update_modified_entries(['pabikux'], [])
+        self.hmm.set_emissions('q1', self.entries)
+        self.assertEqual(self.incremental_decoder.update(['pabikux'], []), [0, 1, 2, 3])
+        self.assert_same_as_full_decoding()
+
+    def test_changed_transitions(self):
+        self.hmm.set_transitions('q1', [FINAL_STATE, 'q1', 'q2'])
+        self.hmm.set_emissions('q2', ['golatu'])
+        self.hmm.set_transitions('q2', [FINAL_STATE])
+        self.incremental_decoder.update([], [])
+        self.assert_same_as_full_decoding()
+
+    def test_lexical_modifier(self):
+        lexical_modifier = LexicalModifier()
+        for _ in range(10):
+            added_entries, removed_entries = lexical_modifier.remove_segment_from_entry(self.entries, 'abdgiklprtu')
+            self.lexicon.update_modified_entries(added_entries, removed_entries)
+            self.hmm.set_emissions('q1', self.entries)
+            self.incremental_decoder.update(added_entries, removed_entries)
+            self.assert_same_as_full_decoding()
+
+    def test_lexical_modifier_adding_segments(self):
+        lexical_modifier = LexicalModifier()
+        for _ in range(10):
+            added_entries, removed_entries = lexical_modifier.add_segment_to_entry(self.entries, 'abdgiklprtux')
+            self.lexicon.update_modified_entries(added_entries, removed_entries)
+            self.hmm.set_emissions('q1', self.entries)
+            self.incremental_decoder.update(added_entries, removed_entries)
+            self.assert_same_as_full_decoding()
+
+
+class SubstringIndexTestCase(unittest.TestCase):
+    def test_data_containing(self):
+        data = ['pabikudaropi', 'tibudogolatu', 'golatupabiku']
+        substring_index = SubstringIndex(data, gram_length=2)
+        for string in ['', 'p', 'pa', 'abi', 'pabiku', 'golatupa', 'pabikux', 'x']:
+            self.assertEqual(substring_index.get_data_containing(string),
+                             {i for i, datum in enumerate(data) if string in datum})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+__author__ = 'iddoberger'
+
+
+import json
+import unittest
+
+from encoding import get_encoded_data_by_grammar_length
+from hypothesis_search import Hypothesis, ParallelTemperingSearch
+from instrumentation import Instrumentation, get_instrumentation, instrumented
+from new_viterbi import HMM, Lexicon, INITIAL_STATE, FINAL_STATE, viterbi
+from viterbi_cache import ViterbiCache
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], ['pabiku', 'daropi', 'pa', 'biku'])})
+        self.lexicon = Lexicon(['pabiku', 'daropi', 'pa', 'biku'])
+        self.data = ['pabikudaropi', 'daropipabiku', 'pabikupabiku']
+
+    def test_disabled_by_default(self):
+        self.assertFalse(get_instrumentation().enabled)
+        with instrumented() as instrumentation:
+            self.assertIs(get_instrumentation(), instrumentation)
+        self.assertFalse(get_instrumentation().enabled)
+
+    def test_viterbi_counters_and_calls(self):
+        with instrumented(keep_calls=True) as instrumentation:
+            for datum in self.data:
+                viterbi(self.hmm, self.lexicon, datum)
+        counters = instrumentation.counters
+        self.assertEqual(counters['viterbi_calls'], 3)
+        for name in ('prefix_matches', 'cells_created', 'transitions_evaluated'):
+            self.assertGreater(counters[name], 0)
+        self.assertGreaterEqual(set(instrumentation.phase_times), {'prefix_lookup', 'table_fill', 'backtrace'})
+        self.assertEqual([call['observation_length'] for call in instrumentation.calls], [12, 12, 12])
+        self.assertEqual(sum(call['counters']['prefix_matches'] for call in instrumentation.calls),
+                         counters['prefix_matches'])
+
+    def test_cache_and_cost_computation(self):
+        viterbi_cache = ViterbiCache(viterbi)
+        with instrumented() as instrumentation:
+            get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.data, viterbi_cache)
+            get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.data, viterbi_cache)
+        self.assertEqual((instrumentation.counters['cache_hits'], instrumentation.counters['cache_misses']), (3, 3))
+        self.assertEqual(instrumentation.counters['viterbi_calls'], 3)
+        self.assertIn('cost_computation', instrumentation.phase_times)
+
+    def test_merge_and_json(self):
+        with instrumented() as instrumentation:
+            viterbi(self.hmm, self.lexicon, self.data[0])
+        total = Instrumentation()
+        total.merge(json.loads(instrumentation.to_json()))
+        total.merge(instrumentation)
+        self.assertEqual(total.counters['viterbi_calls'], 2)
+        self.assertEqual(total.counters['cells_created'], 2 * instrumentation.counters['cells_created'])
+
+    def test_instrumented_search(self):
+        alphabet = sorted(set(''.join(self.data)))
+        hypothesis = Hypothesis({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], list(alphabet))}, list(alphabet))
+        search = ParallelTemperingSearch(hypothesis, alphabet, self.data, chains=2, workers=2, seed=1,
+                                         instrument=True)
+        search.run(rounds=2, steps_per_round=2)
+        self.assertGreater(search.instrumentation.counters['viterbi_calls'], 0)
+        self.assertIn('cost_computation', search.instrumentation.phase_times)
+
+
+if __name__ == '__main__':
+    unittest.main()
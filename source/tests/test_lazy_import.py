@@ -0,0 +1,34 @@
+__author__ = 'iddoberger'
+
+
+import os
+import subprocess
+import sys
+import unittest
+
+
+source_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LazyImportTestCase(unittest.TestCase):
+    # NumPy, the NumPy decoders and the test tools are loaded on first use, not by importing the library
+    def test_import_does_not_load_heavy_modules(self):
+        code = "import sys, corpus, encoding, hypothesis_search, new_viterbi, viterbi_cache; " \
+               "print([name for name in ('numpy.linalg', 'viterbi_with_numpy.viterbi', 'unittest.mock') " \
+               "if name in sys.modules])"
+        output = subprocess.run([sys.executable, '-c', code], cwd=source_path, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+
+    def test_numpy_loaded_on_first_use(self):
+        code = "import sys, new_viterbi; " \
+               "hmm = new_viterbi.HMM({'q0': ['q1'], 'q1': (['qf', 'q1'], ['a', 'b'])}); " \
+               "print(new_viterbi.viterbi(hmm, new_viterbi.Lexicon(['a', 'b']), 'ab').emissions_path, " \
+               "'numpy.linalg' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], cwd=source_path, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout
+        self.assertEqual(output.strip(), "['a', 'b'] True")
+
+
+if __name__ == '__main__':
+    unittest.main()
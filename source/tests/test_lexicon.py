@@ -1,10 +1,27 @@
+import random
 import unittest
 
+from lexical_modifier import LexicalModifier
+from lexicon import Lexicon
+
 
 class MyTestCase(unittest.TestCase):
     def test_something(self):
         self.assertEqual(True, False)
 
 
+class LexiconTestCase(unittest.TestCase):
+    def test_rejected_neighbor_rollback(self):
+        random.seed(1)
+        lexicon = Lexicon(LexicalModifier(), ['pabiku', 'daropi', 'tibudo', 'golatu'], 'abdgiklprtu')
+        for _ in range(10):
+            snapshot = lexicon.snapshot()
+            added_entries, removed_entries = lexicon.get_neighbor()
+            self.assertTrue(all(entry in lexicon.entries for entry in added_entries))
+            self.assertFalse(any(entry in lexicon.entries for entry in removed_entries))
+            lexicon.rollback(snapshot)
+            self.assertEqual(lexicon.get_entries(), ['pabiku', 'daropi', 'tibudo', 'golatu'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,38 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+
+from lexicon_entries import LexiconEntries
+
+
+class LexiconEntriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.entries = LexiconEntries(['pabiku', 'daropi', 'tibudo', 'golatu'])
+
+    def test_remove_moves_last_entry(self):
+        self.entries.remove('daropi')
+        self.assertEqual(self.entries.get_entries(), ['pabiku', 'golatu', 'tibudo'])
+        self.assertEqual(self.entries.index('golatu'), 1)
+        self.assertNotIn('daropi', self.entries)
+        self.assertRaises(ValueError, self.entries.remove, 'daropi')
+        self.assertRaises(ValueError, self.entries.append, 'pabiku')
+
+    def test_rollback_to_snapshot(self):
+        self.entries.append('daro')
+        snapshot = self.entries.snapshot()
+        self.entries.remove('pabiku')
+        self.entries.append('pabik')
+        self.entries.remove('daro')
+        self.assertEqual(self.entries.rollback(snapshot), (['daro', 'pabiku'], ['pabik']))
+        self.assertEqual(self.entries.get_entries(), ['pabiku', 'daropi', 'tibudo', 'golatu', 'daro'])
+        self.assertEqual([self.entries.index(entry) for entry in self.entries], [0, 1, 2, 3, 4])
+
+        self.entries.rollback()
+        self.assertEqual(self.entries.get_entries(), ['pabiku', 'daropi', 'tibudo', 'golatu'])
+
+    def test_commit(self):
+        self.entries.remove('tibudo')
+        self.entries.commit()
+        self.assertEqual(self.entries.rollback(), ([], []))
+        self.assertEqual(self.entries.get_entries(), ['pabiku', 'daropi', 'golatu'])
@@ -0,0 +1,359 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from math import log
+
+import numpy as np
+
+from new_viterbi import HMM, CompiledHMM, Lexicon, INITIAL_STATE, FINAL_STATE, NULL_SEGMENT, \
+    get_lexical_prefixes, viterbi, vectorized_viterbi, viterbi_batch, viterbi_n_best, get_beam_accuracy_report, \
+    forward, forward_batch, viterbi_and_forward_batch, viterbi_candidates_batch, ViterbiWorkspace, _get_batches, \
+    _get_default_workspace
+from viterbi_with_numpy.viterbi import CandidatesDecoder
+
+
+class LexiconTrieTestCase(unittest.TestCase):
+    def test_get_matches_by_position(self):
+        lexicon = Lexicon(['the', 'th', 'dog', 'do'])
+        self.assertEqual(lexicon.get_matches_by_position('thedog'), [['th', 'the'], [], [], ['do', 'dog'], [], []])
+
+    def test_remove_entry_keeps_shared_prefixes(self):
+        lexicon = Lexicon(['the', 'th'])
+        lexicon.remove_entry('the')
+        self.assertEqual(lexicon.get_matches('the', 0), ['th'])
+        self.assertFalse(lexicon.has_entry('the'))
+
+    def test_segment_ids(self):
+        lexicon = Lexicon(['the', 'dog'])
+        self.assertEqual(list(lexicon.segments.intern_sequence('dog')), [3, 4, 5])
+        self.assertEqual(lexicon.get_observation_ids('thecat'), [0, 1, 2, -1, -1, 0])
+        lexicon.add_entry('cat')
+        self.assertEqual(lexicon.get_matches('thecat', 3), ['cat'])
+
+    def test_rollback(self):
+        lexicon = Lexicon(['the', 'th', 'dog'])
+        snapshot = lexicon.snapshot()
+        lexicon.remove_entry('the')
+        lexicon.add_entry('thedo')
+        self.assertEqual(lexicon.get_matches('thedog', 0), ['th', 'thedo'])
+        lexicon.rollback(snapshot)
+        self.assertEqual(lexicon.get_matches('thedog', 0), ['th', 'the'])
+        self.assertEqual(lexicon.entries.get_entries(), ['the', 'th', 'dog'])
+
+    def test_repeated_entries(self):
+        lexicon = Lexicon(['the', 'th', 'the', 'dog', 'th'])
+        self.assertEqual(lexicon.entries.get_entries(), ['the', 'th', 'dog'])
+        self.assertEqual(lexicon.get_matches('thedog', 0), ['th', 'the'])
+
+    def test_rollback_of_changes_that_cancel_out(self):
+        lexicon = Lexicon(['the', 'th', 'dog'])
+        snapshot = lexicon.snapshot()
+        lexicon.add_entry('c')
+        lexicon.remove_entry('c')
+        lexicon.remove_entry('dog')
+        lexicon.add_entry('dog')
+        lexicon.rollback(snapshot)
+        self.assertEqual(lexicon.get_matches('c', 0), [])
+        self.assertEqual(lexicon.get_matches('dog', 0), ['dog'])
+        for entry in ['the', 'th', 'dog', 'c']:
+            self.assertEqual(lexicon.get_matches(entry, 0)[-1:] == [entry], lexicon.has_entry(entry))
+
+    def test_get_lexical_prefixes(self):
+        lexicon = Lexicon(['cat', 'ca', 's', NULL_SEGMENT])
+        self.assertEqual(get_lexical_prefixes(lexicon, 'cats', [0, 3]), ['ca', 'cat', 's', NULL_SEGMENT])
+
+
+class ViterbiTestCase(unittest.TestCase):
+    decode = staticmethod(viterbi)
+
+    def setUp(self):
+        self.hmm = HMM({INITIAL_STATE: ['q1'],
+                        'q1': (['q1', 'q2'], ['cat', 'dog']),
+                        'q2': (['q2', FINAL_STATE], ['s', NULL_SEGMENT])})
+        self.lexicon = Lexicon(['cat', 'dog', 's', NULL_SEGMENT])
+
+    def test_segmentation(self):
+        result = self.decode(self.hmm, self.lexicon, 'catdogs')
+        self.assertEqual(result.states_path, ['q0', 'q1', 'q1', 'q2', 'qf'])
+        self.assertEqual(result.emissions_path, ['cat', 'dog', 's'])
+
+    def test_single_entry_observation(self):
+        hmm = HMM({INITIAL_STATE: ['q1'], 'q1': (['q1', FINAL_STATE], ['a', 'ab'])})
+        self.assertEqual(self.decode(hmm, Lexicon(['a', 'ab']), 'ab').emissions_path, ['ab'])
+        self.assertEqual(self.decode(hmm, Lexicon(['a', 'ab']), 'a').emissions_path, ['a'])
+
+    def test_repeated_states(self):
+        hmm = HMM({INITIAL_STATE: ['q1', 'q2'],
+                   'q1': (['q1', 'q2', FINAL_STATE], ['the']),
+                   'q2': (['q1', 'q2', FINAL_STATE], ['dog'])})
+        result = self.decode(hmm, Lexicon(['the', 'dog']), 'thedogdog')
+        self.assertEqual(result.states_path, ['q0', 'q1', 'q2', 'q2', 'qf'])
+        self.assertEqual(result.emissions_path, ['the', 'dog', 'dog'])
+
+    def test_trailing_null_segment(self):
+        self.assertEqual(self.decode(self.hmm, self.lexicon, 'cat').emissions_path, ['cat', NULL_SEGMENT])
+        self.assertEqual(self.decode(self.hmm, self.lexicon, 'cats').emissions_path, ['cat', 's'])
+
+    def test_null_segments(self):
+        hmm = HMM({INITIAL_STATE: ['q1'],
+                   'q1': (['q1', 'q2'], ['cat', 'dog']),
+                   'q2': (['q2', 'q3'], ['s', NULL_SEGMENT]),
+                   'q3': (['q3', FINAL_STATE], ['full', NULL_SEGMENT])})
+        lexicon = Lexicon(['cat', 'dog', 's', 'full', NULL_SEGMENT])
+        self.assertEqual(self.decode(hmm, lexicon, 'catfull').emissions_path, ['cat', NULL_SEGMENT, 'full'])
+        self.assertEqual(self.decode(hmm, lexicon, 'cat').emissions_path, ['cat', NULL_SEGMENT, NULL_SEGMENT])
+
+    def test_unparsable_observation(self):
+        self.assertIsNone(self.decode(self.hmm, self.lexicon, 'cas'))
+
+    def test_reused_workspace(self):
+        workspace = ViterbiWorkspace()
+        long_result = self.decode(self.hmm, self.lexicon, 'catdogcatdogs', workspace)
+        capacity = workspace.capacity
+        self.assertEqual(self.decode(self.hmm, self.lexicon, 'dogs', workspace).emissions_path, ['dog', 's'])
+        self.assertIsNone(self.decode(self.hmm, self.lexicon, 'cas', workspace))
+        self.assertEqual(self.decode(self.hmm, self.lexicon, 'catdogcatdogs', workspace), long_result)
+        self.assertEqual(workspace.capacity, capacity)
+
+    def test_threads(self):
+        data = ['catdogcatdogs' * length for length in range(1, 9)] * 4
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda datum: self.decode(self.hmm, self.lexicon, datum), data))
+            self.assertIsNot(executor.submit(_get_default_workspace).result(), _get_default_workspace())
+        self.assertEqual(results, [self.decode(self.hmm, self.lexicon, datum) for datum in data])
+
+
+class VectorizedViterbiTestCase(ViterbiTestCase):
+    decode = staticmethod(vectorized_viterbi)
+
+
+class ViterbiBatchTestCase(unittest.TestCase):
+    def test_same_as_viterbi(self):
+        hmm = HMM({INITIAL_STATE: ['q1'],
+                   'q1': (['q1', 'q2'], ['cat', 'dog']),
+                   'q2': (['q2', 'q3'], ['s', NULL_SEGMENT]),
+                   'q3': (['q3', FINAL_STATE], ['full', NULL_SEGMENT])})
+        lexicon = Lexicon(['cat', 'dog', 's', 'full', NULL_SEGMENT])
+        data = ['catfull', 'dogcats', 'cat', 'catdogsfull', 'dos', 'dogscatsfull']
+        self.assertEqual(viterbi_batch(hmm, lexicon, data, batch_size=4),
+                         [viterbi(hmm, lexicon, datum) for datum in data])
+        viterbi_results, _ = viterbi_and_forward_batch(hmm, lexicon, data, with_forward=False, max_cells=100)
+        self.assertEqual(viterbi_results, [viterbi(hmm, lexicon, datum) for datum in data])
+
+    def test_batches_by_cells(self):
+        data = ['a', 'ab', 'abcd', 'abcdefgh', 'abcdefghijklmnop', 'a' * 40]
+        batches = _get_batches(data, 3, 2, 60)
+        self.assertEqual(sorted(sum(batches, [])), list(range(len(data))))
+        self.assertEqual(batches, [[0, 1, 2], [3], [4], [5]])
+        for batch in batches[:-1]:
+            self.assertLessEqual(len(batch) * (max(len(data[i]) for i in batch) + 1) * 2, 60)
+
+
+class ViterbiCandidatesBatchTestCase(unittest.TestCase):
+    def test_same_as_viterbi_batch(self):
+        data = ['catfull', 'dogcats', 'cat', 'catdogsfull', 'dos', 'dogscatsfull', 'cafull']
+        candidates = [(['cat', 'dog'], ['s', NULL_SEGMENT], ['full', NULL_SEGMENT]),
+                      (['cat', 'dog'], ['s'], ['full']),
+                      (['ca', 'dog'], ['ts', NULL_SEGMENT], ['full', 'cat']),
+                      (['cat', 'dogs'], ['s', NULL_SEGMENT], ['full'])]
+        hmms, lexicons = [], []
+        for q1_emissions, q2_emissions, q3_emissions in candidates:
+            hmms.append(HMM({INITIAL_STATE: ['q1'],
+                             'q1': (['q1', 'q2'], q1_emissions),
+                             'q2': (['q2', 'q3'], q2_emissions),
+                             'q3': (['q3', FINAL_STATE], q3_emissions)}))
+            lexicons.append(Lexicon(list(dict.fromkeys(q1_emissions + q2_emissions + q3_emissions))))
+        self.assertEqual(viterbi_candidates_batch(hmms, lexicons, data, batch_size=8),
+                         [viterbi_batch(hmm, lexicon, data) for hmm, lexicon in zip(hmms, lexicons)])
+
+    def test_different_transitions(self):
+        hmms = [HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE], ['a'])}),
+                HMM({INITIAL_STATE: ['q1'], 'q1': (['q1', FINAL_STATE], ['a'])})]
+        self.assertRaises(ValueError, viterbi_candidates_batch, hmms, [Lexicon(['a']), Lexicon(['a'])], ['a'])
+
+
+class ForwardTestCase(unittest.TestCase):
+    def test_sum_of_parses(self):
+        hmm = HMM({INITIAL_STATE: ['q1'], 'q1': (['q1', FINAL_STATE], ['a', 'b', 'ab'])})
+        lexicon = Lexicon(['a', 'b', 'ab'])
+        # 'a' 'b' and 'ab'
+        self.assertAlmostEqual(forward(hmm, lexicon, 'ab'), log((1 / 2 * 1 / 3) ** 2 + 1 / 2 * 1 / 3))
+        self.assertEqual(forward(hmm, lexicon, 'c'), float("-inf"))
+
+    def test_null_segments(self):
+        hmm = HMM({INITIAL_STATE: ['q1'], 'q1': (['q1', FINAL_STATE], ['a', NULL_SEGMENT])})
+        # m emissions (the 'a' in any of them and null segments) have the probability (1/4)^m, and sum over m of
+        # m * (1/4)^m is 4/9
+        self.assertAlmostEqual(forward(hmm, Lexicon(['a', NULL_SEGMENT]), 'a'), log(4 / 9))
+
+    def test_same_pass_as_viterbi_batch(self):
+        hmm = HMM({INITIAL_STATE: ['q1'],
+                   'q1': (['q1', 'q2'], ['cat', 'dog']),
+                   'q2': (['q2', FINAL_STATE], ['s', NULL_SEGMENT])})
+        lexicon = Lexicon(['cat', 'dog', 's', NULL_SEGMENT])
+        data = ['catdogs', 'cat', 'dos', 'dogscat']
+        viterbi_results, log_probabilities = viterbi_and_forward_batch(hmm, lexicon, data, batch_size=3)
+        self.assertEqual(viterbi_results, viterbi_batch(hmm, lexicon, data))
+        for datum, log_probability in zip(data, log_probabilities):
+            self.assertEqual(log_probability, forward(hmm, lexicon, datum))
+        self.assertEqual(log_probabilities[2], float("-inf"))
+
+    # q2 moves to itself by a certain null segment, which is not live (and would make the null closure singular)
+    def test_dead_null_loop(self):
+        hmm = HMM({INITIAL_STATE: ['q1'], 'q1': (['q2', FINAL_STATE], ['a']), 'q2': (['q2'], [NULL_SEGMENT])})
+        lexicon = Lexicon(['a', NULL_SEGMENT])
+        self.assertAlmostEqual(forward(hmm, lexicon, 'a'), log(1 / 2))
+        self.assertEqual(forward_batch(hmm, lexicon, ['a', 'aa']), [forward(hmm, lexicon, 'a'), float("-inf")])
+        viterbi_results, log_probabilities = viterbi_and_forward_batch(hmm, lexicon, ['a'])
+        self.assertEqual(viterbi_results, [viterbi(hmm, lexicon, 'a')])
+        self.assertEqual(log_probabilities, [forward(hmm, lexicon, 'a')])
+
+        compiled_hmm = hmm.get_compiled()
+        decoder = CandidatesDecoder(compiled_hmm.transition_log_probabilities,
+                                    compiled_hmm.emission_log_probabilities[None], compiled_hmm.emission_ids,
+                                    compiled_hmm.emission_ids[NULL_SEGMENT], compiled_hmm.get_live_states()[None])
+        _, log_probabilities = decoder.ScoreBatch([lexicon.get_matches_by_position('a')], withViterbi=False,
+                                                  withForward=True, rowCandidates=np.array([0]))
+        self.assertAlmostEqual(log_probabilities[0], log(1 / 2))
+
+
+# The best parse of 'ab' (through q2) is not the best one after 'a' (through q1).
+class BeamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hmm = HMM({INITIAL_STATE: ['q1', 'q2'],
+                        'q1': (['q1', FINAL_STATE], ['a', 'b', 'c', 'd']),
+                        'q2': (['q3'], ['a', 'c', 'd', 'e', 'f', 'g', 'h', 'i']),
+                        'q3': ([FINAL_STATE], ['b'])})
+        self.lexicon = Lexicon(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i'])
+
+    def test_beam_size(self):
+        self.assertEqual(viterbi(self.hmm, self.lexicon, 'ab').states_path, ['q0', 'q2', 'q3', 'qf'])
+        self.assertEqual(viterbi(self.hmm, self.lexicon, 'ab', beam_size=1).states_path, ['q0', 'q1', 'q1', 'qf'])
+        self.assertEqual(viterbi(self.hmm, self.lexicon, 'ab', beam_size=2).states_path, ['q0', 'q2', 'q3', 'qf'])
+
+    def test_beam_width(self):
+        self.assertEqual(viterbi(self.hmm, self.lexicon, 'ab', beam_width=0.5).states_path, ['q0', 'q1', 'q1', 'qf'])
+        self.assertEqual(viterbi(self.hmm, self.lexicon, 'ab', beam_width=1).states_path, ['q0', 'q2', 'q3', 'qf'])
+
+    def test_beam_accuracy_report(self):
+        report = get_beam_accuracy_report(self.hmm, self.lexicon, ['ab', 'a', 'ba', 'ab'], beam_size=1)
+        self.assertEqual(report, {'data': 4, 'differing': 2, 'unparsable': 0, 'differing_ratio': 0.5})
+
+    def test_n_best(self):
+        results = viterbi_n_best(self.hmm, self.lexicon, 'ab', 3)
+        self.assertEqual([result.states_path for result in results],
+                         [['q0', 'q2', 'q3', 'qf'], ['q0', 'q1', 'q1', 'qf']])
+        self.assertEqual(viterbi_n_best(self.hmm, self.lexicon, 'ab', 1), [viterbi(self.hmm, self.lexicon, 'ab')])
+        self.assertEqual(viterbi_n_best(self.hmm, self.lexicon, 'bi', 3), [])
+
+    def test_n_best_null_segments(self):
+        hmm = HMM({INITIAL_STATE: ['q1'],
+                   'q1': (['q1', FINAL_STATE], ['a', NULL_SEGMENT])})
+        results = viterbi_n_best(hmm, Lexicon(['a', NULL_SEGMENT]), 'a', 3)
+        self.assertEqual(results[0].emissions_path, ['a'])
+        self.assertCountEqual([result.emissions_path for result in results[1:]],
+                              [['a', NULL_SEGMENT], [NULL_SEGMENT, 'a']])
+
+
+class CompiledHMMTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hmm = HMM({INITIAL_STATE: ['q1'],
+                        'q1': (['q1', 'q2'], ['cat', 'dog']),
+                        'q2': (['q2', FINAL_STATE], ['s', NULL_SEGMENT])})
+
+    def assert_compiled_equal(self, compiled_hmm, other_compiled_hmm):
+        self.assertEqual(compiled_hmm.states, other_compiled_hmm.states)
+        self.assertTrue(np.array_equal(compiled_hmm.transition_log_probabilities,
+                                       other_compiled_hmm.transition_log_probabilities))
+        for emission in other_compiled_hmm.emissions:
+            self.assertTrue(np.array_equal(
+                compiled_hmm.emission_log_probabilities[compiled_hmm.emission_ids[emission]],
+                other_compiled_hmm.emission_log_probabilities[other_compiled_hmm.emission_ids[emission]]))
+
+    def test_log_probabilities(self):
+        compiled_hmm = self.hmm.get_compiled()
+        q1, q2, qf = (compiled_hmm.state_ids[state] for state in ['q1', 'q2', FINAL_STATE])
+        self.assertAlmostEqual(compiled_hmm.transition_log_probabilities[q1, q2], np.log(0.5))
+        self.assertEqual(compiled_hmm.transition_log_probabilities[q1, qf], -np.inf)
+        self.assertEqual(compiled_hmm.emission_log_probabilities[compiled_hmm.emission_ids['s'], q1], -np.inf)
+        self.assertEqual(list(compiled_hmm.transition_symbol_lengths), [0, 1, 1, 0])
+
+    def test_incremental_recompilation(self):
+        compiled_hmm = self.hmm.get_compiled()
+        self.hmm.set_emissions('q1', ['cat', 'dog', 'mouse'])
+        self.hmm.set_transitions('q1', ['q2'])
+        self.assertIs(self.hmm.get_compiled(), compiled_hmm)
+        self.assert_compiled_equal(compiled_hmm, CompiledHMM(self.hmm))
+        self.assertEqual(viterbi(self.hmm, Lexicon(['cat', 'mouse', 's', NULL_SEGMENT]), 'mouses').emissions_path,
+                         ['mouse', 's'])
+
+    def test_new_state_recompiles(self):
+        compiled_hmm = self.hmm.get_compiled()
+        self.hmm.set_emissions('q3', ['s'])
+        self.hmm.set_transitions('q3', [FINAL_STATE])
+        self.hmm.set_transitions('q1', ['q1', 'q3'])
+        self.assertIsNot(self.hmm.get_compiled(), compiled_hmm)
+        self.assertEqual(viterbi(self.hmm, Lexicon(['cat', 's']), 'cats').states_path, ['q0', 'q1', 'q3', 'qf'])
+
+    def test_emitting_states(self):
+        self.assertEqual(self.hmm.get_emitting_states('cat'), [('q1', log(0.5))])
+        self.assertEqual(self.hmm.get_emitting_states('mouse'), [])
+        self.hmm.set_emissions('q2', ['s', 'cat', NULL_SEGMENT])
+        self.assertEqual(self.hmm.get_emitting_states('cat'), [('q1', log(0.5)), ('q2', log(1 / 3))])
+        self.hmm.set_emissions('q1', ['dog'])
+        self.assertEqual(self.hmm.get_emitting_states('cat'), [('q2', log(1 / 3))])
+        self.assertEqual(viterbi(self.hmm, Lexicon(['cat', 'dog', 's']), 'dogcat').states_path,
+                         ['q0', 'q1', 'q2', 'qf'])
+
+    def test_null_closure(self):
+        hmm = HMM({INITIAL_STATE: ['q1'],
+                   'q1': (['n1'], ['a']),
+                   'n1': (['n2', 'q1'], [NULL_SEGMENT]),
+                   'n2': (['n3'], [NULL_SEGMENT, 'b']),
+                   'n3': ([FINAL_STATE], [NULL_SEGMENT])})
+        compiled_hmm = hmm.get_compiled()
+        q1, n1, n2, n3 = (compiled_hmm.state_ids[state] for state in ['q1', 'n1', 'n2', 'n3'])
+        closure_lists = compiled_hmm.get_null_closure_lists(compiled_hmm.emission_ids[NULL_SEGMENT])
+        self.assertEqual([(state, last_state) for state, _, last_state in closure_lists[q1]],
+                         [(n1, q1), (n2, n1), (n3, n2)])
+        self.assertAlmostEqual(closure_lists[q1][2][1], log(0.5) + log(0.5))
+        self.assertEqual(closure_lists[n3], [])
+
+        # more null segments than characters in the data
+        result = viterbi(hmm, Lexicon(['a', 'b', NULL_SEGMENT]), 'a')
+        self.assertEqual(result.states_path, ['q0', 'q1', 'n1', 'n2', 'n3', 'qf'])
+        self.assertEqual(result.emissions_path, ['a', NULL_SEGMENT, NULL_SEGMENT, NULL_SEGMENT])
+        self.assertEqual(vectorized_viterbi(hmm, Lexicon(['a', 'b', NULL_SEGMENT]), 'a'), result)
+
+    def test_sparse_predecessors(self):
+        # q3 is not reachable, q4 can not reach the final state, and q5 has no emissions
+        hmm = HMM({INITIAL_STATE: ['q1', 'q4', 'q5'],
+                   'q1': (['q1', 'q2', 'q4'], ['cat', 'dog']),
+                   'q2': (['q2', FINAL_STATE], ['s']),
+                   'q3': (['q2'], ['s']),
+                   'q4': (['q4'], ['cat']),
+                   'q5': (['q2'], [])})
+        compiled_hmm = hmm.get_compiled()
+        self.assertEqual(list(compiled_hmm.get_live_states()), [True, True, True, False, False, False, True])
+
+        predecessor_offsets, predecessor_states, predecessor_log_probabilities = compiled_hmm.get_predecessors()
+        self.assertEqual(list(predecessor_offsets), [0, 0, 2, 4, 4, 4, 4, 5])
+        self.assertEqual(list(predecessor_states), [0, 1, 1, 2, 2])
+        self.assertTrue(np.allclose(predecessor_log_probabilities, [log(1 / 3), log(1 / 3), log(1 / 3), log(0.5),
+                                                                    log(0.5)]))
+        predecessor_lists, successor_lists = compiled_hmm.get_arc_lists()
+        self.assertEqual([state for state, _ in predecessor_lists[6]], [2])
+        self.assertEqual([[state for state, _ in successors] for successors in successor_lists],
+                         [[1], [1, 2], [2], [], [], [], []])
+        self.assertEqual(viterbi(hmm, Lexicon(['cat', 'dog', 's']), 'catdogs').states_path,
+                         ['q0', 'q1', 'q1', 'q2', 'qf'])
+
+        hmm.set_emissions('q5', ['dog'])
+        self.assertEqual(list(hmm.get_compiled().get_live_states()), [True, True, True, False, False, True, True])
+        self.assertEqual(viterbi(hmm, Lexicon(['cat', 'dog', 's']), 'dogs').states_path, ['q0', 'q5', 'q2', 'qf'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+
+from encoding import get_encoded_lexicon_length, get_encoded_data_by_grammar_length, \
+    get_encoded_data_by_grammar_length_by_results, get_encoded_syntactic_component_length, get_symbol_length
+from hypothesis_search import Hypothesis, get_hypothesis_length
+from new_viterbi import Lexicon, INITIAL_STATE, FINAL_STATE, viterbi, viterbi_batch
+
+
+def get_segments_from_data(data):
+    segments_set = set()
+    for datum in data:
+        segments_set |= set(datum)
+    return sorted(list(segments_set))
+
+
+pabiku_data = ['golatutibudopabikudaropidaropipabikupabikudaropipabiku',
+               'tibudotibudodaropidaropipabikugolatu'
+               'pabikudaropigolatutibudodaropi',
+               'pabikudaropidaropitibudopabikudaropigolatu',
+               'tibudodaropigolatupabikutibudotibudo',
+               'golatudaropigolatugolatudaropipabiku',
+               'daropidaropigolatutibudogolatu',
+               'tibudodaropidaropidaropipabikutibudogolatupabikupabikudaropi',
+               'golatugolatupabikudaropitibudotibudogolatupabikutibudo',
+               'tibudotibudotibudopabikutibudotibudo']
+# pabiku_data is composed out of 12 segments.
+# pabiku 16, daropi 20 , tibudo 19, golatu 14
+# pabikodaropi 17
+
+pabiku_words = ['pabiku', 'daropi', 'tibudo', 'golatu']
+
+kaliro_data = ['kalirogolatutibudopabikudaropidaropipabikupabikudaropipabiku'] + pabiku_data[1:]
+kaliro_words = ['kaliro'] + pabiku_words
+
+
+# Returns the (lexicon, hmm, data by grammar) lengths of a single state hypothesis that emits the words.
+def get_hypothesis_lengths(words, segments, data):
+    hmm_dict = {INITIAL_STATE: ['q1'],
+                'q1': ([FINAL_STATE, 'q1'], words)}
+    hypothesis = Hypothesis(hmm_dict, words)
+    hmm = hypothesis.get_hmm()
+    lexicon = Lexicon(words)
+    lexicon_length = get_encoded_lexicon_length(get_symbol_length(segments), lexicon.entries)
+    hmm_length = get_encoded_syntactic_component_length(hmm, hmm.get_states(), get_symbol_length(lexicon.entries))
+    data_by_grammar_length = get_encoded_data_by_grammar_length(hmm, lexicon, data, viterbi)
+    assert get_encoded_data_by_grammar_length_by_results(hmm, viterbi_batch(hmm, lexicon, data)) == \
+        data_by_grammar_length
+    assert get_hypothesis_length(hypothesis, segments, data) == lexicon_length + hmm_length + data_by_grammar_length
+    return lexicon_length, hmm_length, data_by_grammar_length
+
+
+class HypothesesLengthsTestCase(unittest.TestCase):
+    segments = get_segments_from_data(pabiku_data)
+
+    def test_segments(self):
+        self.assertEqual(self.segments, ['a', 'b', 'd', 'g', 'i', 'k', 'l', 'o', 'p', 'r', 't', 'u'])
+
+    def test_pabiku(self):
+        self.assertEqual(get_hypothesis_lengths(self.segments, self.segments, pabiku_data), (105, 81, 2070))
+        self.assertEqual(get_hypothesis_lengths(pabiku_words, self.segments, pabiku_data), (121, 35, 207))
+        self.assertEqual(get_hypothesis_lengths(pabiku_words + ['pabikodaropi'], self.segments, pabiku_data),
+                         (173, 45, 276))
+        self.assertEqual(get_hypothesis_lengths(['daropi', 'tibudo', 'golatu', 'pabi', 'ku'], self.segments,
+                                                pabiku_data), (125, 45, 340))
+
+    def test_kaliro(self):
+        self.assertEqual(get_hypothesis_lengths(self.segments, self.segments, kaliro_data), (105, 81, 2100))
+        self.assertEqual(get_hypothesis_lengths(kaliro_words, self.segments, kaliro_data), (149, 45, 280))
+        self.assertEqual(get_hypothesis_lengths(kaliro_words + ['pabikodaropi'], self.segments, kaliro_data),
+                         (201, 48, 280))
+        self.assertEqual(get_hypothesis_lengths(['kaliro', 'daropi', 'tibudo', 'golatu', 'pabi', 'ku'],
+                                                self.segments, kaliro_data), (153, 48, 344))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+__author__ = 'iddoberger'
+
+
+import unittest
+
+from encoding import get_encoded_data_by_grammar_length
+from new_viterbi import HMM, Lexicon, INITIAL_STATE, FINAL_STATE, viterbi
+from viterbi_cache import ViterbiCache
+
+
+class ViterbiCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.hmm = HMM({INITIAL_STATE: ['q1'], 'q1': ([FINAL_STATE, 'q1'], ['pabiku', 'daropi', 'pa', 'biku'])})
+        self.lexicon = Lexicon(['pabiku', 'daropi', 'pa', 'biku'])
+        self.data = ['pabikudaropi', 'daropipabiku', 'pabikupabiku']
+
+    def test_hits_and_misses(self):
+        viterbi_cache = ViterbiCache(viterbi)
+        length = get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.data, viterbi_cache)
+        self.assertEqual(get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.data, viterbi_cache), length)
+        self.assertEqual(get_encoded_data_by_grammar_length(self.hmm, self.lexicon, self.data, viterbi), length)
+        self.assertEqual((viterbi_cache.hits, viterbi_cache.misses), (3, 3))
+
+    def test_lexicon_change_misses(self):
+        viterbi_cache = ViterbiCache(viterbi)
+        self.assertEqual(viterbi_cache(self.hmm, self.lexicon, 'pabiku').emissions_path, ['pabiku'])
+        self.lexicon.remove_entry('pabiku')
+        self.assertEqual(viterbi_cache(self.hmm, self.lexicon, 'pabiku').emissions_path, ['pa', 'biku'])
+        self.assertEqual(viterbi_cache.misses, 2)
+
+    def test_eviction_by_bytes(self):
+        viterbi_cache = ViterbiCache(viterbi, max_bytes=1000)
+        for datum in self.data * 2:
+            viterbi_cache(self.hmm, self.lexicon, datum)
+        self.assertLessEqual(viterbi_cache.size_bytes, 1000)
+        self.assertGreater(viterbi_cache.evictions, 0)
+        self.assertEqual(viterbi_cache.get_statistics()['entries'], len(viterbi_cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from sys import getsizeof
+
+from configurations import VITERBI_CACHE_MAX_BYTES
+from instrumentation import get_instrumentation
+
+
+# A bounded LRU cache of Viterbi results, keyed by the fingerprints of the HMM and the lexicon and by the datum.
+# It is called like the viterbi it wraps, so it can be passed as the viterbi of the encoding functions, e.g.
+# get_encoded_data_by_grammar_length(hmm, lexicon, data, ViterbiCache(viterbi)).
+# The HMM and lexicon should be changed only through their methods, which keep the fingerprints up to date.
+# Unparsable data are cached too (as None).
+class ViterbiCache:
+    def __init__(self, viterbi, max_bytes=VITERBI_CACHE_MAX_BYTES):
+        self.viterbi = viterbi
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._results = OrderedDict()   # from a key to a (viterbi result, size in bytes) pair
+
+    def __call__(self, hmm, lexicon, datum):
+        key = (hmm.get_fingerprint(), lexicon.get_fingerprint(), datum)
+        cached = self._results.get(key)
+        if cached is not None:
+            self.hits += 1
+            get_instrumentation().count('cache_hits')
+            self._results.move_to_end(key)
+            return cached[0]
+
+        self.misses += 1
+        get_instrumentation().count('cache_misses')
+        viterbi_result = self.viterbi(hmm, lexicon, datum)
+        result_size = _get_size(key, viterbi_result)
+        if result_size <= self.max_bytes:
+            self._results[key] = (viterbi_result, result_size)
+            self.size_bytes += result_size
+            while self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._results.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+
+        return viterbi_result
+
+    def __len__(self):
+        return len(self._results)
+
+    def clear(self):
+        self._results.clear()
+        self.size_bytes = 0
+
+    def get_statistics(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._results), 'size_bytes': self.size_bytes}
+
+
+# An estimate of the memory held by a cached result: the key's datum, the paths lists, and the cache's own tuples.
+# The fingerprints, state names and emitted entries are shared with the HMM and the lexicon, so they are not counted.
+def _get_size(key, viterbi_result):
+    size = getsizeof(key) + getsizeof(key[2]) + getsizeof((viterbi_result, 0))
+    if viterbi_result is not None:
+        size += getsizeof(viterbi_result) + getsizeof(viterbi_result[0]) + getsizeof(viterbi_result[1])
+    return size
@@ -25,10 +25,351 @@ class Decoder(object):
         trellis[:, 0] = np.squeeze(self.initialProb * self.Obs(obs[0]))
                 
         for t in range(1, len(obs)):
-            trellis[:, t] = (trellis[:, t-1, None].dot(self.Obs(obs[t]).T) * self.transProb).max(0)
-            backpt[:, t] = (np.tile(trellis[:, t-1, None], [1, self.N]) * self.transProb).argmax(0)
+            # a single pass over the matrix for both the max and the argmax
+            scores = trellis[:, t-1, None] * self.transProb
+            backpt[:, t] = scores.argmax(0)
+            trellis[:, t] = scores[backpt[:, t], np.arange(self.N)] * np.squeeze(self.Obs(obs[t]), 1)
         # termination
         tokens = [trellis[:, -1].argmax()]
         for i in range(len(obs)-1, 0, -1):
             tokens.append(backpt[tokens[-1], i])
-        return tokens[::-1]
\ No newline at end of file
+        return tokens[::-1]
+
+'''
+A log space decoder for unsegmented data, where each state emits variable length lexical entries
+(the case of new_viterbi.viterbi).
+compiledHMM: a new_viterbi.CompiledHMM, where state 0 is the initial state and the last state is the final state.
+The trellis is indexed by the position in the data where an entry ends, and every step handles one position
+as array operations over the states.
+'''
+class SegmentationDecoder(object):
+    def __init__(self, compiledHMM, nullEmissionId=None):
+        self.N = len(compiledHMM.states)
+        self.transLogProb = compiledHMM.transition_log_probabilities
+        self.emissionLogProb = compiledHMM.emission_log_probabilities
+        self.emissionIds = compiledHMM.emission_ids
+        self.nullEmissionId = nullEmissionId
+        self.liveStates = compiledHMM.get_live_states()
+        self.nullClosureLogProb = None  # computed by NullClosure on demand
+        self.maxNullClosure = None  # computed by MaxNullClosure on demand
+        assert self.transLogProb.shape == (self.N, self.N)
+        assert self.emissionLogProb.shape[1] == self.N
+
+    # Returns the best path as (state ids from the initial to the final state, emission ids),
+    # or None if the data can not be parsed.
+    # matchesByPosition holds, for every position of the data, the entries that start at that position.
+    # workspace (e.g. a new_viterbi.ViterbiWorkspace) lends the trellis buffers, so they are reused between calls.
+    def Decode(self, matchesByPosition, workspace=None):
+        length = len(matchesByPosition)
+        if workspace is not None:
+            trellis, backState, backPosition, backEmission = workspace.prepare((length + 1, self.N))
+        else:
+            trellis = np.full((length + 1, self.N), -np.inf)
+            backState = np.full((length + 1, self.N), -1, 'int32')
+            backPosition = np.full((length + 1, self.N), -1, 'int32')
+            backEmission = np.full((length + 1, self.N), -1, 'int32')
+        states = np.arange(self.N)
+
+        # initialization
+        trellis[0, 0] = 0
+
+        for t in range(length + 1):
+            if self.nullEmissionId is not None:
+                self.RelaxNull(t, trellis, backState, backPosition, backEmission)
+            if t == length:
+                break
+            if not matchesByPosition[t] or trellis[t].max() == -np.inf:
+                continue
+
+            # the best way into every state from position t, shared by all the entries that start there
+            scores = trellis[t, :, None] + self.transLogProb
+            intoState = scores.argmax(0)
+            intoScore = scores[intoState, states]
+
+            for entry in matchesByPosition[t]:
+                emissionId = self.emissionIds.get(entry)
+                if emissionId is None:
+                    continue
+                end = t + len(entry)
+                entryScore = intoScore + self.emissionLogProb[emissionId]
+                improved = entryScore > trellis[end]
+                trellis[end, improved] = entryScore[improved]
+                backState[end, improved] = intoState[improved]
+                backPosition[end, improved] = t
+                backEmission[end, improved] = emissionId
+
+        # termination
+        finalScores = trellis[length] + self.transLogProb[:, -1]
+        state = finalScores.argmax()
+        if finalScores[state] == -np.inf:
+            return None
+
+        statesPath = [self.N - 1]
+        emissionsPath = []
+        t = length
+        while state != 0:
+            statesPath.append(state)
+            emissionsPath.append(backEmission[t, state])
+            state, t = backState[t, state], backPosition[t, state]
+        statesPath.append(0)
+        return statesPath[::-1], emissionsPath[::-1]
+
+    # Decodes a batch of data in one padded trellis of shape (batch, longest data + 1, N), so every step handles
+    # position t of all the data that is long enough. Returns a list of Decode results, in the order of the batch.
+    def DecodeBatch(self, matchesByPositionList):
+        return self.ScoreBatch(matchesByPositionList)[0]
+
+    # Returns the forward log probabilities of a batch of data (see ScoreBatch).
+    def ForwardBatch(self, matchesByPositionList):
+        return self.ScoreBatch(matchesByPositionList, withViterbi=False, withForward=True)[1]
+
+    # Fills the Viterbi (max-product) trellis of a batch of data, and/or its forward (sum-product) trellis, whose
+    # cells sum the probabilities of all the paths that reach them instead of keeping the best one. Both are filled
+    # in the same pass over the positions and the matches of the batch.
+    # Returns (the Decode results, the log probabilities of the data summed over all their paths), in the order of
+    # the batch; the one that was not asked for is None.
+    # rowCandidates is used by CandidatesDecoder (the candidate of every data of the batch).
+    def ScoreBatch(self, matchesByPositionList, withViterbi=True, withForward=False, rowCandidates=None):
+        lengths = np.array([len(matchesByPosition) for matchesByPosition in matchesByPositionList], 'int64')
+        order = np.argsort(-lengths, kind='stable')     # longest first, so the active data is a prefix of the batch
+        lengths = lengths[order]
+        if rowCandidates is not None:
+            rowCandidates = np.asarray(rowCandidates)[order]
+        B = len(order)
+        maxLength = lengths.max() if B else 0
+        if withViterbi:
+            trellis = np.full((B, maxLength + 1, self.N), -np.inf)
+            backState = np.full((B, maxLength + 1, self.N), -1, 'int32')
+            backPosition = np.full((B, maxLength + 1, self.N), -1, 'int32')
+            backEmission = np.full((B, maxLength + 1, self.N), -1, 'int32')
+        if withForward:
+            forwardTrellis = np.full((B, maxLength + 1, self.N), -np.inf)
+
+        # all the matches of the batch as flat arrays, grouped by their start position (the matches of data that
+        # are in the batch more than once, e.g. for several candidates, are flattened once)
+        flatMatches = {}
+        matchData, matchStart, matchEnd, matchEmission = [np.zeros(0, 'int32')], [np.zeros(0, 'int32')], \
+                                                         [np.zeros(0, 'int32')], [np.zeros(0, 'int32')]
+        for b in range(B):
+            matchesByPosition = matchesByPositionList[order[b]]
+            if id(matchesByPosition) not in flatMatches:
+                starts, ends, emissions = [], [], []
+                for t, entries in enumerate(matchesByPosition):
+                    for entry in entries:
+                        emissionId = self.emissionIds.get(entry)
+                        if emissionId is not None:
+                            starts.append(t)
+                            ends.append(t + len(entry))
+                            emissions.append(emissionId)
+                flatMatches[id(matchesByPosition)] = (np.array(starts, 'int32'), np.array(ends, 'int32'),
+                                                      np.array(emissions, 'int32'))
+            starts, ends, emissions = flatMatches[id(matchesByPosition)]
+            matchData.append(np.full(len(starts), b, 'int32'))
+            matchStart.append(starts)
+            matchEnd.append(ends)
+            matchEmission.append(emissions)
+        matchStart = np.concatenate(matchStart)
+        byStart = np.argsort(matchStart, kind='stable')
+        matchData, matchEnd, matchEmission = (np.concatenate(a)[byStart] for a in (matchData, matchEnd, matchEmission))
+        startBounds = np.searchsorted(matchStart[byStart], np.arange(maxLength + 2))
+
+        # initialization
+        if withViterbi:
+            trellis[:, 0, 0] = 0
+        if withForward:
+            forwardTrellis[:, 0, 0] = 0
+
+        for t in range(maxLength + 1):
+            active = np.count_nonzero(lengths >= t)
+            activeCandidates = None if rowCandidates is None else rowCandidates[:active]
+            if self.nullEmissionId is not None:
+                if withViterbi:
+                    self.RelaxNull(t, trellis[:active], backState[:active], backPosition[:active],
+                                   backEmission[:active], self.RowMaxNullClosure(activeCandidates))
+                if withForward:
+                    forwardTrellis[:active, t] = LogSumExp(forwardTrellis[:active, t, :, None] +
+                                                           self.RowNullClosure(activeCandidates), 1)
+            first, last = startBounds[t], startBounds[t + 1]
+            if first == last:
+                continue
+
+            # the matches of a single position of a single data all end at different positions
+            data, end, emission = matchData[first:last], matchEnd[first:last], matchEmission[first:last]
+            emissionLogProb = self.RowEmissionLogProb(None if rowCandidates is None else rowCandidates[data], emission)
+
+            if withViterbi:
+                # the best way into every state from position t, for every data that has matches there
+                scores = trellis[:active, t, :, None] + self.transLogProb
+                intoState = scores.argmax(1)
+                intoScore = np.take_along_axis(scores, intoState[:, None, :], 1)[:, 0, :]
+
+                entryScore = intoScore[data] + emissionLogProb
+                improved = entryScore > trellis[data, end]
+                trellis[data, end] = np.where(improved, entryScore, trellis[data, end])
+                backState[data, end] = np.where(improved, intoState[data], backState[data, end])
+                backPosition[data, end] = np.where(improved, t, backPosition[data, end])
+                backEmission[data, end] = np.where(improved, emission[:, None], backEmission[data, end])
+
+            if withForward:
+                # all the ways into every state from position t
+                intoForward = LogSumExp(forwardTrellis[:active, t, :, None] + self.transLogProb, 1)
+                forwardTrellis[data, end] = np.logaddexp(forwardTrellis[data, end], intoForward[data] + emissionLogProb)
+
+        logProbabilities = None
+        if withForward:
+            logProbabilities = np.empty(B)
+            logProbabilities[order] = LogSumExp(forwardTrellis[np.arange(B), lengths] + self.transLogProb[:, -1], 1)
+        if not withViterbi:
+            return None, logProbabilities
+
+        # termination
+        finalScores = trellis[np.arange(B), lengths] + self.transLogProb[:, -1]
+        state = finalScores.argmax(1)
+        parsed = finalScores[np.arange(B), state] > -np.inf
+
+        # follow the back pointers of all the parsed data together
+        stepData, stepState, stepEmission = [], [], []
+        data = np.flatnonzero(parsed)
+        state, t = state[data], lengths[data]
+        while data.size:
+            stepData.append(data)
+            stepState.append(state)
+            stepEmission.append(backEmission[data, t, state])
+            state, t = backState[data, t, state], backPosition[data, t, state]
+            notInitial = state != 0
+            data, state, t = data[notInitial], state[notInitial], t[notInitial]
+
+        # regroup the (backward) steps by data
+        results = [None] * B
+        if stepData:
+            stepData = np.concatenate(stepData)
+            byData = np.argsort(stepData, kind='stable')
+            bounds = np.flatnonzero(np.diff(stepData[byData])) + 1
+            statesPaths = np.split(np.concatenate(stepState)[byData], bounds)
+            emissionsPaths = np.split(np.concatenate(stepEmission)[byData], bounds)
+            for b, statesPath, emissionsPath in zip(np.flatnonzero(parsed).tolist(), statesPaths, emissionsPaths):
+                results[order[b]] = ([0] + statesPath[::-1].tolist() + [self.N - 1], emissionsPath[::-1].tolist())
+
+        return results, logProbabilities
+
+    # The emission log probabilities of the matches of the batch (by the candidates of their data, see
+    # CandidatesDecoder), as an array of shape (matches, N).
+    def RowEmissionLogProb(self, candidates, emission):
+        return self.emissionLogProb[emission]
+
+    def RowMaxNullClosure(self, candidates):
+        return self.MaxNullClosure()
+
+    def RowNullClosure(self, candidates):
+        return self.NullClosure()
+
+    # The log probabilities of moving from a state to another by any number of null emissions (none included), which
+    # is the sum of the powers of the matrix M of single null emission steps: the log of (I - M)^-1.
+    # M is restricted to the live states (see CompiledHMM.get_live_states): a state that moves to itself by a
+    # certain null emission is not live, and would make I - M singular.
+    def NullClosure(self):
+        if self.nullClosureLogProb is None:
+            nullStep = np.exp(self.transLogProb + self.emissionLogProb[self.nullEmissionId])
+            nullStep[~(self.liveStates[:, None] & self.liveStates[None, :])] = 0
+            closure = np.maximum(np.linalg.inv(np.eye(self.N) - nullStep), 0)
+            with np.errstate(divide='ignore'):
+                self.nullClosureLogProb = np.log(closure)
+        return self.nullClosureLogProb
+
+    # The best log probabilities of moving from a state to another by one or more null emissions, and the states
+    # these moves enter their targets from (see MaxPlusClosure).
+    def MaxNullClosure(self):
+        if self.maxNullClosure is None:
+            self.maxNullClosure = MaxPlusClosure(self.transLogProb + self.emissionLogProb[self.nullEmissionId])
+        return self.maxNullClosure
+
+    # Null emissions do not consume data, so they move between the states of position t. Every state is extended at
+    # once by the best moves of any number of null emissions into it (see MaxNullClosure), and its back pointer is
+    # the last state of that move, whose own state at t is extended by the same move.
+    # Works on a single trellis, or on a batch of them (with the data as the first axis).
+    def RelaxNull(self, t, trellis, backState, backPosition, backEmission, maxNullClosure=None):
+        closureLogProb, lastState = self.MaxNullClosure() if maxNullClosure is None else maxNullClosure
+        scores = trellis[..., t, :, None] + closureLogProb
+        sourceState = scores.argmax(-2)
+        intoScore = np.take_along_axis(scores, sourceState[..., None, :], -2)[..., 0, :]
+        improved = intoScore > trellis[..., t, :]
+        if not improved.any():
+            return
+        lastState = np.broadcast_to(lastState, scores.shape)
+        intoState = np.take_along_axis(lastState, sourceState[..., None, :], -2)[..., 0, :]
+        trellis[..., t, :][improved] = intoScore[improved]
+        backState[..., t, :][improved] = intoState[improved]
+        backPosition[..., t, :][improved] = t
+        backEmission[..., t, :][improved] = self.nullEmissionId
+
+
+# Decodes data by several candidate HMMs at once, which share their states and transitions and differ in their
+# emissions (e.g. the neighbours of a hypothesis by lexical modifications): emissionLogProb has the shape
+# (candidates, E, N), and every data of a ScoreBatch is decoded by its candidate in rowCandidates, so a single pass
+# over the data scores all the candidates. liveStates (candidates, N) marks the live states of every candidate (see
+# CompiledHMM.get_live_states), all of them by default.
+class CandidatesDecoder(SegmentationDecoder):
+    def __init__(self, transLogProb, emissionLogProb, emissionIds, nullEmissionId=None, liveStates=None):
+        self.N = transLogProb.shape[0]
+        self.transLogProb = transLogProb
+        self.emissionLogProb = emissionLogProb
+        self.emissionIds = emissionIds
+        self.nullEmissionId = nullEmissionId
+        self.liveStates = np.ones(emissionLogProb.shape[::2], dtype=bool) if liveStates is None else liveStates
+        self.nullClosureLogProb = None
+        self.maxNullClosure = None
+        assert self.transLogProb.shape == (self.N, self.N)
+        assert self.emissionLogProb.shape[2] == self.N
+        assert self.liveStates.shape == (self.emissionLogProb.shape[0], self.N)
+
+    def RowEmissionLogProb(self, candidates, emission):
+        return self.emissionLogProb[candidates, emission]
+
+    def RowMaxNullClosure(self, candidates):
+        closureLogProb, lastState = self.MaxNullClosure()
+        return closureLogProb[candidates], lastState[candidates]
+
+    def RowNullClosure(self, candidates):
+        return self.NullClosure()[candidates]
+
+    # The max closure of every candidate, as two arrays of shape (candidates, N, N).
+    def MaxNullClosure(self):
+        if self.maxNullClosure is None:
+            self.maxNullClosure = MaxPlusClosure(self.transLogProb +
+                                                 self.emissionLogProb[:, self.nullEmissionId, None, :])
+        return self.maxNullClosure
+
+    # The null closure of every candidate, of shape (candidates, N, N).
+    def NullClosure(self):
+        if self.nullClosureLogProb is None:
+            nullStep = np.exp(self.transLogProb + self.emissionLogProb[:, self.nullEmissionId, None, :])
+            nullStep[~(self.liveStates[:, :, None] & self.liveStates[:, None, :])] = 0
+            closure = np.maximum(np.linalg.inv(np.eye(self.N) - nullStep), 0)
+            with np.errstate(divide='ignore'):
+                self.nullClosureLogProb = np.log(closure)
+        return self.nullClosureLogProb
+
+
+# Returns (closureLogProb, lastState), where closureLogProb[i, j] is the best log probability of moving from state i to
+# state j by one or more steps, and lastState[i, j] the state that such a move enters j from (-1 if there is none),
+# given the log probabilities of single steps stepLogProb[i, j]. It is computed by Floyd-Warshall over (max, +), so
+# the steps must not make cycles of positive log probability. Works on a matrix, or on a stack of them (with the
+# candidates as the first axis).
+def MaxPlusClosure(stepLogProb):
+    N = stepLogProb.shape[-1]
+    closureLogProb = stepLogProb.copy()
+    lastState = np.where(closureLogProb > -np.inf, np.arange(N)[:, None], -1)
+    for k in range(N):
+        throughLogProb = closureLogProb[..., :, k, None] + closureLogProb[..., None, k, :]
+        improved = throughLogProb > closureLogProb
+        closureLogProb = np.where(improved, throughLogProb, closureLogProb)
+        lastState = np.where(improved, lastState[..., k, None, :], lastState)
+    return closureLogProb, lastState
+
+
+# log(sum(exp(a))) along the axis, without overflow (and -inf where all of a is -inf).
+def LogSumExp(a, axis):
+    maximum = a.max(axis, keepdims=True)
+    maximum[~np.isfinite(maximum)] = 0
+    with np.errstate(divide='ignore'):
+        return np.log(np.exp(a - maximum).sum(axis)) + np.squeeze(maximum, axis)